@@ -0,0 +1,203 @@
+# Python script with one command line entry point for the processing and data management scripts
+
+# Subcommands:
+#
+#   grid            LAS/LAZ file -> DEM and DTM GeoTIFFs (lidar_archaeology.py)
+#   derive          DTM -> hillshade, slope, SVF, openness, LRM... (lidar_terrain_derivatives.py)
+#   composite       Sentinel-2 scenes -> median composite and NDVI (sentinel2_compositing.py)
+#   arches-sync     Download the resources of an Arches graph, or load candidate sites into it
+#                   (arches_data_management.py)
+#   openatlas-sync  Sync the local OpenAtlas mirror and query it (openatlas_mirror.py)
+#
+# Only the standard library is imported at startup. Each subcommand imports its own module when
+# it runs, so light subcommands (help, queries of the local mirror) never pay for numpy,
+# rasterio, laspy or matplotlib, and `--help` of every subcommand answers instantly.
+# Run `python benchmarks.py startup` to check the startup times.
+#
+# Usage:
+#   python archaeology_cli.py grid survey.las --dtm dtm.tif --fill-dtm idw
+#   python archaeology_cli.py derive dtm.tif --products lrm svf
+#   python archaeology_cli.py openatlas-sync --offline --bbox -55.2 -10.1 -55.0 -9.9
+
+import argparse
+import json
+import os
+import sys
+
+def _print_json_lines(rows):
+    for row in rows:
+        print(json.dumps(row, default=str))
+
+# --- Subcommands ---
+
+def run_grid(args):
+    from lidar_archaeology import process_lidar_for_archaeology
+
+    process_lidar_for_archaeology(args.lidar_file, output_dem_path=args.dem, output_dtm_path=args.dtm,
+                                  resolution=args.resolution, reducer=args.reducer, percentile=args.percentile,
+                                  chunk_size=args.chunk_size,
+                                  fill_dtm=args.fill_dtm, classify_ground=args.classify_ground,
+                                  compress=args.compress, float32=args.float32,
+                                  visualization_path=args.visualization, report_path=args.report)
+    return 0
+
+def run_derive(args):
+    from lidar_terrain_derivatives import DERIVATIVE_PRODUCTS, compute_terrain_derivatives
+
+    compute_terrain_derivatives(args.dtm, output_dir=args.output_dir, products=args.products or DERIVATIVE_PRODUCTS,
+                                block_size=args.block_size, lrm_radius=args.lrm_radius, max_workers=args.workers)
+    return 0
+
+def run_composite(args):
+    from sentinel2_compositing import DEFAULT_ROI, composite_sentinel2
+
+    composite_sentinel2(args.scene_dir, args.output, ndvi_path=args.ndvi, roi=args.roi or DEFAULT_ROI,
+                        start_date=args.start_date, end_date=args.end_date, max_cloud=args.max_cloud,
+                        crs=args.crs, resolution=args.resolution, max_workers=args.workers)
+    return 0
+
+def run_arches_sync(args):
+    import arches_data_management as arches
+
+    if args.ingest and not args.graph_id:
+        sys.exit("arches-sync: --ingest needs --graph-id")
+    options = {"base_url": args.url or arches.ARCHES_BASE_URL, "username": args.username or arches.USERNAME,
+               "password": args.password or arches.PASSWORD, "max_concurrency": args.concurrency}
+    with arches.ArchesClient(**options) as client:
+        if args.ingest:
+            node_map = dict(pair.split("=", 1) for pair in args.node)
+            report = arches.ingest_sites(client, args.ingest, args.graph_id, node_map, key_field=args.key_field,
+                                         mode=args.mode, ledger_path=args.ledger)
+            for failure in report["failed"]:
+                print(f"Site {failure['key'] or failure['index']} not loaded: {failure['error']}", file=sys.stderr)
+            return 1 if report["failed"] else 0
+        count = 0
+        output = open(args.output, "w") if args.output else sys.stdout
+        try:
+            for resource in client.iter_resources(args.graph_id, page_size=args.page_size):
+                output.write(json.dumps(resource) + "\n")
+                count += 1
+        finally:
+            if args.output:
+                output.close()
+        print(f"Downloaded {count} resources" + (f" to: {args.output}" if args.output else ""), file=sys.stderr)
+    return 0
+
+def run_openatlas_sync(args):
+    from openatlas_mirror import OpenAtlasMirror
+
+    with OpenAtlasMirror(args.db, base_url=args.url, api_key=args.api_key) as mirror:
+        if not args.offline:
+            mirror.sync(watermark=args.watermark, entity_type=args.type)
+        if args.bbox:
+            _print_json_lines(mirror.bbox(*args.bbox, system_class=args.system_class))
+        if args.nearest:
+            _print_json_lines(mirror.nearest(*args.nearest, k=args.k, system_class=args.system_class))
+        if args.offline and not (args.bbox or args.nearest):
+            print(f"{mirror.count()} entities in {args.db}")
+    return 0
+
+# --- Argument parsing ---
+
+def build_parser():
+    """
+    Returns the argument parser; defaults that live in the subcommand modules are filled in when they run.
+    """
+    parser = argparse.ArgumentParser(prog="archaeology_cli.py",
+                                     description="LiDAR, Sentinel-2 and site record tools for archaeological prospection.")
+    subcommands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    grid = subcommands.add_parser("grid", help="grid a LAS/LAZ file into DEM and DTM GeoTIFFs")
+    grid.add_argument("lidar_file", help="input .las/.laz file")
+    grid.add_argument("--dem", default="output_dem.tif", help="output DEM (default: %(default)s)")
+    grid.add_argument("--dtm", default="output_dtm.tif", help="output DTM (default: %(default)s)")
+    grid.add_argument("--resolution", type=float, default=1.0, help="cell size (default: %(default)s)")
+    # lidar_archaeology.GRID_REDUCERS, spelled out so the parser does not import numpy
+    grid.add_argument("--reducer", default="mean", choices=("mean", "min", "max", "count", "percentile"),
+                      help="per-cell statistic of Z (default: %(default)s)")
+    grid.add_argument("--percentile", type=float, default=50.0,
+                      help="percentile of Z (0-100) for --reducer percentile (default: %(default)s)")
+    grid.add_argument("--chunk-size", type=int, help="stream the file in chunks of this many points")
+    # lidar_interpolation.FILL_METHODS
+    grid.add_argument("--fill-dtm", choices=("idw", "tin"), help="interpolate empty DTM cells")
+    grid.add_argument("--classify-ground", action="store_true", help="classify ground points instead of using class 2")
+    grid.add_argument("--compress", default="deflate", help="GeoTIFF compression (default: %(default)s)")
+    grid.add_argument("--float32", action="store_true", help="write float32 rasters")
+    grid.add_argument("--visualization", help="PNG path of a DEM/DTM preview figure")
+    grid.add_argument("--report", help="run report path (.json or .csv)")
+    grid.set_defaults(func=run_grid)
+
+    derive = subcommands.add_parser("derive", help="compute terrain visualizations of a DTM")
+    derive.add_argument("dtm", help="input DTM GeoTIFF")
+    derive.add_argument("--output-dir", default="terrain_derivatives", help="output directory (default: %(default)s)")
+    derive.add_argument("--products", nargs="+",
+                        help="hillshade, slope, curvature, svf, openness and/or lrm (default: all)")
+    derive.add_argument("--block-size", type=int, default=1024, help="block side in cells (default: %(default)s)")
+    derive.add_argument("--lrm-radius", type=int, default=10, help="LRM window half-width (default: %(default)s)")
+    derive.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    derive.set_defaults(func=run_derive)
+
+    composite = subcommands.add_parser("composite", help="median-composite downloaded Sentinel-2 scenes")
+    composite.add_argument("scene_dir", help="directory with one subdirectory per scene")
+    composite.add_argument("output", help="output composite GeoTIFF")
+    composite.add_argument("--ndvi", help="also write the NDVI to this GeoTIFF")
+    composite.add_argument("--roi", nargs=4, type=float, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                           help="region of interest in degrees")
+    composite.add_argument("--start-date", default="2020-01-01", help="first date included (default: %(default)s)")
+    composite.add_argument("--end-date", default="2023-12-31", help="first date excluded (default: %(default)s)")
+    composite.add_argument("--max-cloud", type=float, default=10, help="cloudy pixel %% limit (default: %(default)s)")
+    composite.add_argument("--crs", help="output CRS (default: that of the first scene)")
+    composite.add_argument("--resolution", type=float, default=10.0, help="pixel size (default: %(default)s)")
+    composite.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    composite.set_defaults(func=run_composite)
+
+    arches = subcommands.add_parser("arches-sync", help="download Arches resources or load candidate sites")
+    arches.add_argument("--url", default=os.environ.get("ARCHES_URL"), help="Arches URL (env ARCHES_URL)")
+    arches.add_argument("--username", default=os.environ.get("ARCHES_USERNAME"), help="env ARCHES_USERNAME")
+    arches.add_argument("--password", default=os.environ.get("ARCHES_PASSWORD"), help="env ARCHES_PASSWORD")
+    arches.add_argument("--graph-id", help="graph to download from or load into")
+    arches.add_argument("--output", help="JSON lines file for the downloaded resources (default: stdout)")
+    arches.add_argument("--page-size", type=int, default=500, help="resources per request (default: %(default)s)")
+    arches.add_argument("--concurrency", type=int, default=8, help="requests in flight (default: %(default)s)")
+    arches.add_argument("--ingest", metavar="SITES", help="GeoJSON or CSV of sites to load instead of downloading")
+    arches.add_argument("--node", action="append", default=[], metavar="FIELD=NODE_ID",
+                        help="map a site field onto a node of the graph (repeatable)")
+    arches.add_argument("--key-field", help="site field used as dedupe key (default: a hash of the site)")
+    # arches_data_management.INGEST_MODES
+    arches.add_argument("--mode", default="concurrent", choices=("concurrent", "bulk"),
+                        help="one request per site or bulk business data imports (default: %(default)s)")
+    arches.add_argument("--ledger", default="arches_ingest_ledger.jsonl", help="ledger of loaded sites (default: %(default)s)")
+    arches.set_defaults(func=run_arches_sync)
+
+    openatlas = subcommands.add_parser("openatlas-sync", help="sync and query the local OpenAtlas mirror")
+    openatlas.add_argument("--db", default="openatlas_mirror.sqlite", help="mirror database (default: %(default)s)")
+    openatlas.add_argument("--url", default=os.environ.get("OPENATLAS_URL"), help="API root (env OPENATLAS_URL)")
+    openatlas.add_argument("--api-key", default=os.environ.get("OPENATLAS_API_KEY"), help="env OPENATLAS_API_KEY")
+    openatlas.add_argument("--offline", action="store_true", help="query the mirror without syncing it first")
+    # openatlas_mirror.WATERMARKS
+    openatlas.add_argument("--watermark", default="modified", choices=("modified", "id"),
+                           help="fetch changes by modification time or new IDs only (default: %(default)s)")
+    openatlas.add_argument("--type", help="only sync entities of this type")
+    openatlas.add_argument("--bbox", nargs=4, type=float, metavar=("MIN_X", "MIN_Y", "MAX_X", "MAX_Y"),
+                           help="print the entities in this box as JSON lines")
+    openatlas.add_argument("--nearest", nargs=2, type=float, metavar=("X", "Y"),
+                           help="print the entities nearest to this point as JSON lines")
+    openatlas.add_argument("-k", type=int, default=5, help="entities printed by --nearest (default: %(default)s)")
+    openatlas.add_argument("--system-class", help="only return entities of this class, e.g. place")
+    openatlas.set_defaults(func=run_openatlas_sync)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as error:
+        # Bad option values and empty inputs (e.g. no scene passing the composite filters), missing or
+        # unreadable files, and HTTP errors (requests.RequestException is an OSError, so requests
+        # need not be imported here)
+        print(f"{parser.prog} {args.command}: error: {error}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,11 +5,22 @@
 # typically happens via its REST API. You would need to have an Arches instance running
 # and have appropriate API credentials.
 
-import requests
+import codecs
+import csv
+import hashlib
 import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-print("Arches Data Management Script")
-print("------------------------------")
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 # --- Configuration --- 
 
@@ -31,6 +42,8 @@ GRAPH_ENDPOINT = f"{ARCHES_BASE_URL}graph/"
 
 # --- Functions for Arches Interaction --- 
 
+# Each call below opens its own connection; for repeated or concurrent calls use `ArchesClient`.
+
 def get_auth_token(username, password):
     """
     Obtains an authentication token from Arches.
@@ -94,9 +107,570 @@ def create_resource(token, graph_id, data):
         print(f"Error creating resource: {e}")
         return None
 
+# --- Incremental JSON parsing ---
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Characters that can continue a JSON number.
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+class _JsonStream:
+    """
+    Reads JSON values one at a time from an iterable of byte chunks, keeping only unconsumed text.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _read(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+
+    def peek(self):
+        """
+        Returns the next non-whitespace character without consuming it.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if self.eof:
+                raise ValueError("Unexpected end of JSON document")
+            self._read()
+
+    def next_char(self):
+        char = self.peek()
+        self.position += 1
+        return char
+
+    def value(self):
+        """
+        Decodes the next complete JSON value, reading more chunks until it is complete.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buffer, self.position)
+                # A number cut by the end of the buffer (e.g. "-0.5e") may continue in the next chunk
+                if self.eof or not _NUMBER_TAIL.fullmatch(self.buffer, end):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+
+def iter_json_array(chunks, key="results"):
+    """
+    Yields the elements of the top-level `key` array of a JSON object streamed as byte chunks, one
+    at a time, so only one element is held in memory. The other top-level members are the return
+    value of the generator (use `members = yield from iter_json_array(...)`).
+    """
+    stream = _JsonStream(chunks)
+    members = {}
+    if stream.next_char() != "{":
+        raise ValueError("Expected a JSON object")
+    if stream.peek() == "}":
+        return members
+    while True:
+        name = stream.value()
+        if stream.next_char() != ":":
+            raise ValueError("Expected ':' in JSON object")
+        if name == key and stream.peek() == "[":
+            stream.next_char()
+            if stream.peek() == "]":
+                stream.next_char()
+            else:
+                while True:
+                    yield stream.value()
+                    char = stream.next_char()
+                    if char == "]":
+                        break
+                    if char != ",":
+                        raise ValueError("Expected ',' or ']' in JSON array")
+        else:
+            members[name] = stream.value()
+        char = stream.next_char()
+        if char == "}":
+            return members
+        if char != ",":
+            raise ValueError("Expected ',' or '}' in JSON object")
+
+# --- Pooled, concurrent client ---
+
+# The functions above open a new connection (and TLS handshake) for every call and need the
+# token to be passed around by hand. `ArchesClient` keeps one pooled `requests.Session`, caches
+# the token and fetches a new one when it expires or is rejected, retries rate-limited (429)
+# and server error (5xx) responses with exponential backoff, and caps the number of requests
+# in flight, so it can be shared by many threads.
+#
+# A 5xx answer or a dropped connection does not tell whether the server applied the request,
+# so only idempotent methods are retried then. A POST (e.g. creating a resource) is retried
+# only on 429 or when the connection could not be opened at all.
+
+# HTTP status codes that are retried with backoff.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Methods that can safely be repeated after a server error.
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+def _never_sent(error):
+    """
+    Whether a `requests` connection error happened before the request reached the server.
+    """
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectTimeout) or isinstance(reason, NewConnectionError)
+
+class ArchesClient:
+    """
+    Thread-safe Arches REST client with connection pooling, token caching, retries and a concurrency cap.
+
+    Usage:
+        with ArchesClient(ARCHES_BASE_URL, USERNAME, PASSWORD) as client:
+            resources = client.get_resources(resource_ids)
+    """
+
+    def __init__(self, base_url=ARCHES_BASE_URL, username=USERNAME, password=PASSWORD, max_concurrency=8,
+                 max_retries=5, backoff_base=0.5, backoff_max=30.0, timeout=30.0, token_ttl=3600.0):
+        """
+        Args:
+            base_url (str): URL of the Arches instance, ending in "/".
+            username (str): Arches user name.
+            password (str): Arches password.
+            max_concurrency (int): Maximum requests in flight at once (also the connection pool size).
+            max_retries (int): Retries of a request answered with 429/5xx or failing to connect
+                (see IDEMPOTENT_METHODS).
+            backoff_base (float): Delay before the first retry, in seconds; doubles with every retry.
+            backoff_max (float): Cap on the retry delay, in seconds.
+            timeout (float): Timeout of every request, in seconds.
+            token_ttl (float): Lifetime assumed for tokens when the server does not send `expires_in`.
+        """
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.username = username
+        self.password = password
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.token_ttl = token_ttl
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    # --- Authentication ---
+
+    def token(self, refresh=False):
+        """
+        Returns the cached token, fetching a new one first if there is none, it expired or `refresh` is set.
+        """
+        with self._token_lock:
+            if refresh or self._token is None or time.monotonic() >= self._token_expires:
+                response = self._send("POST", f"{self.base_url}auth/token/",
+                                      data={"username": self.username, "password": self.password})
+                body = response.json()
+                self._token = body.get("token") or body.get("access_token")
+                # Refresh a little before the server-side expiry
+                self._token_expires = time.monotonic() + 0.9 * float(body.get("expires_in", self.token_ttl))
+            return self._token
+
+    # --- Requests ---
+
+    def _send(self, method, url, **kwargs):
+        """
+        Sends one request with retries on 429/5xx and connection errors; raises `requests.HTTPError` otherwise.
+
+        Requests with a method outside IDEMPOTENT_METHODS are only retried on 429 and on errors
+        opening the connection.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_codes = RETRY_STATUS_CODES if idempotent else (429,)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries or not (idempotent or _never_sent(e)):
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code not in retry_codes or attempt == self.max_retries:
+                break
+            response.close() # Returns the connection of a streamed response to the pool
+            retry_after = response.headers.get("Retry-After", "")
+            time.sleep(float(retry_after) if retry_after.isdigit() else self._backoff(attempt))
+        response.raise_for_status()
+        return response
+
+    def _backoff(self, attempt):
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends an authenticated request to `path` (relative to the base URL) and returns the response.
+
+        A 401 response fetches a new token and repeats the request once.
+        """
+        url = path if path.startswith(("http://", "https://")) else f"{self.base_url}{path}"
+        extra_headers = kwargs.pop("headers", {})
+        for refresh in (False, True):
+            headers = {"Authorization": f"Token {self.token(refresh=refresh)}", **extra_headers}
+            try:
+                return self._send(method, url, headers=headers, **kwargs)
+            except requests.HTTPError as e:
+                if refresh or e.response.status_code != 401:
+                    raise
+                e.response.close()
+
+    def map_concurrent(self, func, items):
+        """
+        Calls `func` on every item from at most `max_concurrency` threads; returns the results in order.
+        """
+        with ThreadPoolExecutor(self.max_concurrency) as pool:
+            return list(pool.map(func, items))
+
+    # --- Resources ---
+
+    def list_resources(self, graph_id=None, limit=10):
+        """
+        Lists resources, optionally of one graph (same query as `get_resource_data`).
+        """
+        params = {"limit": limit}
+        if graph_id:
+            params["graphid"] = graph_id
+        return self.request("GET", "resources/", params=params).json()
+
+    def _iter_pages(self, graph_id, page_size):
+        """
+        Yields the resources of every page in turn, parsing each response as it streams in.
+
+        Follows the `next` link of paginated responses; servers without one are paged with `page`
+        until a page comes back empty (a short page is not the end, as servers may cap `limit`).
+        """
+        url, params = "resources/", {"limit": page_size, "page": 1}
+        if graph_id:
+            params["graphid"] = graph_id
+        while True:
+            count = 0
+            with self.request("GET", url, params=params, stream=True) as response:
+                resources = iter_json_array(response.iter_content(64 * 1024))
+                while True:
+                    try:
+                        resource = next(resources)
+                    except StopIteration as end:
+                        members = end.value
+                        break
+                    count += 1
+                    yield resource
+            if "next" in members:
+                if not members["next"]:
+                    return
+                url, params = members["next"], None
+            elif count == 0:
+                return
+            else:
+                params["page"] += 1
+
+    def iter_resources(self, graph_id=None, page_size=500, prefetch_pages=1):
+        """
+        Iterates over every resource (of one graph, if `graph_id` is set), following pagination.
+
+        A background thread fetches and parses pages ahead of the consumer, holding at most
+        `prefetch_pages` pages of parsed resources, so the next page downloads while the current one
+        is consumed and memory stays flat however many resources there are. Set `prefetch_pages`
+        to 0 to fetch pages only when they are needed.
+        """
+        pages = self._iter_pages(graph_id, page_size)
+        if not prefetch_pages:
+            yield from pages
+            return
+
+        done = object()
+        buffer = queue.Queue(maxsize=prefetch_pages * page_size)
+        stop = threading.Event()
+
+        def put(item):
+            # Blocks while the buffer is full; gives up once the consumer has stopped
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for resource in pages:
+                    if not put(resource):
+                        return
+                put(done)
+            except BaseException as e: # Re-raised in the consumer
+                put(e)
+            finally:
+                pages.close()
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+    def get_resource(self, resource_id):
+        """
+        Returns one resource.
+        """
+        return self.request("GET", f"resources/{resource_id}/").json()
+
+    def get_resources(self, resource_ids):
+        """
+        Returns the given resources, fetched concurrently, in the order of `resource_ids`.
+        """
+        return self.map_concurrent(self.get_resource, resource_ids)
+
+    def create_resource(self, graph_id, data):
+        """
+        Creates a new resource in `graph_id` (same payload as `create_resource`) and returns it.
+        """
+        return self.request("POST", "resources/", json={"graph_id": graph_id, "data": data}).json()
+
+# --- Bulk ingest of candidate sites ---
+
+# Loading thousands of survey candidates with one `create_resource` call each takes hours.
+# `ingest_sites` reads sites from dicts, GeoJSON or CSV, maps their fields onto the node IDs of
+# a graph and loads them either as concurrent posts or in batches in Arches business data
+# format. Failures are reported per site without aborting the run. Every site gets a dedupe
+# key and a resource ID derived from it; keys already loaded are recorded in a ledger file and
+# skipped, so re-running an ingest never duplicates sites.
+
+# Namespace of the resource IDs derived from dedupe keys.
+SITE_ID_NAMESPACE = uuid.UUID("6f1c2f4e-8d55-4c1a-9a4e-5b0f6d6f2a11")
+
+# Ingest modes of `ingest_sites`.
+INGEST_MODES = ("concurrent", "bulk")
+
+def read_sites(source):
+    """
+    Yields sites as dicts of properties plus a GeoJSON "geometry", from an iterable of dicts, a
+    GeoJSON file (.geojson/.json) or a CSV file whose geometry is in lon/lat (or longitude/latitude,
+    x/y) columns or a GeoJSON `geometry` column.
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        yield from source
+        return
+    if str(source).lower().endswith(".csv"):
+        with open(source, newline="") as f:
+            for row in csv.DictReader(f):
+                site = dict(row)
+                if site.get("geometry"):
+                    site["geometry"] = json.loads(site["geometry"])
+                else:
+                    for x_field, y_field in (("lon", "lat"), ("longitude", "latitude"), ("x", "y")):
+                        if site.get(x_field) and site.get(y_field):
+                            site["geometry"] = {"type": "Point",
+                                                "coordinates": [float(site.pop(x_field)), float(site.pop(y_field))]}
+                            break
+                yield site
+        return
+    with open(source) as f:
+        collection = json.load(f)
+    for feature in collection.get("features", [collection]):
+        yield {**(feature.get("properties") or {}), "geometry": feature.get("geometry")}
+
+def site_dedupe_key(site, key_field=None):
+    """
+    Returns the dedupe key of a site: its `key_field` value, or else a hash of its contents.
+    """
+    if key_field:
+        return str(site[key_field])
+    return hashlib.sha1(json.dumps(site, sort_keys=True, default=str).encode()).hexdigest()
+
+def site_node_data(site, node_map):
+    """
+    Maps site fields onto node IDs ({field: node_id}); the geometry becomes a GeoJSON feature collection.
+    """
+    data = {}
+    for field, node_id in node_map.items():
+        value = site.get(field)
+        if field == "geometry" and value is not None:
+            value = {"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": value, "properties": {}}]}
+        data[node_id] = value
+    return data
+
+def business_data_resource(graph_id, resource_id, key, data, nodegroups=None):
+    """
+    Returns one resource in Arches business data JSON format, with one tile per nodegroup.
+
+    `nodegroups` maps node IDs to their nodegroup ID; nodes not in it are their own nodegroup.
+    """
+    tiles = {}
+    for node_id, value in data.items():
+        nodegroup_id = (nodegroups or {}).get(node_id, node_id)
+        tiles.setdefault(nodegroup_id, {})[node_id] = value
+    return {
+        "resourceinstance": {"graph_id": graph_id, "resourceinstanceid": resource_id, "legacyid": key},
+        "tiles": [{"tileid": str(uuid.uuid5(uuid.UUID(resource_id), nodegroup_id)), "resourceinstance_id": resource_id,
+                   "nodegroup_id": nodegroup_id, "parenttile_id": None, "data": tile_data}
+                  for nodegroup_id, tile_data in tiles.items()],
+    }
+
+def _load_ledger(ledger_path):
+    """
+    Returns the keys recorded in a ledger file, and the size in bytes of its complete lines.
+
+    A run interrupted while writing can leave a truncated last line; it is ignored (and cut off
+    before new entries are appended), so that site is simply posted again.
+    """
+    ledger, size = {}, 0
+    if ledger_path and os.path.exists(ledger_path):
+        with open(ledger_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                size += len(line)
+                if line.strip():
+                    entry = json.loads(line)
+                    ledger[entry["key"]] = entry["resourceinstanceid"]
+    return ledger, size
+
+def ingest_sites(client, sites, graph_id, node_map, key_field=None, mode="concurrent", batch_size=200,
+                 ledger_path=None, nodegroups=None, bulk_path="bulk/business-data/"):
+    """
+    Loads candidate sites into an Arches graph, skipping sites already loaded.
+
+    Args:
+        client (ArchesClient): Client used for all requests.
+        sites: Iterable of site dicts, or a GeoJSON or CSV path (see `read_sites`).
+        graph_id (str): Graph the sites are created in.
+        node_map (dict): Site field -> node ID of the graph ("geometry" for the site geometry).
+        key_field (str): Site field used as dedupe key; defaults to a hash of the whole site.
+        mode (str): "concurrent" (one post per site, `client.max_concurrency` at a time) or "bulk"
+            (batches of `batch_size` sites posted to `bulk_path` in business data format).
+        batch_size (int): Sites per bulk request.
+        ledger_path (str): JSON lines file recording loaded keys; sites whose key is in it are skipped.
+        nodegroups (dict): Node ID -> nodegroup ID, for the business data tiles.
+        bulk_path (str): Business data import endpoint, relative to the client base URL.
+
+    Returns:
+        dict: "created" and "skipped" counts, "failed" (one {"index", "key", "error"} per failed site)
+        and "resource_ids" (dedupe key -> resource ID of every created site).
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode '{mode}', expected one of {INGEST_MODES}")
+    ledger, ledger_size = _load_ledger(ledger_path)
+    report = {"created": 0, "skipped": 0, "failed": [], "resource_ids": {}}
+    ledger_file = open(ledger_path, "a") if ledger_path else None
+    if ledger_file:
+        ledger_file.truncate(ledger_size)
+    lock = threading.Lock()
+
+    def record(item, result):
+        # Called once per site, from any thread
+        with lock:
+            if isinstance(result, Exception):
+                report["failed"].append({"index": item["index"], "key": item["key"], "error": str(result)})
+                return
+            report["created"] += 1
+            report["resource_ids"][item["key"]] = item["resource_id"]
+            ledger[item["key"]] = item["resource_id"]
+            if ledger_file:
+                ledger_file.write(json.dumps({"key": item["key"], "resourceinstanceid": item["resource_id"]}) + "\n")
+                ledger_file.flush()
+
+    def post_one(item):
+        try:
+            client.request("POST", "resources/", json={"graph_id": graph_id, "resourceinstanceid": item["resource_id"],
+                                                       "data": item["data"]})
+            record(item, None)
+        except Exception as e:
+            record(item, e)
+
+    def post_batch(batch):
+        payload = {"business_data": {"resources": [
+            business_data_resource(graph_id, item["resource_id"], item["key"], item["data"], nodegroups)
+            for item in batch]}}
+        try:
+            results = client.request("POST", bulk_path, json=payload).json().get("results", [])
+        except Exception:
+            # The whole batch was rejected; post its sites one by one to isolate the failing ones
+            client.map_concurrent(post_one, batch)
+            return
+        by_id = {result.get("resourceinstanceid"): result for result in results}
+        for item in batch:
+            result = by_id.get(item["resource_id"], {})
+            if result.get("status") in ("created", "exists"):
+                record(item, None)
+            else:
+                record(item, RuntimeError(result.get("error", "Missing from the bulk import response")))
+
+    pending, seen = [], set()
+    for index, site in enumerate(read_sites(sites)):
+        try:
+            key = site_dedupe_key(site, key_field)
+            data = site_node_data(site, node_map)
+        except Exception as e:
+            report["failed"].append({"index": index, "key": None, "error": f"Could not map site: {e}"})
+            continue
+        if key in ledger or key in seen:
+            report["skipped"] += 1
+            continue
+        seen.add(key)
+        pending.append({"index": index, "key": key, "data": data,
+                        "resource_id": str(uuid.uuid5(SITE_ID_NAMESPACE, f"{graph_id}:{key}"))})
+
+    print(f"Ingesting {len(pending)} sites into graph {graph_id} ({mode}), {report['skipped']} already loaded")
+    try:
+        if mode == "bulk":
+            batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+            client.map_concurrent(post_batch, batches)
+        else:
+            client.map_concurrent(post_one, pending)
+    finally:
+        if ledger_file:
+            ledger_file.close()
+    print(f"Created {report['created']} sites, {len(report['failed'])} failed")
+    return report
+
 # --- Example Usage --- 
 
 if __name__ == "__main__":
+    print("Arches Data Management Script")
+    print("------------------------------")
+
     # 1. Get authentication token
     auth_token = get_auth_token(USERNAME, PASSWORD)
 
@@ -111,7 +685,7 @@ if __name__ == "__main__":
         if resources:
             print("Successfully fetched resources:")
             for res in resources.get("results", []):
-                print(f"  Resource ID: {res.get("resourceinstanceid")}, Display Name: {res.get("displayname")}")
+                print(f"  Resource ID: {res.get('resourceinstanceid')}, Display Name: {res.get('displayname')}")
         else:
             print("Could not fetch resources.")
 
@@ -132,14 +706,20 @@ if __name__ == "__main__":
         # }
         # new_resource = create_resource(auth_token, hypothetical_site_graph_id, hypothetical_site_data)
         # if new_resource:
-        #     print(f"New resource created with ID: {new_resource.get("resourceinstanceid")}")
+        #     print(f"New resource created with ID: {new_resource.get('resourceinstanceid')}")
         # else:
         #     print("Failed to create new resource.")
 
+        # 4. Example: Bulk load LiDAR candidate sites, skipping those loaded by earlier runs
+        # with ArchesClient(ARCHES_BASE_URL, USERNAME, PASSWORD) as client:
+        #     report = ingest_sites(client, "lidar_candidates.geojson", hypothetical_site_graph_id,
+        #                           {"name": "<NODE_ID_FOR_SITE_NAME>", "geometry": "<NODE_ID_FOR_GEOMETRY>"},
+        #                           key_field="candidate_id", mode="bulk", ledger_path="arches_ingest_ledger.jsonl")
+        #     for failure in report["failed"]:
+        #         print(f"Site {failure['key']} not loaded: {failure['error']}")
+
     else:
         print("Authentication failed. Cannot proceed with Arches operations.")
 
-print("\nThis script is a starting point. You will need to consult your specific Arches instance\'s API documentation for exact endpoints, graph IDs, and data structures.")
-print("Remember to replace placeholder values for URL, username, and password.")
-
-
+    print("\nThis script is a starting point. You will need to consult your specific Arches instance\'s API documentation for exact endpoints, graph IDs, and data structures.")
+    print("Remember to replace placeholder values for URL, username, and password.")
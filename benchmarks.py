@@ -0,0 +1,1183 @@
+# Benchmarks for the archaeology processing scripts
+
+# Each benchmark builds synthetic data, times the current implementation against the
+# approach it replaced and prints the throughput. Run a single benchmark with, e.g.:
+# python benchmarks.py gridding
+
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import laspy
+import numpy as np
+import rasterio
+import requests
+import shapely
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.warp import transform as transform_coordinates, transform_bounds
+
+import arches_data_management
+import lidar_candidates
+import gee_export_scheduler
+import lidar_archaeology
+import lidar_batch_processing
+import lidar_ground_filter
+import lidar_interpolation
+import lidar_visualization
+import openatlas_data_management
+import openatlas_mirror
+import sentinel2_compositing
+import spectral_indices
+
+# --- Synthetic data ---
+
+def synthetic_points(n_points, extent=1000.0, noise=0.5, seed=0):
+    """
+    Returns x, y, z arrays of `n_points` random points over a square `extent` meters wide.
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(500000.0, 500000.0 + extent, n_points)
+    y = rng.uniform(9000000.0, 9000000.0 + extent, n_points)
+    z = 100.0 + 5.0 * np.sin(x / 50.0) + rng.normal(0.0, noise, n_points)
+    return x, y, z
+
+def write_synthetic_las(path, n_points, extent=1000.0, ground_fraction=0.4, seed=0, chunk_size=5_000_000):
+    """
+    Writes a synthetic LAS 1.2 file with `n_points` points, roughly `ground_fraction` of them class 2.
+
+    Points are generated and written `chunk_size` at a time, so files of 100M+ points fit in memory;
+    every chunk has its own seed, so a given `n_points` and `seed` always produce the same file.
+    """
+    header = laspy.LasHeader(point_format=3, version="1.2")
+    header.scales = [0.001, 0.001, 0.001]
+    header.offsets = [500000.0, 9000000.0, 0.0]
+    with laspy.open(path, mode="w", header=header) as writer:
+        for chunk, start in enumerate(range(0, n_points, chunk_size)):
+            count = min(chunk_size, n_points - start)
+            x, y, z = synthetic_points(count, extent=extent, seed=seed + 1000 * chunk)
+            points = laspy.ScaleAwarePointRecord.zeros(count, header=header)
+            points.x, points.y, points.z = x, y, z
+            rng = np.random.default_rng(seed + 1000 * chunk + 1)
+            points.classification = np.where(rng.random(count) < ground_fraction, 2, 1).astype(np.uint8)
+            writer.write_points(points)
+    return path
+
+def synthetic_forest_points(n_points, extent=1000.0, canopy_fraction=0.7, seed=0):
+    """
+    Returns x, y, z and the true ground mask of points over rolling terrain under a canopy 2-35 m tall.
+    """
+    x, y, z = synthetic_points(n_points, extent=extent, noise=0.1, seed=seed)
+    rng = np.random.default_rng(seed + 2)
+    is_ground = rng.random(n_points) >= canopy_fraction
+    z = z + np.where(is_ground, 0.0, rng.uniform(2.0, 35.0, n_points))
+    return x, y, z, is_ground
+
+def write_synthetic_sentinel2_scenes(scene_dir, n_scenes, size, seed=0):
+    """
+    Writes `n_scenes` synthetic Sentinel-2 L2A scenes of `size` x `size` 10 m pixels over the same
+    UTM 22S tile, each with uint16 B2/B3/B4/B8 GeoTIFFs (0 = nodata), bright cloud blobs and an
+    MTD_TL.xml with its CLOUDY_PIXEL_PERCENTAGE and SENSING_TIME.
+
+    Returns:
+        tuple: The [west, south, east, north] bounds of the tile in degrees, and the scene directories.
+    """
+    rng = np.random.default_rng(seed)
+    transform = from_origin(500000.0, 9250000.0, 10.0, 10.0)
+    row, col = np.mgrid[0:size, 0:size]
+    base = {"B2": 400.0, "B3": 700.0, "B4": 600.0, "B8": 2500.0}
+    scene_paths = []
+    for i in range(n_scenes):
+        date = f"2021{1 + i % 12:02d}{1 + i // 12:02d}"
+        scene_path = os.path.join(scene_dir, f"S2A_MSIL2A_{date}T133851_N0300_R038_T22MBU_{date}T160000.SAFE")
+        image_dir = os.path.join(scene_path, "GRANULE", "L2A_T22MBU", "IMG_DATA", "R10m")
+        os.makedirs(image_dir)
+        clouds = np.zeros((size, size), dtype=bool)
+        for _ in range(rng.integers(0, 4)):
+            center_row, center_col, radius = rng.integers(0, size, 2).tolist() + [rng.integers(size // 40, size // 6)]
+            clouds |= (row - center_row) ** 2 + (col - center_col) ** 2 < radius ** 2
+        outside = col < rng.integers(0, size // 4) # Part of the tile outside the orbit swath
+        for band, level in base.items():
+            values = level * (1.0 + 0.1 * np.sin(col / 30.0) * np.cos(row / 45.0)) + rng.normal(0, 20, (size, size))
+            values[clouds] = 6000.0 + rng.normal(0, 200, np.count_nonzero(clouds))
+            values[outside] = 0
+            with rasterio.open(os.path.join(image_dir, f"T22MBU_{date}T133851_B{int(band[1:]):02d}_10m.tif"), "w",
+                               driver="GTiff", width=size, height=size, count=1, dtype="uint16", crs="EPSG:32722",
+                               transform=transform, nodata=0, tiled=True) as dst:
+                dst.write(np.clip(values, 0, 65535).astype(np.uint16), 1)
+        with open(os.path.join(scene_path, "GRANULE", "L2A_T22MBU", "MTD_TL.xml"), "w") as f:
+            f.write(f"<n1:Level-2A_Tile_ID xmlns:n1='https://psd-14.sentinel2.eo.esa.int/PSD/S2_PDI_Level-2A_Tile_Metadata.xsd'>"
+                    f"<General_Info><SENSING_TIME>{date[:4]}-{date[4:6]}-{date[6:]}T13:38:51.024Z</SENSING_TIME></General_Info>"
+                    f"<Quality_Indicators_Info><Image_Content_QI><CLOUDY_PIXEL_PERCENTAGE>"
+                    f"{100.0 * clouds.mean():.3f}</CLOUDY_PIXEL_PERCENTAGE></Image_Content_QI></Quality_Indicators_Info>"
+                    f"</n1:Level-2A_Tile_ID>")
+        scene_paths.append(scene_path)
+    bounds = transform_bounds("EPSG:32722", "EPSG:4326", 500000.0, 9250000.0 - 10.0 * size,
+                              500000.0 + 10.0 * size, 9250000.0)
+    return bounds, scene_paths
+
+# --- Local stand-in servers ---
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive JSON request handler that passes every request to the `app` of its server.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True # Headers and body are separate writes; avoid delayed-ACK stalls
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/json") and raw:
+            body = json.loads(raw)
+        else:
+            body = {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+        url = urlparse(self.path)
+        status, payload, headers = self.server.app.handle(method, url.path, parse_qs(url.query), body, self.headers)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+class LocalServer:
+    """
+    Runs an app object (with a `handle(method, path, query, body, headers)` method returning
+    (status, payload, headers)) on a threaded HTTP server on localhost, for use in a `with` block.
+    """
+
+    def __init__(self, app):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _JsonHandler)
+        self.server.daemon_threads = True
+        self.server.app = app
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeArches:
+    """
+    In-memory stand-in for the Arches REST endpoints used by arches_data_management.py.
+
+    Every request waits `latency` seconds, like a real server doing database work, and every
+    `throttle_every`-th request is answered with 429 to exercise client retries. Every resource
+    written, alone or in a bulk import, waits another `write_latency` seconds.
+    """
+
+    def __init__(self, n_resources=1000, graph_ids=("site-graph", "find-graph"), latency=0.0, throttle_every=0,
+                 write_latency=0.0):
+        self.resources = {}
+        for i in range(n_resources):
+            resource_id = str(uuid.UUID(int=i))
+            self.resources[resource_id] = {
+                "resourceinstanceid": resource_id, "graph_id": graph_ids[i % len(graph_ids)],
+                "displayname": f"Resource {i}",
+                "data": {"name": f"Site {i}", "description": "Earthwork enclosure " * 10,
+                         "geometry": {"type": "Point", "coordinates": [-55.0 + (i % 500) * 0.01, -10.0 + (i // 500) * 0.01]}}}
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.write_latency = write_latency
+        self.tokens = set()
+        self.requests = 0
+        self.token_requests = 0
+        self._by_graph = {}
+        self._lock = threading.Lock()
+
+    def _graph_resources(self, graph_id):
+        with self._lock:
+            if graph_id not in self._by_graph:
+                self._by_graph[graph_id] = [resource for resource in self.resources.values()
+                                            if graph_id is None or resource["graph_id"] == graph_id]
+            return self._by_graph[graph_id]
+
+    def _create(self, resource_id, graph_id, data):
+        """
+        Creates a resource; an existing ID is answered with 200 and a node without a value with 400.
+        """
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        if any(value is None for value in data.values()):
+            return 400, {"detail": "Required node has no value."}
+        with self._lock:
+            if resource_id in self.resources:
+                return 200, self.resources[resource_id]
+            resource_id = resource_id or str(uuid.uuid4())
+            self.resources[resource_id] = {"resourceinstanceid": resource_id, "graph_id": graph_id,
+                                           "displayname": None, "data": data}
+            self._by_graph.clear()
+            return 201, self.resources[resource_id]
+
+    def handle(self, method, path, query, body, headers):
+        with self._lock:
+            self.requests += 1
+            throttled = self.throttle_every and self.requests % self.throttle_every == 0
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            return 429, {"detail": "Request was throttled."}, {"Retry-After": "0"}
+        if path == "/auth/token/" and method == "POST":
+            with self._lock:
+                self.token_requests += 1
+                token = uuid.uuid4().hex
+                self.tokens.add(token)
+            return 200, {"token": token, "expires_in": 3600}, {}
+        if (headers.get("Authorization") or "").removeprefix("Token ") not in self.tokens:
+            return 401, {"detail": "Invalid token."}, {}
+        if path == "/resources/" and method == "GET":
+            # Paginated like Django REST framework: count, next/previous links and one page of results
+            graph_id = query.get("graphid", [None])[0]
+            limit, page = int(query.get("limit", [10])[0]), int(query.get("page", [1])[0])
+            results = self._graph_resources(graph_id)
+            link = f"http://{headers['Host']}/resources/?limit={limit}" + (f"&graphid={graph_id}" if graph_id else "")
+            return 200, {"count": len(results),
+                         "next": f"{link}&page={page + 1}" if page * limit < len(results) else None,
+                         "previous": f"{link}&page={page - 1}" if page > 1 else None,
+                         "results": results[(page - 1) * limit:page * limit]}, {}
+        if path == "/resources/" and method == "POST":
+            status, result = self._create(body.get("resourceinstanceid"), body.get("graph_id"), body.get("data", {}))
+            return status, result, {}
+        if path == "/bulk/business-data/" and method == "POST":
+            results = []
+            for resource in body["business_data"]["resources"]:
+                instance = resource["resourceinstance"]
+                data = {node: value for tile in resource["tiles"] for node, value in tile["data"].items()}
+                status, result = self._create(instance["resourceinstanceid"], instance["graph_id"], data)
+                results.append({"resourceinstanceid": instance["resourceinstanceid"],
+                                "status": {201: "created", 200: "exists"}.get(status, "error"),
+                                **({"error": result["detail"]} if status >= 400 else {})})
+            return 200, {"results": results}, {}
+        if path.startswith("/resources/") and method == "GET":
+            resource = self.resources.get(path.split("/")[2])
+            return (200, resource, {}) if resource else (404, {"detail": "Not found."}, {})
+        return 404, {"detail": "Not found."}, {}
+
+def _legacy_loop_grid(x, y, z, min_x, max_y, resolution, rows, cols):
+    """
+    The original per-point gridding loop of `process_lidar_for_archaeology`, kept for comparison.
+    """
+    grid = np.full((rows, cols), np.nan)
+    for p in np.column_stack((x, y, z)):
+        col = int((p[0] - min_x) / resolution)
+        row = int((max_y - p[1]) / resolution)
+        if 0 <= row < rows and 0 <= col < cols:
+            if np.isnan(grid[row, col]):
+                grid[row, col] = p[2]
+            else:
+                grid[row, col] = (grid[row, col] + p[2]) / 2
+    return grid
+
+def synthetic_dtm(rows, cols, hole_fraction=0.8, seed=0):
+    """
+    Returns a gently undulating terrain grid with `hole_fraction` of its cells set to NaN.
+    """
+    rng = np.random.default_rng(seed)
+    row, col = np.mgrid[0:rows, 0:cols]
+    dtm = 100.0 + 3.0 * np.sin(col / 40.0) + 2.0 * np.cos(row / 25.0)
+    dtm[rng.random((rows, cols)) < hole_fraction] = np.nan
+    return dtm
+
+def _naive_idw_fill(dtm, power=2.0, batch=256):
+    """
+    All-pairs IDW: every empty cell is weighted against every known cell.
+    """
+    filled = dtm.copy()
+    known_rows, known_cols = np.nonzero(~np.isnan(dtm))
+    known_z = dtm[known_rows, known_cols]
+    hole_rows, hole_cols = np.nonzero(np.isnan(dtm))
+    for start in range(0, len(hole_rows), batch):
+        rows, cols = hole_rows[start:start + batch], hole_cols[start:start + batch]
+        distances = np.hypot(rows[:, None] - known_rows, cols[:, None] - known_cols)
+        weights = 1.0 / distances ** power
+        filled[rows, cols] = (weights * known_z).sum(axis=1) / weights.sum(axis=1)
+    return filled
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+# --- Benchmarks ---
+
+def benchmark_gridding(n_points=200_000, loop_points=200_000, resolution=1.0):
+    """
+    Compares points/sec of the vectorized gridding engine against the original per-point loop.
+    """
+    print(f"Gridding benchmark ({n_points} points, {resolution} m cells)")
+    x, y, z = synthetic_points(n_points)
+    min_x, max_y = x.min(), y.max()
+    rows, cols = lidar_archaeology.grid_shape(min_x, y.min(), x.max(), max_y, resolution)
+
+    n_loop = min(loop_points, n_points)
+    _, elapsed = _timed(_legacy_loop_grid, x[:n_loop], y[:n_loop], z[:n_loop], min_x, max_y, resolution, rows, cols)
+    print(f"  legacy loop          : {n_loop / elapsed:14,.0f} points/sec")
+
+    for reducer in lidar_archaeology.GRID_REDUCERS:
+        _, elapsed = _timed(lidar_archaeology.grid_points, x, y, z, min_x, max_y, resolution, rows, cols,
+                            reducer=reducer)
+        print(f"  engine {reducer:<14}: {n_points / elapsed:14,.0f} points/sec")
+
+def _peak_memory(func, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        result, elapsed = _timed(func, *args, **kwargs)
+        return result, elapsed, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark_streaming(n_points=2_000_000, chunk_size=250_000):
+    """
+    Compares time and peak traced memory of in-memory vs streamed gridding of a synthetic LAS file.
+    """
+    print(f"Streaming benchmark ({n_points} points, {chunk_size} points per chunk)")
+    with tempfile.TemporaryDirectory() as tmp:
+        las_path = write_synthetic_las(os.path.join(tmp, "synthetic.las"), n_points)
+        outputs = {}
+        for label, size in (("in-memory", None), ("streamed", chunk_size)):
+            dem_path = os.path.join(tmp, f"{label}_dem.tif")
+            dtm_path = os.path.join(tmp, f"{label}_dtm.tif")
+            _, elapsed, peak = _peak_memory(lidar_archaeology.process_lidar_for_archaeology, las_path,
+                                            dem_path, dtm_path, chunk_size=size, visualization_path=None)
+            with rasterio.open(dem_path) as dem, rasterio.open(dtm_path) as dtm:
+                outputs[label] = (dem.read(1).tobytes(), dtm.read(1).tobytes())
+            print(f"  {label:<10}: {elapsed:8.2f} s, peak {peak / 2**20:8.1f} MiB")
+        assert outputs["in-memory"] == outputs["streamed"], "streamed DEM/DTM differ from the in-memory ones"
+        print("  bit-identical output: True")
+
+def benchmark_batch(n_tiles=8, points_per_tile=1_000_000, tile_extent=500.0):
+    """
+    Times process_lidar_collection on a grid of synthetic tiles with 1, 2, 4... workers up to the CPU count.
+    """
+    print(f"Batch benchmark ({n_tiles} tiles of {points_per_tile} points)")
+    with tempfile.TemporaryDirectory() as tmp:
+        tile_dir = os.path.join(tmp, "tiles")
+        os.makedirs(tile_dir)
+        for i in range(n_tiles):
+            las_path = write_synthetic_las(os.path.join(tile_dir, f"tile_{i:03d}.las"), points_per_tile,
+                                           extent=tile_extent, seed=i)
+            # Shift each tile to its own position in a row of tiles
+            las = laspy.read(las_path)
+            las.header.offsets = las.header.offsets + [i * tile_extent, 0.0, 0.0]
+            las.x = np.asarray(las.x) + i * tile_extent
+            las.write(las_path)
+
+        workers, baseline = 1, None
+        while workers <= (os.cpu_count() or 1):
+            _, elapsed = _timed(lidar_batch_processing.process_lidar_collection, tile_dir,
+                                os.path.join(tmp, f"out_{workers}"), max_workers=workers)
+            baseline = baseline or elapsed
+            print(f"  {workers:3d} workers: {elapsed:8.2f} s, {n_tiles * points_per_tile / elapsed:14,.0f} points/sec, "
+                  f"speedup {baseline / elapsed:5.2f}x")
+            workers *= 2
+
+def benchmark_interpolation(size=2000, naive_size=200):
+    """
+    Compares cells/sec of the blocked KD-tree IDW and TIN hole filling against a naive all-pairs IDW.
+    """
+    print(f"DTM interpolation benchmark ({size} x {size} grid, 80% empty)")
+    naive_dtm = synthetic_dtm(naive_size, naive_size)
+    _, elapsed = _timed(_naive_idw_fill, naive_dtm)
+    print(f"  naive all-pairs IDW ({naive_size} x {naive_size}): {np.isnan(naive_dtm).sum() / elapsed:12,.0f} cells/sec")
+
+    dtm = synthetic_dtm(size, size)
+    for method in lidar_interpolation.FILL_METHODS:
+        _, elapsed = _timed(lidar_interpolation.fill_dtm_holes, dtm, method=method)
+        print(f"  blocked {method} ({size} x {size}): {np.isnan(dtm).sum() / elapsed:12,.0f} cells/sec")
+
+def benchmark_ground_filter(n_points=5_000_000, resolution=1.0):
+    """
+    Measures points/sec and accuracy of the progressive morphological ground filter on unclassified points.
+    """
+    print(f"Ground filter benchmark ({n_points} points, 70% canopy)")
+    x, y, z, truth = synthetic_forest_points(n_points)
+    min_x, max_y = x.min(), y.max()
+    rows, cols = lidar_archaeology.grid_shape(min_x, y.min(), x.max(), max_y, resolution)
+
+    def classify():
+        min_grid = lidar_archaeology.grid_points(x, y, z, min_x, max_y, resolution, rows, cols, reducer="min")
+        ground_cells = lidar_ground_filter.progressive_morphological_filter(min_grid, cell_size=resolution)
+        indices, inside = lidar_archaeology.cell_indices(x, y, min_x, max_y, resolution, rows, cols)
+        is_ground = np.zeros(len(x), dtype=bool)
+        is_ground[inside] = lidar_ground_filter.ground_point_mask(indices, z[inside], min_grid, ground_cells)
+        return is_ground
+
+    is_ground, elapsed = _timed(classify)
+    print(f"  throughput        : {n_points / elapsed:14,.0f} points/sec")
+    print(f"  ground recall     : {np.count_nonzero(is_ground & truth) / np.count_nonzero(truth):.3f}")
+    print(f"  ground precision  : {np.count_nonzero(is_ground & truth) / max(np.count_nonzero(is_ground), 1):.3f}")
+
+def _write_legacy_geotiff(path, grid, transform):
+    """
+    The original output of `process_lidar_for_archaeology`: untiled, uncompressed, no overviews.
+    """
+    with rasterio.open(path, 'w', driver='GTiff', height=grid.shape[0], width=grid.shape[1], count=1,
+                       dtype=grid.dtype, crs='+proj=latlong', transform=transform) as dst:
+        dst.write(grid, 1)
+
+def _read_zoomed_out(path, factor):
+    with rasterio.open(path) as src:
+        return src.read(1, out_shape=(src.height // factor, src.width // factor), resampling=Resampling.average)
+
+def benchmark_geotiff(size=8000, zoom_factor=16):
+    """
+    Compares file size and zoomed-out read time of the legacy GeoTIFF output against the COG output.
+    """
+    print(f"GeoTIFF output benchmark ({size} x {size} DTM, reading at 1/{zoom_factor} scale)")
+    dtm = synthetic_dtm(size, size, hole_fraction=0.05)
+    transform = from_origin(500000.0, 9000000.0, 1.0, 1.0)
+    writers = {
+        "legacy float64": lambda path: _write_legacy_geotiff(path, dtm, transform),
+        "COG deflate float64": lambda path: lidar_archaeology.write_geotiff(path, dtm, transform),
+        "COG deflate float32": lambda path: lidar_archaeology.write_geotiff(path, dtm, transform, float32=True),
+        "COG zstd float32": lambda path: lidar_archaeology.write_geotiff(path, dtm, transform, compress="zstd",
+                                                                         float32=True),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, write in writers.items():
+            path = os.path.join(tmp, "dtm.tif")
+            _, write_seconds = _timed(write, path)
+            _, read_seconds = _timed(_read_zoomed_out, path, zoom_factor)
+            print(f"  {label:<20}: {os.path.getsize(path) / 2**20:8.1f} MiB, write {write_seconds:6.2f} s, "
+                  f"zoomed-out read {read_seconds:6.3f} s")
+            os.remove(path)
+
+def _legacy_full_figure(dem_path, dtm_path, png_path):
+    """
+    The original visualization step: both full-resolution grids through imshow.
+    """
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 6))
+    for position, path, title in ((1, dem_path, 'Digital Elevation Model (DEM)'),
+                                  (2, dtm_path, 'Digital Terrain Model (DTM)')):
+        with rasterio.open(path) as src:
+            grid = src.read(1)
+        plt.subplot(1, 2, position)
+        plt.imshow(grid, cmap='terrain', origin='upper')
+        plt.title(title)
+        plt.colorbar(label='Elevation (m)')
+    plt.tight_layout()
+    plt.savefig(png_path)
+    plt.close()
+
+def benchmark_visualization(size=8000):
+    """
+    Compares the legacy full-resolution figure against the overview-based preview and the XYZ pyramid.
+    """
+    print(f"Visualization benchmark ({size} x {size} DEM and DTM COGs)")
+    transform = from_origin(500000.0, 9000000.0, 1.0, 1.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        dem_path, dtm_path = os.path.join(tmp, "dem.tif"), os.path.join(tmp, "dtm.tif")
+        lidar_archaeology.write_geotiff(dem_path, synthetic_dtm(size, size, hole_fraction=0.0), transform,
+                                        crs="EPSG:31981", float32=True)
+        lidar_archaeology.write_geotiff(dtm_path, synthetic_dtm(size, size, hole_fraction=0.3, seed=1), transform,
+                                        crs="EPSG:31981", float32=True)
+        png_path = os.path.join(tmp, "preview.png")
+        _, legacy_seconds, legacy_peak = _peak_memory(_legacy_full_figure, dem_path, dtm_path, png_path)
+        _, preview_seconds, preview_peak = _peak_memory(lidar_visualization.render_dem_dtm_preview,
+                                                        dem_path, dtm_path, png_path)
+        print(f"  legacy full figure: {legacy_seconds:8.2f} s, peak {legacy_peak / 2**20:8.1f} MiB")
+        print(f"  overview preview  : {preview_seconds:8.2f} s, peak {preview_peak / 2**20:8.1f} MiB")
+        _, quicklook_seconds = _timed(lidar_visualization.write_quicklook_png, dtm_path, png_path)
+        print(f"  full quicklook PNG: {quicklook_seconds:8.2f} s")
+        tiles, tile_seconds = _timed(lidar_visualization.generate_xyz_tiles, dtm_path, os.path.join(tmp, "xyz"))
+        print(f"  XYZ pyramid       : {tile_seconds:8.2f} s, {tiles / tile_seconds:8.1f} tiles/sec")
+
+def benchmark_pipeline(sizes=(1_000_000, 10_000_000, 100_000_000), density=10.0, stream_above=10_000_000,
+                       chunk_size=2_000_000, report_dir="benchmark_reports"):
+    """
+    Runs the full pipeline on synthetic LAS files of each size and keeps the per-stage run reports.
+
+    Files are `density` points per square meter, so the grid grows with the point count. Sizes above
+    `stream_above` points are streamed in `chunk_size` chunks. The JSON reports are written to
+    `<report_dir>/pipeline_<size>.json`, to be compared across commits to track regressions.
+    """
+    print(f"Pipeline benchmark ({', '.join(f'{size:,}' for size in sizes)} points, {density} points/m2)")
+    os.makedirs(report_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            las_path = write_synthetic_las(os.path.join(tmp, "synthetic.las"), size,
+                                           extent=float(np.sqrt(size / density)))
+            report_path = os.path.join(report_dir, f"pipeline_{size}.json")
+            profiler = lidar_archaeology.process_lidar_for_archaeology(
+                las_path, os.path.join(tmp, "dem.tif"), os.path.join(tmp, "dtm.tif"),
+                chunk_size=chunk_size if size > stream_above else None,
+                visualization_path=os.path.join(tmp, "preview.png"), report_path=report_path)
+            report = profiler.report()
+            print(f"  {size:>13,} points: {report['total_seconds']:8.2f} s, "
+                  f"{size / report['total_seconds']:12,.0f} points/sec end to end, "
+                  f"peak RSS {report['peak_rss_mib']:8.1f} MiB -> {report_path}")
+            os.remove(las_path)
+
+def _naive_composite(scenes, bands):
+    """
+    Whole-stack composite: every scene read into memory at once, reduced with numpy.nanmedian.
+    """
+    composite = []
+    for band in bands:
+        stack = []
+        for scene in scenes:
+            with rasterio.open(scene["bands"][band]) as src:
+                stack.append(src.read(1, masked=True).astype(np.float32).filled(np.nan))
+        composite.append(np.nanmedian(np.stack(stack), axis=0))
+    return np.stack(composite)
+
+def benchmark_compositing(n_scenes=24, size=2048, block_size=512):
+    """
+    Compares the windowed Sentinel-2 median composite against a whole-stack numpy.nanmedian composite.
+    """
+    print(f"Sentinel-2 compositing benchmark ({n_scenes} scenes of {size} x {size} pixels, 4 bands)")
+    with tempfile.TemporaryDirectory() as tmp:
+        scene_dir = os.path.join(tmp, "scenes")
+        roi, _ = write_synthetic_sentinel2_scenes(scene_dir, n_scenes, size)
+        bands = sentinel2_compositing.SENTINEL2_BANDS
+        scenes = sentinel2_compositing.filter_scenes(sentinel2_compositing.find_sentinel2_scenes(scene_dir),
+                                                     max_cloud=10)
+        print(f"  {len(scenes)} of {n_scenes} scenes pass the cloud filter")
+        naive, naive_seconds, naive_peak = _peak_memory(_naive_composite, scenes, bands)
+
+        workers, baseline = 1, None
+        output_path = os.path.join(tmp, "composite.tif")
+        while workers <= (os.cpu_count() or 1):
+            _, elapsed = _timed(sentinel2_compositing.composite_sentinel2, scene_dir, output_path,
+                                ndvi_path=os.path.join(tmp, "ndvi.tif"), roi=roi, start_date=None, end_date=None,
+                                block_size=block_size, max_workers=workers)
+            baseline = baseline or elapsed
+            print(f"  windowed, {workers:3d} workers: {elapsed:8.2f} s, "
+                  f"{len(scenes) * size * size / elapsed / 1e6:8.1f} scene Mpixels/sec, "
+                  f"speedup {baseline / elapsed:5.2f}x")
+            workers *= 2
+        print(f"  whole-stack nanmedian: {naive_seconds:8.2f} s, peak {naive_peak / 2**20:8.1f} MiB")
+        with rasterio.open(output_path) as src:
+            tile = src.window(500000.0, 9250000.0 - 10.0 * size, 500000.0 + 10.0 * size, 9250000.0)
+            windowed = src.read(window=tile.round_offsets().round_lengths())
+        print(f"  windowed output matches nanmedian: {np.allclose(windowed, naive, equal_nan=True)}")
+
+def benchmark_export(roi=(-55.0, -10.0, -50.0, -5.0), max_pixels_per_tile=2.5e7, failure_rate=0.1):
+    """
+    Runs the tiled export scheduler against the fake Earth Engine backend: throughput at several
+    concurrency limits, then an interrupted run resumed from its progress file.
+    """
+    tiles = gee_export_scheduler.split_region(roi, scale=10, max_pixels_per_tile=max_pixels_per_tile)
+    print(f"Export scheduler benchmark ({len(tiles)} tiles, {failure_rate:.0%} of tasks fail, fake backend)")
+    options = {"max_retries": 5, "backoff_base": 0.01, "backoff_max": 0.1, "poll_interval": 0.005, "seed": 0}
+    with tempfile.TemporaryDirectory() as tmp:
+        for max_concurrent in (1, 8, 32):
+            backend = gee_export_scheduler.FakeEarthEngineBackend(failure_rate=failure_rate, start_failure_rate=0.05)
+            scheduler = gee_export_scheduler.ExportScheduler(
+                backend, None, tiles, os.path.join(tmp, f"progress_{max_concurrent}.json"),
+                max_concurrent=max_concurrent, **options)
+            counts, elapsed = _timed(scheduler.run)
+            print(f"  {max_concurrent:3d} concurrent: {elapsed:8.2f} s, {len(tiles) / elapsed:8.1f} tiles/sec, "
+                  f"{backend.start_calls} submissions, {backend.status_calls} status polls, "
+                  f"{counts['completed']} completed")
+
+        progress_path = os.path.join(tmp, "progress_resume.json")
+        backend = gee_export_scheduler.FakeEarthEngineBackend(failure_rate=failure_rate)
+        first = gee_export_scheduler.ExportScheduler(backend, None, tiles, progress_path, max_concurrent=8,
+                                                     **options).run(timeout=0.5)
+        submitted = backend.start_calls
+        resumed = gee_export_scheduler.ExportScheduler(backend, None, tiles, progress_path, max_concurrent=8,
+                                                       **options).run()
+        failed_tasks = sum(task["fails"] for task in backend.tasks.values())
+        print(f"  interrupted run: {first['completed']} completed, {first['running']} still running; "
+              f"resumed run: {resumed['completed']} completed")
+        print(f"  submissions: {backend.start_calls} = {len(tiles)} tiles + {failed_tasks} retries "
+              f"({submitted} before the interruption)")
+
+def write_synthetic_composite(path, size, bands=("B2", "B3", "B4", "B5", "B8", "B11", "B12"), seed=0):
+    """
+    Writes a synthetic float32 Sentinel-2 composite with named bands, smooth vegetation gradients and
+    small circular anomalies standing in for buried structures.
+    """
+    rng = np.random.default_rng(seed)
+    row, col = np.mgrid[0:size, 0:size]
+    vigour = 0.5 + 0.3 * np.sin(col / 200.0) * np.cos(row / 300.0)
+    for _ in range(50):
+        center_row, center_col = rng.integers(0, size, 2)
+        vigour[(row - center_row) ** 2 + (col - center_col) ** 2 < 15 ** 2] -= 0.1
+    levels = {"B2": 300.0, "B3": 600.0, "B4": 400.0, "B5": 1000.0, "B8": 3000.0, "B11": 1800.0, "B12": 900.0}
+    with rasterio.open(path, "w", driver="GTiff", width=size, height=size, count=len(bands), dtype="float32",
+                       crs="EPSG:32722", transform=from_origin(500000.0, 9250000.0, 10.0, 10.0), nodata=np.nan,
+                       tiled=True, compress="deflate", predictor=3) as dst:
+        dst.descriptions = bands
+        for number, band in enumerate(bands, start=1):
+            gain = vigour if band in ("B5", "B8") else 1.0 - 0.5 * vigour
+            dst.write((levels[band] * gain + rng.normal(0, 20, (size, size))).astype(np.float32), number)
+    return path
+
+def benchmark_spectral_indices(size=4096, block_size=1024):
+    """
+    Compares the single-pass multi-index pipeline against one pass (read, compute, write) per index.
+    """
+    indices = tuple(spectral_indices.SPECTRAL_INDICES)
+    print(f"Spectral index benchmark ({size} x {size} composite, {len(indices)} indices + NDVI z-score)")
+    with tempfile.TemporaryDirectory() as tmp:
+        composite = write_synthetic_composite(os.path.join(tmp, "composite.tif"), size)
+        _, single_seconds = _timed(spectral_indices.compute_spectral_indices, composite,
+                                   os.path.join(tmp, "indices.tif"), indices=indices, zscore_indices=("ndvi",),
+                                   block_size=block_size)
+
+        def one_pass_per_index():
+            for index in indices:
+                spectral_indices.compute_spectral_indices(composite, os.path.join(tmp, f"{index}.tif"),
+                                                          indices=(index,), zscore_indices=(),
+                                                          block_size=block_size)
+            spectral_indices.compute_spectral_indices(composite, os.path.join(tmp, "ndvi_zscore.tif"),
+                                                      indices=(), zscore_indices=("ndvi",), block_size=block_size)
+        _, multi_seconds = _timed(one_pass_per_index)
+        print(f"  one pass per index: {multi_seconds:8.2f} s")
+        print(f"  single pass       : {single_seconds:8.2f} s, speedup {multi_seconds / single_seconds:5.2f}x")
+        with rasterio.open(os.path.join(tmp, "indices.tif")) as single, \
+                rasterio.open(os.path.join(tmp, "ndvi_zscore.tif")) as zscore:
+            same = np.array_equal(single.read(len(indices) + 1), zscore.read(1), equal_nan=True)
+        print(f"  identical z-scores: {same}")
+
+def _legacy_arches_fetch(base_url, resource_ids):
+    """
+    The original functions: a token via `get_auth_token`, then one `get_resource_data` call
+    (and so one new connection) per resource.
+    """
+    arches_data_management.AUTH_ENDPOINT = f"{base_url}auth/token/"
+    arches_data_management.RESOURCES_ENDPOINT = f"{base_url}resources/"
+    with contextlib.redirect_stdout(io.StringIO()): # The functions print every call
+        token = arches_data_management.get_auth_token("user", "password")
+        return [arches_data_management.get_resource_data(token, resource_id=resource_id)
+                for resource_id in resource_ids]
+
+def benchmark_arches_client(n_requests=2000, latency=0.002, concurrency=(1, 4, 8, 16)):
+    """
+    Compares requests/sec of the original Arches functions against the pooled `ArchesClient`
+    on a local stand-in server, with `latency` seconds of server time per request.
+    """
+    print(f"Arches client benchmark ({n_requests} resource fetches, {latency * 1000:.0f} ms server latency)")
+    app = FakeArches(n_resources=n_requests, latency=latency)
+    resource_ids = list(app.resources)
+    with LocalServer(app) as server:
+        legacy, elapsed = _timed(_legacy_arches_fetch, server.url, resource_ids)
+        print(f"  original functions       : {n_requests / elapsed:8.0f} requests/sec")
+        for max_concurrency in concurrency:
+            with arches_data_management.ArchesClient(server.url, "user", "password",
+                                                     max_concurrency=max_concurrency) as client:
+                resources, elapsed = _timed(client.get_resources, resource_ids)
+            print(f"  ArchesClient, {max_concurrency:2d} in flight: {n_requests / elapsed:8.0f} requests/sec")
+        print(f"  same resources: {resources == legacy}")
+
+        app.throttle_every = 10
+        with arches_data_management.ArchesClient(server.url, "user", "password", backoff_base=0.01) as client:
+            resources, elapsed = _timed(client.get_resources, resource_ids)
+        print(f"  every 10th request throttled (429): {n_requests / elapsed:8.0f} requests/sec, "
+              f"all fetched: {resources == legacy}, {app.token_requests} token requests in total")
+
+def _hand_rolled_inventory(client, graph_id, page_size):
+    """
+    Pulls every page with `request(...).json()` into one list, as had to be done before `iter_resources`.
+    """
+    resources, page = [], 1
+    while True:
+        params = {"limit": page_size, "page": page, **({"graphid": graph_id} if graph_id else {})}
+        body = client.request("GET", "resources/", params=params).json()
+        resources.extend(body["results"])
+        if not body.get("next"):
+            return resources
+        page += 1
+
+def _stream_inventory(client, graph_id, page_size, prefetch_pages, consume_seconds=0.0):
+    """
+    Consumes `iter_resources`; returns (time to first record, record count).
+    """
+    start = time.perf_counter()
+    first, count = None, 0
+    for _ in client.iter_resources(graph_id=graph_id, page_size=page_size, prefetch_pages=prefetch_pages):
+        first = first or time.perf_counter() - start
+        count += 1
+        if consume_seconds:
+            time.sleep(consume_seconds)
+    return first, count
+
+def benchmark_arches_streaming(n_resources=100_000, page_size=500, graph_id="site-graph"):
+    """
+    Compares time-to-first-record, total time and peak traced memory of the streaming resource
+    iterator against pulling every page into a list, on a local stand-in Arches server.
+    """
+    print(f"Arches streaming benchmark ({n_resources} resources, {page_size} per page)")
+    app = FakeArches(n_resources=n_resources)
+    with LocalServer(app) as server, \
+            arches_data_management.ArchesClient(server.url, "user", "password") as client:
+        client.token()
+        resources, elapsed, peak = _peak_memory(_hand_rolled_inventory, client, None, page_size)
+        print(f"  all pages into a list : first record {elapsed:6.2f} s, total {elapsed:6.2f} s, "
+              f"peak {peak / 2**20:7.1f} MiB, {len(resources)} resources")
+        del resources
+        for prefetch_pages in (0, 1):
+            (first, count), elapsed, peak = _peak_memory(_stream_inventory, client, None, page_size, prefetch_pages)
+            print(f"  iter_resources, prefetch {prefetch_pages}: first record {first:6.3f} s, total {elapsed:6.2f} s, "
+                  f"peak {peak / 2**20:7.1f} MiB, {count} resources")
+        # With a consumer doing work per record, prefetching overlaps the downloads with that work
+        subset = 20_000
+        app_small = FakeArches(n_resources=subset, latency=0.05)
+        with LocalServer(app_small) as small, \
+                arches_data_management.ArchesClient(small.url, "user", "password") as small_client:
+            for prefetch_pages in (0, 1):
+                _, elapsed = _timed(_stream_inventory, small_client, None, page_size, prefetch_pages, 0.00002)
+                print(f"  {subset} resources, 50 ms per page, busy consumer, prefetch {prefetch_pages}: "
+                      f"{elapsed:6.2f} s")
+        _, count = _stream_inventory(client, graph_id, page_size, 1)
+        print(f"  graphid={graph_id}: {count} resources "
+              f"(expected {sum(r['graph_id'] == graph_id for r in app.resources.values())})")
+
+def write_candidate_sites(path, n_sites, invalid_every=0, seed=0):
+    """
+    Writes a GeoJSON feature collection of `n_sites` candidate sites, every `invalid_every`-th without a name.
+    """
+    rng = np.random.default_rng(seed)
+    lons, lats = rng.uniform(-56.0, -54.0, n_sites), rng.uniform(-11.0, -9.0, n_sites)
+    features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+                 "properties": {"candidate_id": f"LIDAR-{i:06d}",
+                                "name": None if invalid_every and i % invalid_every == 0 else f"Candidate mound {i}",
+                                "height_m": round(float(rng.uniform(0.3, 3.0)), 2)}}
+                for i, (lon, lat) in enumerate(zip(lons, lats))]
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return path
+
+def _legacy_arches_ingest(base_url, sites, graph_id, node_map):
+    """
+    The original loop: one `create_resource` call (and so one new connection) per site.
+    """
+    arches_data_management.AUTH_ENDPOINT = f"{base_url}auth/token/"
+    arches_data_management.RESOURCES_ENDPOINT = f"{base_url}resources/"
+    with contextlib.redirect_stdout(io.StringIO()): # The functions print every call
+        token = arches_data_management.get_auth_token("user", "password")
+        return [arches_data_management.create_resource(token, graph_id,
+                                                       arches_data_management.site_node_data(site, node_map))
+                for site in sites]
+
+def benchmark_arches_ingest(n_sites=5000, latency=0.002, write_latency=0.0005, invalid_every=100,
+                            graph_id="site-graph"):
+    """
+    Compares records/sec of the original `create_resource` loop against `ingest_sites` (concurrent
+    posts and bulk business data batches) on a local stand-in Arches server, then re-runs the
+    ingest to check that no site is created twice.
+    """
+    print(f"Arches ingest benchmark ({n_sites} sites, {latency * 1000:.0f} ms server latency per request, "
+          f"{write_latency * 1000:.1f} ms per resource written)")
+    node_map = {"candidate_id": "node-candidate-id", "name": "node-name", "height_m": "node-height",
+                "geometry": "node-geometry"}
+    with tempfile.TemporaryDirectory() as tmp:
+        sites_path = write_candidate_sites(os.path.join(tmp, "candidates.geojson"), n_sites, invalid_every)
+        sites = list(arches_data_management.read_sites(sites_path))
+        expected_failures = sum(site["name"] is None for site in sites)
+
+        app = FakeArches(n_resources=0, latency=latency, write_latency=write_latency)
+        with LocalServer(app) as server:
+            legacy, elapsed = _timed(_legacy_arches_ingest, server.url, sites, graph_id, node_map)
+            print(f"  original create_resource loop: {n_sites / elapsed:8.0f} records/sec, "
+                  f"{sum(result is None for result in legacy)} failed")
+
+        for mode, max_concurrency, batch_size in (("concurrent", 8, None), ("bulk", 4, 200), ("bulk", 4, 1000)):
+            app = FakeArches(n_resources=0, latency=latency, write_latency=write_latency)
+            ledger_path = os.path.join(tmp, f"ledger_{mode}_{batch_size}.jsonl")
+            with LocalServer(app) as server, \
+                    arches_data_management.ArchesClient(server.url, "user", "password",
+                                                        max_concurrency=max_concurrency) as client, \
+                    contextlib.redirect_stdout(io.StringIO()):
+                report, elapsed = _timed(arches_data_management.ingest_sites, client, sites_path, graph_id, node_map,
+                                         key_field="candidate_id", mode=mode, batch_size=batch_size or 200,
+                                         ledger_path=ledger_path)
+                created = len(app.resources)
+                rerun = arches_data_management.ingest_sites(client, sites_path, graph_id, node_map,
+                                                            key_field="candidate_id", mode=mode,
+                                                            batch_size=batch_size or 200, ledger_path=ledger_path)
+            label = f"{mode}, {max_concurrency} in flight" + (f", batches of {batch_size}" if batch_size else "")
+            print(f"  {label:<36}: {n_sites / elapsed:8.0f} records/sec, {report['created']} created, "
+                  f"{len(report['failed'])} failed (expected {expected_failures})")
+            print(f"    rerun: {rerun['skipped']} skipped, {rerun['created']} created, "
+                  f"{len(app.resources) - created} duplicates on the server")
+
+class FakeOpenAtlas:
+    """
+    In-memory stand-in for the OpenAtlas entities endpoint, with `modified_since` and `id_gt` filters.
+
+    Entities are points and small polygons spread over a 2 x 2 degree block; `touch` modifies some
+    of them, advancing their modification timestamp.
+    """
+
+    def __init__(self, n_entities=100_000, api_key="key", latency=0.0, throttle_every=0, seed=0):
+        rng = np.random.default_rng(seed)
+        xs, ys = rng.uniform(-56.0, -54.0, n_entities), rng.uniform(-11.0, -9.0, n_entities)
+        created = datetime.datetime(2020, 1, 1)
+        self.entities = {}
+        for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist()), start=1):
+            if i % 10:
+                geometry = {"type": "Point", "coordinates": [x, y]}
+            else:
+                geometry = {"type": "Polygon", "coordinates": [[[x, y], [x + 0.001, y], [x + 0.001, y + 0.001],
+                                                                [x, y + 0.001], [x, y]]]}
+            self.entities[i] = {"id": i, "label": f"Site {i}", "system_class": "place" if i % 4 else "feature",
+                                "type": {"name": "Settlement" if i % 3 else "Earthwork"},
+                                "description": "Recorded during field survey " * 4,
+                                "modified": (created + datetime.timedelta(minutes=i)).isoformat(),
+                                "geometry": geometry}
+        self.types = [{"id": 1, "name": "Settlement"}, {"id": 2, "name": "Earthwork"}]
+        self.api_key = api_key
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.type_requests = 0
+        self._clock = 0
+        self._edited = created + datetime.timedelta(minutes=n_entities + 1)
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def touch(self, entity_ids, deleted=False):
+        """
+        Modifies (or marks deleted) the given entities, with a newer timestamp than any before.
+        """
+        with self._lock:
+            self._clock += 1
+            for entity_id in entity_ids:
+                entity = self.entities[entity_id]
+                entity["modified"] = (self._edited + datetime.timedelta(minutes=self._clock)).isoformat()
+                entity["label"] = f"Site {entity_id} (revised {self._clock})"
+                if deleted:
+                    entity["deleted"] = True
+            self._sorted = None
+
+    def handle(self, method, path, query, body, headers):
+        with self._lock:
+            self.requests += 1
+            throttled = self.throttle_every and self.requests % self.throttle_every == 0
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            return 429, {"detail": "Too many requests."}, {"Retry-After": "0"}
+        if headers.get("Authorization") != f"Token {self.api_key}":
+            return 401, {"detail": "Invalid API key."}, {}
+        if path == "/types/" and method == "GET":
+            with self._lock:
+                self.type_requests += 1
+            return 200, {"results": self.types}, {}
+        if path == "/entities/" and method == "POST":
+            if not body.get("label"):
+                return 400, {"detail": "An entity needs a label."}, {}
+            with self._lock:
+                self._clock += 1
+                entity_id = max(self.entities, default=0) + 1
+                self.entities[entity_id] = {**body, "id": entity_id,
+                                            "modified": (self._edited + datetime.timedelta(minutes=self._clock)).isoformat()}
+                self._sorted = None
+            return 201, self.entities[entity_id], {}
+        if path.startswith("/entities/") and path != "/entities/" and method == "GET":
+            entity = self.entities.get(int(path.split("/")[2]))
+            return (200, entity, {}) if entity else (404, {"detail": "Not found."}, {})
+        if path != "/entities/" or method != "GET":
+            return 404, {"detail": "Not found."}, {}
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self.entities.values(), key=lambda entity: (entity["modified"], entity["id"]))
+            entities = self._sorted
+        if "modified_since" in query:
+            since = query["modified_since"][0]
+            entities = [entity for entity in entities if entity["modified"] >= since]
+        if "id_gt" in query:
+            id_gt = int(query["id_gt"][0])
+            entities = [entity for entity in entities if entity["id"] > id_gt]
+        limit, page = int(query.get("limit", [20])[0]), int(query.get("page", [1])[0])
+        return 200, {"count": len(entities), "next": "more" if page * limit < len(entities) else None,
+                     "results": entities[(page - 1) * limit:page * limit]}, {}
+
+def _full_fetch_bbox(base_url, api_key, box, page_size=1000):
+    """
+    Answers a bounding box query the only way the live API allows: fetch every entity, filter client-side.
+    """
+    min_x, min_y, max_x, max_y = box
+    headers = openatlas_data_management.get_headers(api_key)
+    hits, page = [], 1
+    with requests.Session() as session:
+        while True:
+            body = session.get(f"{base_url}entities/", headers=headers,
+                               params={"limit": page_size, "page": page}).json()
+            for entity in body["results"]:
+                bounds = openatlas_mirror.geometry_bounds(entity["geometry"])
+                if bounds[2] >= min_x and bounds[0] <= max_x and bounds[3] >= min_y and bounds[1] <= max_y:
+                    hits.append(entity["id"])
+            if not body.get("next"):
+                return sorted(hits)
+            page += 1
+
+def benchmark_openatlas_mirror(n_entities=100_000, n_queries=1000, box_size=0.02, n_modified=1000):
+    """
+    Compares bounding box query latency of the local OpenAtlas mirror against fetching every
+    entity from a local stand-in API and filtering client-side, and times full and incremental syncs.
+    """
+    print(f"OpenAtlas mirror benchmark ({n_entities} entities, {box_size} degree query boxes)")
+    app = FakeOpenAtlas(n_entities=n_entities)
+    rng = np.random.default_rng(1)
+    corners = np.column_stack([rng.uniform(-56.0, -54.0 - box_size, n_queries),
+                               rng.uniform(-11.0, -9.0 - box_size, n_queries)]).tolist()
+    boxes = [(x, y, x + box_size, y + box_size) for x, y in corners]
+    with tempfile.TemporaryDirectory() as tmp, LocalServer(app) as server, \
+            openatlas_mirror.OpenAtlasMirror(os.path.join(tmp, "mirror.sqlite"), server.url, app.api_key) as mirror, \
+            contextlib.redirect_stdout(io.StringIO()) as log:
+        _, full_sync = _timed(mirror.sync)
+        full_fetch, full_fetch_elapsed = _timed(_full_fetch_bbox, server.url, app.api_key, boxes[0])
+        hits, elapsed = _timed(lambda: [mirror.bbox(*box) for box in boxes])
+        nearest, nearest_elapsed = _timed(lambda: [mirror.nearest(x, y, k=5) for x, y in corners])
+
+        app.touch(range(1, n_modified + 1))
+        app.touch(range(n_entities - 9, n_entities + 1), deleted=True)
+        requests_before = app.requests
+        written, incremental = _timed(mirror.sync)
+        incremental_requests = app.requests - requests_before
+        revised = mirror.get(1)["label"]
+        remaining = mirror.count()
+    print(f"  full sync              : {full_sync:8.2f} s")
+    print(f"  full fetch + filter    : {full_fetch_elapsed * 1000:10.1f} ms per query")
+    print(f"  mirror bbox            : {elapsed / n_queries * 1000:10.3f} ms per query "
+          f"({sum(map(len, hits)) / n_queries:.1f} hits on average), same hits: {[h['id'] for h in hits[0]] == full_fetch}")
+    print(f"  mirror nearest (k=5)   : {nearest_elapsed / n_queries * 1000:10.3f} ms per query, "
+          f"all found: {all(len(n) == 5 for n in nearest)}")
+    print(f"  incremental sync ({n_modified} modified, 10 deleted): {incremental:6.2f} s, {written} written, "
+          f"{incremental_requests} requests, revised label: {revised!r}, {remaining} entities left")
+
+def benchmark_openatlas_async(n_requests=1000, latency=0.02, concurrency=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Measures requests/sec of `AsyncOpenAtlasClient.fetch_many` and `create_entities` from 1 to 64
+    requests in flight, against a local stand-in OpenAtlas server answering each request after
+    `latency` seconds; the original `create_entity` function is the baseline.
+    """
+    print(f"OpenAtlas async client benchmark ({n_requests} requests, {latency * 1000:.0f} ms server latency)")
+    client_class = openatlas_data_management.AsyncOpenAtlasClient
+    app = FakeOpenAtlas(n_entities=n_requests, latency=latency)
+    entity_ids = list(app.entities)
+    new_entities = [{"label": f"Candidate {i}", "system_class": "place",
+                     "geometry": {"type": "Point", "coordinates": [-55.0, -10.0]}} for i in range(n_requests)]
+    with LocalServer(app) as server:
+        openatlas_data_management.ENTITIES_ENDPOINT = f"{server.url}entities/"
+        subset = new_entities[:max(1, n_requests // 10)]
+        with contextlib.redirect_stdout(io.StringIO()): # The function prints every call
+            _, elapsed = _timed(lambda: [openatlas_data_management.create_entity(app.api_key, entity)
+                                         for entity in subset])
+        print(f"  original create_entity: {len(subset) / elapsed:8.0f} requests/sec")
+
+        async def run(max_concurrency, func, items):
+            async with client_class(server.url, app.api_key, max_concurrency=max_concurrency) as client:
+                return await getattr(client, func)(items)
+
+        for max_concurrency in concurrency:
+            fetched, fetch_elapsed = _timed(asyncio.run, run(max_concurrency, "fetch_many", entity_ids))
+            created, create_elapsed = _timed(asyncio.run, run(max_concurrency, "create_entities", new_entities))
+            print(f"  {max_concurrency:2d} in flight: fetch_many {n_requests / fetch_elapsed:8.0f} requests/sec, "
+                  f"create_entities {n_requests / create_elapsed:8.0f} requests/sec")
+        print(f"  fetched in order: {[entity['id'] for entity in fetched] == entity_ids}, "
+              f"created: {sum(isinstance(entity, dict) for entity in created)}/{n_requests}")
+
+        app.throttle_every = 10
+        invalid = [*new_entities[:99], {"label": ""}]
+
+        async def throttled():
+            async with client_class(server.url, app.api_key, max_concurrency=16, backoff_base=0.01) as client:
+                types = [await client.get_type("Settlement") for _ in range(100)]
+                return types, await client.fetch_many(entity_ids), await client.create_entities(invalid)
+
+        (types, fetched, created), elapsed = _timed(asyncio.run, throttled())
+        print(f"  every 10th request throttled (429): all fetched: {[e['id'] for e in fetched] == entity_ids}, "
+              f"{sum(isinstance(entity, dict) for entity in created)} created and "
+              f"{sum(isinstance(entity, Exception) for entity in created)} rejected of {len(invalid)}, "
+              f"{app.type_requests} type request(s) for {len(types)} lookups")
+
+def write_synthetic_mound_dtm(path, size=4096, n_mounds=20_000, resolution=1.0, crs="EPSG:32721", seed=0):
+    """
+    Writes a DTM of undulating terrain with `n_mounds` small, non-overlapping mounds (0.5-1.5 m high,
+    3-6 m radius) on a jittered grid; returns the mound centers in map coordinates.
+    """
+    rng = np.random.default_rng(seed)
+    row, col = np.mgrid[0:size, 0:size].astype(np.float32)
+    dtm = 100.0 + 3.0 * np.sin(col / 150.0) + 2.0 * np.cos(row / 90.0)
+    spacing = size / math.ceil(math.sqrt(n_mounds))
+    grid = np.arange(spacing / 2, size, spacing)
+    centers = np.array([(r, c) for r in grid for c in grid])[:n_mounds]
+    centers += rng.uniform(-spacing / 6, spacing / 6, centers.shape)
+    radii, heights = rng.uniform(3.0, 6.0, len(centers)), rng.uniform(0.5, 1.5, len(centers))
+    offsets = np.arange(-8, 9)
+    for (center_row, center_col), radius, height in zip(centers, radii, heights):
+        r0, c0 = int(center_row), int(center_col)
+        rows, cols = np.clip(r0 + offsets, 0, size - 1), np.clip(c0 + offsets, 0, size - 1)
+        distance = np.hypot(rows[:, None] - center_row, cols[None, :] - center_col)
+        dtm[np.ix_(rows, cols)] += height * np.clip(1.0 - (distance / radius) ** 2, 0.0, None)
+    transform = from_origin(500_000.0, 8_900_000.0, resolution, resolution)
+    with rasterio.open(path, "w", driver="GTiff", width=size, height=size, count=1, dtype="float32", crs=crs,
+                       transform=transform, tiled=True, blockxsize=256, blockysize=256) as dst:
+        dst.write(dtm.astype(np.float32), 1)
+    xs, ys = rasterio.transform.xy(transform, centers[:, 0], centers[:, 1], offset="ul")
+    return np.column_stack([xs, ys])
+
+def _naive_cross_reference(candidate_geometries, record_geometries):
+    """
+    Tests every candidate against every record, as a loop over the candidates would.
+    """
+    return np.array([shapely.intersects(candidate, record_geometries).any() for candidate in candidate_geometries])
+
+def benchmark_candidates(dtm_size=4096, n_mounds=20_000, n_candidates=2_000_000, n_records=200_000,
+                         crs="EPSG:32721"):
+    """
+    Times candidate extraction from a DTM with known mounds, then the STRtree cross-referencing of
+    `n_candidates` polygons against `n_records` site records in longitude/latitude.
+    """
+    print(f"Candidate benchmark ({dtm_size} x {dtm_size} DTM with {n_mounds} mounds; "
+          f"{n_candidates} candidates against {n_records} records)")
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()) as log:
+        dtm_path = os.path.join(tmp, "dtm.tif")
+        centers = write_synthetic_mound_dtm(dtm_path, dtm_size, n_mounds, crs=crs)
+        candidates, extract_elapsed = _timed(lidar_candidates.extract_candidates, dtm_path, threshold=0.2,
+                                             lrm_radius=10, min_area=4.0)
+        # Record every third mound, as a point in longitude/latitude
+        lons, lats = transform_coordinates(crs, "EPSG:4326", centers[::3, 0], centers[::3, 1])
+        records = [{"source": "arches", "id": i, "label": None, "geometry": {"type": "Point", "coordinates": [x, y]}}
+                   for i, (x, y) in enumerate(zip(lons, lats))]
+        matches = lidar_candidates.cross_reference(candidates, records)
+        geojson_path = lidar_candidates.write_candidates_geojson(os.path.join(tmp, "new.geojson"), candidates,
+                                                                 matches, records, only_new=True)
+        sites = list(arches_data_management.read_sites(geojson_path))
+    print(f"  extraction (LRM on the fly): {extract_elapsed:6.2f} s, {len(candidates['geometry'])} candidates "
+          f"for {n_mounds} mounds")
+    print(f"  {matches['recorded'].sum()} recorded (expected {len(records)}), {len(sites)} new written as GeoJSON")
+
+    # Scale: millions of small candidate polygons against hundreds of thousands of records
+    rng = np.random.default_rng(1)
+    x0, y0, extent = 500_000.0, 8_800_000.0, 100_000.0
+    xs, ys = rng.uniform(x0, x0 + extent, n_candidates), rng.uniform(y0, y0 + extent, n_candidates)
+    sizes = rng.uniform(2.0, 20.0, n_candidates)
+    candidates = {"geometry": shapely.box(xs, ys, xs + sizes, ys + sizes), "crs": rasterio.crs.CRS.from_string(crs)}
+    record_xs, record_ys = rng.uniform(x0, x0 + extent, n_records), rng.uniform(y0, y0 + extent, n_records)
+    lons, lats = transform_coordinates(crs, "EPSG:4326", record_xs, record_ys)
+    records = [{"source": "openatlas", "id": i, "label": None, "geometry": {"type": "Point", "coordinates": [x, y]}}
+               for i, (x, y) in enumerate(zip(lons, lats))]
+    with contextlib.redirect_stdout(io.StringIO()):
+        matches, elapsed = _timed(lidar_candidates.cross_reference, candidates, records, distance=25.0)
+    print(f"  cross_reference, 25 m: {elapsed:6.2f} s ({n_candidates / elapsed:,.0f} candidates/sec), "
+          f"{matches['recorded'].sum()} recorded, {len(matches['record_index'])} matches")
+    sample = 200
+    record_geometries = shapely.buffer(shapely.points(record_xs, record_ys), 25.0)
+    naive, naive_elapsed = _timed(_naive_cross_reference, candidates["geometry"][:sample], record_geometries)
+    print(f"  candidate-by-candidate loop: {naive_elapsed / sample * n_candidates / 3600:6.1f} h estimated "
+          f"(from {sample} candidates), same tags: {bool((naive == matches['recorded'][:sample]).all())}")
+
+# Modules whose import the light subcommands of archaeology_cli.py must avoid.
+HEAVY_MODULES = ("numpy", "scipy", "rasterio", "laspy", "matplotlib", "shapely", "PIL", "requests")
+
+def _cold_start(command, runs=5):
+    """
+    Runs `command` in fresh interpreters from this directory; returns the best wall time, the heavy
+    modules it imported and its total import time as reported by `python -X importtime`.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    best = math.inf
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *command], capture_output=True, check=True, cwd=cwd)
+        best = min(best, time.perf_counter() - start)
+    stderr = subprocess.run([sys.executable, "-X", "importtime", *command], capture_output=True, text=True,
+                            check=True, cwd=cwd).stderr
+    # "import time: <self us> | <cumulative us> | <indented module>", one leading space for top-level imports
+    imports = [line.split("|") for line in stderr.splitlines() if line.startswith("import time:")][1:]
+    names = {fields[2].strip() for fields in imports}
+    import_seconds = sum(int(fields[1]) for fields in imports if fields[2].startswith(" ") and fields[2][1] != " ")
+    return best, sorted(names & set(HEAVY_MODULES)), import_seconds / 1e6
+
+def benchmark_startup(limit=0.150):
+    """
+    Measures the cold start of archaeology_cli.py subcommands in fresh interpreters, checks that
+    light ones (help, offline mirror queries) start within `limit` seconds and import no heavy
+    module, and shows network and processing subcommands for comparison.
+    """
+    print(f"CLI startup benchmark (best of 5 cold starts, light subcommands must start within {limit * 1000:.0f} ms)")
+    baseline, _, _ = _cold_start(["-c", "pass"])
+    print(f"  bare interpreter                                        : {baseline * 1000:6.0f} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "mirror.sqlite")
+        with contextlib.redirect_stdout(io.StringIO()), openatlas_mirror.OpenAtlasMirror(db_path) as mirror:
+            mirror.upsert(FakeOpenAtlas(n_entities=10_000).entities.values())
+        light = [["--help"], *([command, "--help"] for command in
+                               ("grid", "derive", "composite", "arches-sync", "openatlas-sync")),
+                 ["openatlas-sync", "--db", db_path, "--offline"],
+                 ["openatlas-sync", "--db", db_path, "--offline", "--bbox", "-55.1", "-10.1", "-55.0", "-10.0"],
+                 ["openatlas-sync", "--db", db_path, "--offline", "--nearest", "-55.0", "-10.0"]]
+        passed = True
+        for args in light:
+            elapsed, heavy, import_seconds = _cold_start(["archaeology_cli.py", *args])
+            ok = elapsed < limit and not heavy
+            passed &= ok
+            label = " ".join(os.path.basename(arg) for arg in args)
+            print(f"  {label[:56]:<56}: {elapsed * 1000:6.0f} ms, imports {import_seconds * 1000:5.1f} ms, "
+                  f"heavy: {', '.join(heavy) or '-'} {'ok' if ok else 'TOO SLOW'}")
+
+        openatlas_app, arches_app = FakeOpenAtlas(n_entities=100), FakeArches(n_resources=100)
+        with LocalServer(openatlas_app) as openatlas_server, LocalServer(arches_app) as arches_server:
+            network = [["openatlas-sync", "--db", os.path.join(tmp, "synced.sqlite"), "--url", openatlas_server.url,
+                        "--api-key", openatlas_app.api_key],
+                       ["arches-sync", "--url", arches_server.url, "--username", "user", "--password", "password",
+                        "--graph-id", "site-graph", "--output", os.path.join(tmp, "resources.jsonl")]]
+            for args in network:
+                elapsed, heavy, import_seconds = _cold_start(["archaeology_cli.py", *args], runs=3)
+                print(f"  {args[0] + ' (network, 100 records)':<56}: {elapsed * 1000:6.0f} ms, imports "
+                      f"{import_seconds * 1000:5.1f} ms, heavy: {', '.join(heavy) or '-'}")
+    for module in ("lidar_archaeology", "lidar_terrain_derivatives", "sentinel2_compositing"):
+        elapsed, heavy, import_seconds = _cold_start(["-c", f"import {module}"])
+        print(f"  {'import ' + module + ' (processing)':<56}: {elapsed * 1000:6.0f} ms, imports "
+              f"{import_seconds * 1000:5.1f} ms, heavy: {', '.join(heavy) or '-'}")
+    print(f"  light subcommands within {limit * 1000:.0f} ms without heavy imports: {passed}")
+
+BENCHMARKS = {
+    "gridding": benchmark_gridding,
+    "streaming": benchmark_streaming,
+    "batch": benchmark_batch,
+    "interpolation": benchmark_interpolation,
+    "ground_filter": benchmark_ground_filter,
+    "geotiff": benchmark_geotiff,
+    "visualization": benchmark_visualization,
+    "pipeline": benchmark_pipeline,
+    "compositing": benchmark_compositing,
+    "export": benchmark_export,
+    "spectral_indices": benchmark_spectral_indices,
+    "arches_client": benchmark_arches_client,
+    "arches_streaming": benchmark_arches_streaming,
+    "arches_ingest": benchmark_arches_ingest,
+    "openatlas_mirror": benchmark_openatlas_mirror,
+    "openatlas_async": benchmark_openatlas_async,
+    "candidates": benchmark_candidates,
+    "startup": benchmark_startup,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,6 +1,7 @@
 # Google Earth Engine Python script for archaeological analysis
 
-import ee
+# Importing this script has no side effects: the `ee` module is imported and the Earth Engine
+# objects are built only when the functions below are called (or the script is run).
 
 # Initialize the Earth Engine API
 # You need to authenticate and initialize the API before running this script.
@@ -13,29 +14,50 @@ import ee
 # You can define a polygon, a rectangle, or a point with a buffer.
 # Example: A rectangle over a potential area in the Amazon (replace with your area of interest)
 # Coordinates are [west, south, east, north]
-roi = ee.Geometry.Rectangle([-55.0, -10.0, -50.0, -5.0]) 
+ROI_BOUNDS = [-55.0, -10.0, -50.0, -5.0]
 
-# You can also define a point and buffer around it:
+# You can also define a point and buffer around it, and pass it as `roi` below:
 # point = ee.Geometry.Point(-52.0, -7.0) # Example: Longitude, Latitude
 # roi = point.buffer(10000) # 10 km buffer
 
 # Define a date range for satellite imagery
-start_date = '2020-01-01'
-end_date = '2023-12-31'
+START_DATE = '2020-01-01'
+END_DATE = '2023-12-31'
+
+# Scenes with more cloudy pixels than this percentage are left out
+MAX_CLOUD = 10
 
 # --- Image Collection and Preprocessing --- 
 
-# Load Sentinel-2 surface reflectance data.
-# Sentinel-2 is good for archaeological analysis due to its spatial resolution (10m) and spectral bands.
-collection = ee.ImageCollection('COPERNICUS/S2_SR') \
-    .filterBounds(roi) \
-    .filterDate(start_date, end_date) \
-    .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10)) # Filter out cloudy images
+def region_of_interest(bounds=ROI_BOUNDS):
+    """
+    Returns the ROI as an `ee.Geometry.Rectangle` from [west, south, east, north] bounds.
+    """
+    import ee
+
+    return ee.Geometry.Rectangle(bounds)
+
+def sentinel2_composite(roi=None, start_date=START_DATE, end_date=END_DATE, max_cloud=MAX_CLOUD):
+    """
+    Returns the median composite of the Sentinel-2 surface reflectance scenes over `roi`, clipped to it.
+    """
+    import ee
 
-# Select relevant bands for visualization and analysis.
-# B4: Red, B3: Green, B2: Blue (for true color composite)
-# B8: Near-Infrared (useful for vegetation analysis, which can indicate archaeological features)
-image = collection.median().clip(roi) # Take the median composite to reduce noise and clouds
+    roi = roi or region_of_interest()
+    # Load Sentinel-2 surface reflectance data.
+    # Sentinel-2 is good for archaeological analysis due to its spatial resolution (10m) and spectral bands.
+    collection = ee.ImageCollection('COPERNICUS/S2_SR') \
+        .filterBounds(roi) \
+        .filterDate(start_date, end_date) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud)) # Filter out cloudy images
+
+    # Select relevant bands for visualization and analysis.
+    # B4: Red, B3: Green, B2: Blue (for true color composite)
+    # B8: Near-Infrared (useful for vegetation analysis, which can indicate archaeological features)
+    return collection.median().clip(roi) # Take the median composite to reduce noise and clouds
+
+# The same composite and NDVI can be computed offline from downloaded scenes with
+# sentinel2_compositing.composite_sentinel2 (no credentials or Earth Engine quota needed).
 
 # --- Visualization Parameters --- 
 
@@ -68,7 +90,11 @@ false_color_vis = {
 # --- Example Analysis: NDVI (Normalized Difference Vegetation Index) --- 
 
 # NDVI is often used to highlight differences in vegetation health, which can sometimes indicate buried structures.
-ndvi = image.normalizedDifference(['B8', 'B4']).rename('NDVI')
+def ndvi(image):
+    """
+    Returns the NDVI band of a Sentinel-2 image.
+    """
+    return image.normalizedDifference(['B8', 'B4']).rename('NDVI')
 
 ndvi_vis = {
     'min': -0.2,
@@ -77,10 +103,13 @@ ndvi_vis = {
 }
 
 # print('Add NDVI to map:')
-# ee.mapclient.addToMap(ndvi, ndvi_vis, 'NDVI')
+# ee.mapclient.addToMap(ndvi_image, ndvi_vis, 'NDVI')
 
 # --- Exporting Results (for local script execution) --- 
 
+# Large ROIs exceed what a single export task can handle; gee_export_scheduler.export_image_tiles
+# splits the ROI into tiles and runs the exports with bounded concurrency, retries and a resumable
+# progress file.
 # To export the image to Google Drive or Google Cloud Storage, uncomment and modify the following:
 # export_image_params = {
 #     'image': image,
@@ -97,8 +126,14 @@ ndvi_vis = {
 # thumbnail_url = image.getThumbUrl(true_color_vis)
 # print(f'Thumbnail URL: {thumbnail_url}')
 
-print('Google Earth Engine script created. Remember to install the earthengine-api (`pip install earthengine-api`) and authenticate (`earthengine authenticate`) to run this locally.')
-print('The script includes commented-out sections for map visualization (for GEE Code Editor) and export (for local execution).')
-print('You will need to uncomment `ee.Initialize()` and the relevant `ee.mapclient.addToMap` or `ee.batch.Export.image.toDrive` lines depending on your use case.')
+if __name__ == "__main__":
+    # ee.Initialize()
+    roi = region_of_interest()
+    image = sentinel2_composite(roi)
+    ndvi_image = ndvi(image)
+
+    print('Google Earth Engine script created. Remember to install the earthengine-api (`pip install earthengine-api`) and authenticate (`earthengine authenticate`) to run this locally.')
+    print('The script includes commented-out sections for map visualization (for GEE Code Editor) and export (for local execution).')
+    print('You will need to uncomment `ee.Initialize()` and the relevant `ee.mapclient.addToMap` or `ee.batch.Export.image.toDrive` lines depending on your use case.')
 
 
@@ -0,0 +1,314 @@
+# Python script for tiled, resumable Google Earth Engine exports
+
+# gee_archaeology.py exports the whole ROI as a single Export.image.toDrive task and then
+# forgets about it. A 5 x 5 degree ROI at 10 m is billions of pixels, past what one task can
+# export. This script instead:
+#
+# 1. splits the ROI into a grid of sub-regions small enough for one export each;
+# 2. keeps at most `max_concurrent` export tasks running at a time;
+# 3. polls the status of all running tasks in one call per `poll_interval`, so the scheduler
+#    never blocks on a single task;
+# 4. re-submits failed tiles with exponential backoff and jitter, up to `max_retries` times;
+# 5. records the state of every tile in a JSON progress file after each change, so an
+#    interrupted run resumes where it stopped, re-attaching to tasks that are still running
+#    on the server instead of submitting them again.
+#
+# The Earth Engine calls go through a backend object. `EarthEngineBackend` uses the real API;
+# `FakeEarthEngineBackend` simulates tasks locally (durations, failures, rejected submissions),
+# so throughput and resume behaviour can be tested offline.
+
+import json
+import math
+import os
+import random
+import threading
+import time
+
+# Task states reported by Earth Engine that mean the task is finished.
+FINISHED_STATES = ("COMPLETED", "FAILED", "CANCELLED")
+
+# Approximate length of one degree of latitude, in meters.
+METERS_PER_DEGREE = 111320.0
+
+# --- Backends ---
+
+class EarthEngineBackend:
+    """
+    Starts and polls Export.image tasks through the Earth Engine API (`ee.Initialize()` must have run).
+    """
+
+    def __init__(self, destination="drive", folder=None, scale=10, crs=None, max_pixels=1e10):
+        """
+        Args:
+            destination (str): "drive" (Export.image.toDrive) or "cloud" (Export.image.toCloudStorage,
+                with `folder` as the bucket).
+            folder (str): Drive folder or Cloud Storage bucket.
+            scale (float): Export resolution in meters per pixel.
+            crs (str): Export CRS; defaults to the CRS of the image.
+            max_pixels (float): maxPixels of each (tile) export.
+        """
+        import ee # Imported here so the scheduler and the fake backend work without earthengine-api
+        self._ee = ee
+        self.destination = destination
+        self.folder = folder
+        self.scale = scale
+        self.crs = crs
+        self.max_pixels = max_pixels
+
+    def start(self, image, description, bounds):
+        """
+        Starts the export of `image` over `bounds` ([west, south, east, north]); returns the task ID.
+        """
+        params = {"image": image, "description": description, "fileNamePrefix": description,
+                  "region": self._ee.Geometry.Rectangle(list(bounds)), "scale": self.scale,
+                  "maxPixels": self.max_pixels}
+        if self.crs:
+            params["crs"] = self.crs
+        if self.destination == "cloud":
+            task = self._ee.batch.Export.image.toCloudStorage(bucket=self.folder, **params)
+        else:
+            task = self._ee.batch.Export.image.toDrive(folder=self.folder, **params)
+        task.start()
+        return task.id
+
+    def status(self, task_ids):
+        """
+        Returns {task_id: {"state": ..., "error_message": ...}} for the given tasks, in one request.
+        """
+        return {status["id"]: status for status in self._ee.data.getTaskStatus(list(task_ids))}
+
+class FakeEarthEngineBackend:
+    """
+    Local stand-in for `EarthEngineBackend` that simulates export tasks in memory.
+
+    Tasks go READY -> RUNNING -> COMPLETED (or FAILED with probability `failure_rate`) over a random
+    duration; `start` raises RuntimeError with probability `start_failure_rate`, like a rate-limited
+    submission. Every call is counted, so tests can check how much work a run submitted.
+    """
+
+    def __init__(self, duration=(0.01, 0.05), failure_rate=0.0, start_failure_rate=0.0, seed=0):
+        self.duration = duration
+        self.failure_rate = failure_rate
+        self.start_failure_rate = start_failure_rate
+        self.tasks = {}
+        self.start_calls = 0
+        self.status_calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def start(self, image, description, bounds):
+        with self._lock:
+            self.start_calls += 1
+            if self._random.random() < self.start_failure_rate:
+                raise RuntimeError("Too many tasks already in the queue (simulated)")
+            task_id = f"FAKE{len(self.tasks):08d}"
+            now = time.monotonic()
+            self.tasks[task_id] = {"description": description, "bounds": list(bounds), "started": now,
+                                   "finishes": now + self._random.uniform(*self.duration),
+                                   "fails": self._random.random() < self.failure_rate}
+            return task_id
+
+    def status(self, task_ids):
+        with self._lock:
+            self.status_calls += 1
+            now = time.monotonic()
+            statuses = {}
+            for task_id in task_ids:
+                task = self.tasks.get(task_id)
+                if task is None:
+                    statuses[task_id] = {"id": task_id, "state": "UNKNOWN"}
+                elif now < task["finishes"]:
+                    statuses[task_id] = {"id": task_id, "state": "RUNNING"}
+                elif task["fails"]:
+                    statuses[task_id] = {"id": task_id, "state": "FAILED", "error_message": "Simulated failure"}
+                else:
+                    statuses[task_id] = {"id": task_id, "state": "COMPLETED"}
+            return statuses
+
+# --- Tiling ---
+
+def split_region(roi, scale=10.0, max_pixels_per_tile=1e9):
+    """
+    Splits a [west, south, east, north] region into a grid of tiles of at most `max_pixels_per_tile`
+    pixels at `scale` meters per pixel (degrees are converted at the equator, which overestimates
+    the pixels of a tile elsewhere, so the limit always holds).
+
+    Returns:
+        list: One dict per tile with its name ("r000_c000", row 0 northmost) and bounds.
+    """
+    west, south, east, north = roi
+    tile_degrees = math.floor(math.sqrt(max_pixels_per_tile)) * scale / METERS_PER_DEGREE
+    rows = max(1, math.ceil((north - south) / tile_degrees - 1e-9))
+    cols = max(1, math.ceil((east - west) / tile_degrees - 1e-9))
+    height, width = (north - south) / rows, (east - west) / cols
+    return [{"name": f"r{row:03d}_c{col:03d}",
+             "bounds": [west + col * width, north - (row + 1) * height, west + (col + 1) * width, north - row * height]}
+            for row in range(rows) for col in range(cols)]
+
+# --- Scheduler ---
+
+class ExportScheduler:
+    """
+    Runs one export task per tile with bounded concurrency, retries and a resumable progress file.
+
+    Every tile in the progress file has a state: "pending" (not submitted yet, or waiting for a
+    retry), "running" (task submitted), "completed" or "failed" (out of retries).
+    """
+
+    def __init__(self, backend, image, tiles, progress_path, prefix="archaeology_export", max_concurrent=8,
+                 max_retries=3, backoff_base=30.0, backoff_max=600.0, poll_interval=15.0, seed=None):
+        """
+        Args:
+            backend: `EarthEngineBackend`, `FakeEarthEngineBackend` or an object with the same methods.
+            image: The image to export (an ee.Image for the real backend).
+            tiles (list): Tiles from `split_region`.
+            progress_path (str): JSON progress file; an existing one is resumed.
+            prefix (str): Task descriptions and file names are `<prefix>_<tile name>`.
+            max_concurrent (int): Maximum number of tasks running at once.
+            max_retries (int): Re-submissions of a failed tile before it is given up.
+            backoff_base (float): Delay before the first retry, in seconds; doubles with every retry.
+            backoff_max (float): Cap on the retry delay, in seconds.
+            poll_interval (float): Seconds between status polls.
+            seed (int): Seed of the backoff jitter.
+        """
+        self.backend = backend
+        self.image = image
+        self.progress_path = progress_path
+        self.prefix = prefix
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self._random = random.Random(seed)
+        self.tiles = self._load_progress(tiles)
+
+    def _load_progress(self, tiles):
+        state = {tile["name"]: {"bounds": tile["bounds"], "state": "pending", "task_id": None, "attempts": 0,
+                                "retry_at": 0.0, "error": None} for tile in tiles}
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path) as f:
+                saved = json.load(f)["tiles"]
+            for name, tile in saved.items():
+                if name not in state:
+                    continue
+                if tile["state"] == "failed":
+                    tile.update(state="pending", attempts=0, error=None) # A new run retries given-up tiles
+                tile["retry_at"] = 0.0 # Backoff deadlines are not meaningful across runs
+                state[name] = tile
+        return state
+
+    def _save_progress(self):
+        directory = os.path.dirname(self.progress_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.progress_path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"prefix": self.prefix, "tiles": self.tiles}, f, indent=1)
+        os.replace(temporary, self.progress_path)
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * self._random.uniform(0.5, 1.0)
+
+    def _fail(self, name, error, now):
+        """
+        Records a failed attempt of tile `name`: schedules a retry with backoff, or gives the tile up.
+        """
+        tile = self.tiles[name]
+        tile["attempts"] += 1
+        tile["error"] = error
+        tile["task_id"] = None
+        if tile["attempts"] > self.max_retries:
+            tile["state"] = "failed"
+            print(f"Export of {self.prefix}_{name} failed for good: {error}")
+        else:
+            tile["state"] = "pending"
+            tile["retry_at"] = now + self._backoff(tile["attempts"])
+
+    def counts(self):
+        """
+        Returns the number of tiles in each state.
+        """
+        counts = {"pending": 0, "running": 0, "completed": 0, "failed": 0}
+        for tile in self.tiles.values():
+            counts[tile["state"]] += 1
+        return counts
+
+    def run(self, timeout=None):
+        """
+        Submits and polls exports until every tile is completed or failed, or `timeout` seconds pass.
+
+        Tasks still running when the timeout expires stay "running" in the progress file and are
+        polled again by the next run.
+
+        Returns:
+            dict: The number of tiles in each state.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else math.inf
+        print(f"Exporting {len(self.tiles)} tiles ({self.counts()['completed']} already completed), "
+              f"at most {self.max_concurrent} at a time")
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            changed = False
+
+            # Poll every running task in a single request
+            running = {tile["task_id"]: name for name, tile in self.tiles.items() if tile["state"] == "running"}
+            if running:
+                statuses = self.backend.status(running)
+                for task_id, name in running.items():
+                    status = statuses.get(task_id, {})
+                    if status.get("state") == "COMPLETED":
+                        self.tiles[name].update(state="completed", error=None)
+                        changed = True
+                    elif status.get("state") in FINISHED_STATES or status.get("state") == "UNKNOWN":
+                        self._fail(name, status.get("error_message") or status.get("state"), now)
+                        changed = True
+
+            # Fill the free slots with pending tiles whose backoff has expired
+            slots = self.max_concurrent - sum(tile["state"] == "running" for tile in self.tiles.values())
+            for name, tile in self.tiles.items():
+                if slots <= 0:
+                    break
+                if tile["state"] != "pending" or tile["retry_at"] > now:
+                    continue
+                try:
+                    tile["task_id"] = self.backend.start(self.image, f"{self.prefix}_{name}", tile["bounds"])
+                    tile["state"] = "running"
+                    slots -= 1
+                except Exception as e: # Rejected submissions (quota, rate limits) are retried like failed tasks
+                    self._fail(name, str(e), now)
+                changed = True
+
+            if changed:
+                self._save_progress()
+            counts = self.counts()
+            if counts["pending"] == 0 and counts["running"] == 0:
+                break
+            time.sleep(max(0.0, min(self.poll_interval, deadline - time.monotonic())))
+
+        counts = self.counts()
+        print(f"Export status: {counts['completed']} completed, {counts['running']} running, "
+              f"{counts['pending']} pending, {counts['failed']} failed")
+        return counts
+
+def export_image_tiles(image, roi, progress_path="export_progress.json", backend=None, scale=10,
+                       max_pixels_per_tile=1e9, timeout=None, **scheduler_options):
+    """
+    Exports `image` over `roi` ([west, south, east, north]) as a grid of tiles; see `ExportScheduler`.
+
+    Args:
+        backend: Defaults to an `EarthEngineBackend` exporting to Google Drive at `scale`.
+        scheduler_options: Passed on to `ExportScheduler` (max_concurrent, max_retries, poll_interval...).
+
+    Returns:
+        dict: The number of tiles in each state.
+    """
+    backend = backend or EarthEngineBackend(scale=scale, max_pixels=max_pixels_per_tile)
+    tiles = split_region(roi, scale=scale, max_pixels_per_tile=max_pixels_per_tile)
+    return ExportScheduler(backend, image, tiles, progress_path, **scheduler_options).run(timeout=timeout)
+
+# Example usage (uncomment after `ee.Initialize()`, with the composite and ROI of gee_archaeology.py):
+# if __name__ == "__main__":
+#     from gee_archaeology import ROI_BOUNDS, sentinel2_composite
+#     export_image_tiles(sentinel2_composite(), ROI_BOUNDS, progress_path='export_progress.json')
@@ -3,18 +3,331 @@
 # This script outlines a general workflow for processing LiDAR data for archaeological purposes.
 # It uses common Python libraries for geospatial data handling. 
 # You will need to install these libraries if you don't have them:
-# pip install laspy numpy matplotlib rasterio
+# pip install laspy numpy matplotlib rasterio scipy
+
+import os
 
 import laspy
 import numpy as np
-import matplotlib.pyplot as plt
-import rasterio
-from rasterio.transform import from_origin
+from laspy.vlrs.known import GeoKeyDirectoryVlr, WktCoordinateSystemVlr
+
+from lidar_profiling import PipelineProfiler
+
+# rasterio (GDAL), the matplotlib-based visualization, the ground filter and the DTM hole
+# filling (scipy.ndimage, scipy.interpolate, scipy.spatial) are imported where they are used,
+# so importing this module, e.g. for its gridding functions, stays cheap.
+
+# --- Gridding engine ---
+
+# Per-cell reducers supported by `grid_points`.
+GRID_REDUCERS = ("mean", "min", "max", "count", "percentile")
+
+def grid_shape(min_x, min_y, max_x, max_y, resolution):
+    """
+    Returns the (rows, cols) of a grid covering the given extent at `resolution`.
+    """
+    cols = int(np.ceil((max_x - min_x) / resolution))
+    rows = int(np.ceil((max_y - min_y) / resolution))
+    return rows, cols
+
+def cell_indices(x, y, min_x, max_y, resolution, rows, cols, row_offset=0, col_offset=0):
+    """
+    Computes the flat (row-major, top-left origin) cell index of every point in bulk.
+
+    The grid is anchored at (min_x, max_y). When only a (rows, cols) window of a larger grid
+    is wanted, `row_offset`/`col_offset` give the window's top-left cell and the indices are
+    relative to the window.
+
+    Returns:
+        tuple: (indices, inside) where `inside` is a boolean mask of the points that fall
+        within the grid and `indices` holds the flat cell index of those points only.
+    """
+    # astype truncates toward zero, matching the int() used by the original per-point loop
+    col = ((np.asarray(x) - min_x) / resolution).astype(np.int64) - col_offset
+    row = ((max_y - np.asarray(y)) / resolution).astype(np.int64) - row_offset # Invert row for top-left origin
+    inside = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+    return row[inside] * cols + col[inside], inside
+
+class CellStatistics:
+    """
+    Running per-cell sum, count, minimum and maximum of Z for a fixed grid.
+
+    Statistics from several batches of points (or several `CellStatistics`) can be
+    combined, and any of the mergeable reducers can be produced at the end.
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        size = rows * cols
+        self.sum = np.zeros(size, dtype=np.float64)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+
+    def add(self, indices, z):
+        """
+        Accumulates the Z values `z` into the flat cells `indices`.
+
+        Only the cells that are hit are touched, so the cost scales with the number of points,
+        not with the size of the grid.
+        """
+        z = np.asarray(z, dtype=np.float64)
+        np.add.at(self.sum, indices, z)
+        np.add.at(self.count, indices, 1)
+        np.minimum.at(self.min, indices, z)
+        np.maximum.at(self.max, indices, z)
+
+    def merge(self, other, row_offset=0, col_offset=0):
+        """
+        Folds the statistics of another `CellStatistics` into this one.
+
+        `row_offset`/`col_offset` place the top-left cell of `other` on this grid; only the
+        overlapping cells are merged, so neighbouring tiles can be combined directly.
+        """
+        rows = slice(max(row_offset, 0), min(row_offset + other.rows, self.rows))
+        cols = slice(max(col_offset, 0), min(col_offset + other.cols, self.cols))
+        if rows.start >= rows.stop or cols.start >= cols.stop:
+            return
+        other_rows = slice(rows.start - row_offset, rows.stop - row_offset)
+        other_cols = slice(cols.start - col_offset, cols.stop - col_offset)
+        for name, combine in (("sum", np.add), ("count", np.add), ("min", np.minimum), ("max", np.maximum)):
+            mine = getattr(self, name).reshape(self.rows, self.cols)
+            theirs = getattr(other, name).reshape(other.rows, other.cols)
+            mine[rows, cols] = combine(mine[rows, cols], theirs[other_rows, other_cols])
+
+    def save(self, directory, prefix):
+        """
+        Writes the statistics as `<prefix>_<statistic>.npy` arrays in `directory`.
+        """
+        for name in ("sum", "count", "min", "max"):
+            np.save(os.path.join(directory, f"{prefix}_{name}.npy"), getattr(self, name).reshape(self.rows, self.cols))
+
+    @classmethod
+    def load(cls, directory, prefix, mmap_mode=None):
+        """
+        Reads statistics written by `save`; `mmap_mode` is passed to `np.load`.
+        """
+        stats = cls.__new__(cls)
+        for name in ("sum", "count", "min", "max"):
+            values = np.load(os.path.join(directory, f"{prefix}_{name}.npy"), mmap_mode=mmap_mode)
+            stats.rows, stats.cols = values.shape
+            setattr(stats, name, values.reshape(-1))
+        return stats
+
+    # Reducers that can be produced from the running statistics
+    REDUCERS = ("mean", "min", "max", "count")
+
+    def reduce(self, reducer="mean"):
+        """
+        Returns a (rows, cols) float64 grid; cells without points are NaN (0 for "count").
+        """
+        if reducer == "count":
+            return self.count.astype(np.float64).reshape(self.rows, self.cols)
+        empty = self.count == 0
+        if reducer == "mean":
+            values = self.sum / np.where(empty, 1, self.count)
+        elif reducer == "min":
+            values = self.min.copy()
+        elif reducer == "max":
+            values = self.max.copy()
+        else:
+            raise ValueError(f"Reducer '{reducer}' cannot be computed from cell statistics")
+        values[empty] = np.nan
+        return values.reshape(self.rows, self.cols)
+
+def _grid_percentile(indices, z, rows, cols, percentile):
+    """
+    Per-cell percentile of Z using the same linear interpolation as `np.percentile`.
+    """
+    grid = np.full(rows * cols, np.nan)
+    if len(indices) == 0:
+        return grid.reshape(rows, cols)
+    order = np.lexsort((z, indices)) # Sort by cell, then by Z within each cell
+    sorted_cells = indices[order]
+    sorted_z = np.asarray(z, dtype=np.float64)[order]
+
+    cells, starts, counts = np.unique(sorted_cells, return_index=True, return_counts=True)
+    position = (counts - 1) * (percentile / 100.0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    low_z = sorted_z[starts + lower]
+    high_z = sorted_z[starts + upper]
+    grid[cells] = low_z + (high_z - low_z) * (position - lower)
+    return grid.reshape(rows, cols)
+
+def grid_points(x, y, z, min_x, max_y, resolution, rows, cols, reducer="mean", percentile=50.0):
+    """
+    Grids points into a (rows, cols) raster with a vectorized per-cell reducer.
+
+    Args:
+        x, y, z (array-like): Point coordinates.
+        min_x, max_y (float): Top-left corner of the grid.
+        resolution (float): Cell size in the units of x/y.
+        rows, cols (int): Grid shape.
+        reducer (str): One of GRID_REDUCERS.
+        percentile (float): Percentile of Z (0-100) used when reducer is "percentile".
+
+    Returns:
+        numpy.ndarray: float64 grid with NaN in cells without points (0 for "count").
+    """
+    if reducer not in GRID_REDUCERS:
+        raise ValueError(f"Unknown reducer '{reducer}', expected one of {GRID_REDUCERS}")
+    indices, inside = cell_indices(x, y, min_x, max_y, resolution, rows, cols)
+    z = np.asarray(z, dtype=np.float64)[inside]
+    if reducer == "percentile":
+        return _grid_percentile(indices, z, rows, cols, percentile)
+
+    # Only compute the statistic that was asked for
+    size = rows * cols
+    count = np.bincount(indices, minlength=size)
+    if reducer == "count":
+        return count.astype(np.float64).reshape(rows, cols)
+    if reducer == "mean":
+        grid = np.bincount(indices, weights=z, minlength=size) / np.maximum(count, 1)
+    else:
+        reduce_at = np.minimum if reducer == "min" else np.maximum
+        grid = np.full(size, np.inf if reducer == "min" else -np.inf)
+        reduce_at.at(grid, indices, z)
+    grid[count == 0] = np.nan
+    return grid.reshape(rows, cols)
+
+def stream_cell_statistics(lidar_file_path, resolution=1.0, chunk_size=1_000_000, ground_model=None):
+    """
+    Reads a LAS/LAZ file chunk by chunk and accumulates DEM (all points) and DTM (ground)
+    cell statistics incrementally.
+
+    Only one chunk of `chunk_size` points plus the per-cell statistics are held in memory,
+    so tiles larger than RAM can be gridded. The grid extent comes from the LAS header.
+    Z is accumulated as the raw integer LAS values, which keeps the sums exact and
+    independent of the chunking; see `las_z_grid` for converting the result to Z units.
+
+    Ground points are the class 2 points, unless a `ground_model` (min_grid, ground_cells)
+    from `classify_ground_cells` is given, in which case it classifies the points.
+
+    Returns:
+        tuple: (header, dem_stats, dtm_stats, ground_count)
+    """
+    if ground_model is not None:
+        from lidar_ground_filter import ground_point_mask
+
+    with laspy.open(lidar_file_path) as reader:
+        header = reader.header
+        min_x, min_y = header.mins[0], header.mins[1]
+        max_x, max_y = header.maxs[0], header.maxs[1]
+        rows, cols = grid_shape(min_x, min_y, max_x, max_y, resolution)
+        dem_stats = CellStatistics(rows, cols)
+        dtm_stats = CellStatistics(rows, cols)
+        ground_count = 0
 
-print("LiDAR analysis script for archaeological detection")
-print("---------------------------------------------------")
+        for chunk in reader.chunk_iterator(chunk_size):
+            indices, inside = cell_indices(chunk.x, chunk.y, min_x, max_y, resolution, rows, cols)
+            raw_z = np.asarray(chunk.Z, dtype=np.float64)[inside]
+            if ground_model is None:
+                is_ground = np.asarray(chunk.classification) == 2
+                ground_count += int(np.count_nonzero(is_ground))
+                is_ground = is_ground[inside]
+            else:
+                is_ground = ground_point_mask(indices, np.asarray(chunk.z)[inside], *ground_model)
+                ground_count += int(np.count_nonzero(is_ground))
+            dem_stats.add(indices, raw_z)
+            dtm_stats.add(indices[is_ground], raw_z[is_ground])
 
-def process_lidar_for_archaeology(lidar_file_path, output_dem_path="output_dem.tif", output_dtm_path="output_dtm.tif"):
+    return header, dem_stats, dtm_stats, ground_count
+
+def classify_ground_cells(min_grid, resolution):
+    """
+    Runs the progressive morphological filter on a grid of per-cell minimum Z.
+
+    Returns:
+        tuple: The ground model (min_grid, ground_cells) used by `ground_point_mask`.
+    """
+    from lidar_ground_filter import progressive_morphological_filter
+
+    print("Classifying ground with the progressive morphological filter...")
+    return min_grid, progressive_morphological_filter(min_grid, cell_size=resolution)
+
+def las_z_grid(grid, reducer, header):
+    """
+    Converts a grid reduced from raw integer LAS Z values into Z units using the header scale/offset.
+    """
+    if reducer == "count":
+        return grid
+    return grid * header.scales[2] + header.offsets[2]
+
+# --- GeoTIFF output ---
+
+# Compression codecs accepted by `write_geotiff`.
+GEOTIFF_COMPRESSION = ("deflate", "zstd", "lzw", "none")
+
+# GeoTIFF keys holding the EPSG code of a projected / geographic CRS.
+_PROJECTED_CS_GEOKEY = 3072
+_GEOGRAPHIC_CS_GEOKEY = 2048
+
+def las_crs(header):
+    """
+    Returns the CRS recorded in the VLRs of a LAS header (OGC WKT or GeoTIFF keys), or None.
+    """
+    from rasterio.crs import CRS
+
+    vlrs = list(header.vlrs) + list(header.evlrs or [])
+    for vlr in vlrs:
+        if isinstance(vlr, WktCoordinateSystemVlr) and vlr.string:
+            return CRS.from_wkt(vlr.string)
+    for vlr in vlrs:
+        if isinstance(vlr, GeoKeyDirectoryVlr):
+            keys = {key.id: key for key in vlr.geo_keys}
+            for key_id in (_PROJECTED_CS_GEOKEY, _GEOGRAPHIC_CS_GEOKEY):
+                key = keys.get(key_id)
+                # Codes stored inline; 32767 means user-defined, which cannot be looked up
+                if key is not None and key.tiff_tag_location == 0 and 0 < key.value_offset < 32767:
+                    return CRS.from_epsg(key.value_offset)
+    return None
+
+def write_geotiff(path, grid, transform, crs=None, compress="deflate", float32=False, block_size=256):
+    """
+    Writes a single-band grid as a Cloud Optimized GeoTIFF (COG): internally tiled, compressed
+    with a predictor, and with average-resampled overviews so zoomed-out reads stay cheap.
+
+    Args:
+        path (str): Output path.
+        grid (numpy.ndarray): 2D grid; NaN cells are written as nodata.
+        transform (affine.Affine): Grid transform.
+        crs (rasterio.crs.CRS or str): Coordinate reference system, e.g. from `las_crs`; None to omit.
+        compress (str): One of GEOTIFF_COMPRESSION.
+        float32 (bool): Downcast float64 grids to float32, halving the file size.
+        block_size (int): Internal tile size in pixels.
+    """
+    import rasterio.shutil
+    from rasterio.io import MemoryFile
+
+    if compress not in GEOTIFF_COMPRESSION:
+        raise ValueError(f"Unknown compression '{compress}', expected one of {GEOTIFF_COMPRESSION}")
+    if float32 and grid.dtype == np.float64:
+        grid = grid.astype(np.float32)
+    with MemoryFile() as memfile:
+        with memfile.open(
+            driver='GTiff',
+            height=grid.shape[0],
+            width=grid.shape[1],
+            count=1,
+            dtype=grid.dtype,
+            crs=crs,
+            transform=transform,
+            nodata=np.nan if np.issubdtype(grid.dtype, np.floating) else None,
+        ) as dst:
+            dst.write(grid, 1)
+        with memfile.open() as src:
+            # The COG driver builds the overviews and orders them ahead of the full resolution tiles
+            rasterio.shutil.copy(src, path, driver='COG', COMPRESS=compress.upper(), PREDICTOR='YES',
+                                 BLOCKSIZE=block_size, OVERVIEWS='AUTO', RESAMPLING='AVERAGE',
+                                 BIGTIFF='IF_SAFER', NUM_THREADS='ALL_CPUS')
+
+def process_lidar_for_archaeology(lidar_file_path, output_dem_path="output_dem.tif", output_dtm_path="output_dtm.tif",
+                                  resolution=1.0, reducer="mean", percentile=50.0, chunk_size=None,
+                                  fill_dtm=None, classify_ground=False, compress="deflate", float32=False,
+                                  visualization_path="lidar_dem_dtm_visualization.png", report_path=None,
+                                  profile_dir=None):
     """
     Processes LiDAR data to generate Digital Elevation Models (DEM) and Digital Terrain Models (DTM),
     which are crucial for archaeological prospection.
@@ -23,122 +336,166 @@ def process_lidar_for_archaeology(lidar_file_path, output_dem_path="output_dem.t
         lidar_file_path (str): Path to the input LiDAR file (e.g., .las, .laz).
         output_dem_path (str): Path to save the output Digital Elevation Model (DEM).
         output_dtm_path (str): Path to save the output Digital Terrain Model (DTM).
+        resolution (float): Grid cell size in the units of the LAS coordinates (example: 1 meter).
+        reducer (str): Per-cell statistic of Z, one of GRID_REDUCERS.
+        percentile (float): Percentile of Z (0-100) used when reducer is "percentile".
+        chunk_size (int): If set, stream the file in chunks of this many points instead of
+            reading it into memory (see `stream_cell_statistics`). Not available for "percentile".
+        fill_dtm (str): If set, interpolate the DTM cells without ground points with this method,
+            one of FILL_METHODS (see `lidar_interpolation.fill_dtm_holes`).
+        classify_ground (bool): Classify ground points with the progressive morphological filter
+            (see `lidar_ground_filter`) instead of using the class 2 labels of the file.
+        compress (str): GeoTIFF compression, one of GEOTIFF_COMPRESSION.
+        float32 (bool): Write float32 instead of float64 rasters.
+        visualization_path (str): PNG path of the DEM/DTM preview figure; None skips it.
+        report_path (str): If set, write the run report (per-stage timing, points/sec and peak RSS,
+            see `lidar_profiling`) to this path, as CSV if it ends in `.csv` and as JSON otherwise.
+        profile_dir (str): If set, run every stage under cProfile and dump the profiles here.
+
+    Returns:
+        PipelineProfiler: The per-stage measurements of the run.
+
+    Raises:
+        FileNotFoundError: If the LiDAR file does not exist.
+        ValueError: If an option is not one of its supported values.
     """
-    try:
+    if fill_dtm:
+        from lidar_interpolation import FILL_METHODS, fill_dtm_holes
+
+        if fill_dtm not in FILL_METHODS:
+            raise ValueError(f"Unknown fill method '{fill_dtm}', expected one of {FILL_METHODS}")
+    if compress not in GEOTIFF_COMPRESSION:
+        raise ValueError(f"Unknown compression '{compress}', expected one of {GEOTIFF_COMPRESSION}")
+    if chunk_size and reducer not in CellStatistics.REDUCERS:
+        raise ValueError(f"Reducer '{reducer}' is not supported when streaming, "
+                         f"expected one of {CellStatistics.REDUCERS}")
+    if not os.path.exists(lidar_file_path):
+        raise FileNotFoundError(f"LiDAR file not found at {lidar_file_path}")
+
+    profiler = PipelineProfiler(os.path.splitext(os.path.basename(lidar_file_path))[0], profile_dir=profile_dir)
+    if chunk_size:
+        # 1-3. Stream the LiDAR data and accumulate DEM/DTM cell statistics chunk by chunk
+        print(f"Streaming LiDAR file: {lidar_file_path} ({chunk_size} points per chunk)")
+        with profiler.stage("stream") as stage:
+            header, dem_stats, dtm_stats, ground_count = stream_cell_statistics(
+                lidar_file_path, resolution=resolution, chunk_size=chunk_size)
+            stage["points"] = header.point_count
+        if classify_ground:
+            # A second pass classifies the points against the ground model of the first
+            with profiler.stage("classify_ground", points=header.point_count):
+                ground_model = classify_ground_cells(las_z_grid(dem_stats.reduce("min"), "min", header), resolution)
+                _, _, dtm_stats, ground_count = stream_cell_statistics(
+                    lidar_file_path, resolution=resolution, chunk_size=chunk_size, ground_model=ground_model)
+        min_x, min_y = header.mins[0], header.mins[1]
+        max_x, max_y = header.maxs[0], header.maxs[1]
+        rows, cols = dem_stats.rows, dem_stats.cols
+
+        print(f"Total points: {header.point_count}")
+        print(f"Ground points: {ground_count}")
+        print(f"Creating DEM and DTM with '{reducer}' reducer...")
+        with profiler.stage("reduce"):
+            dem = las_z_grid(dem_stats.reduce(reducer), reducer, header)
+            dtm = las_z_grid(dtm_stats.reduce(reducer), reducer, header)
+    else:
         # 1. Read LiDAR data
         print(f"Reading LiDAR file: {lidar_file_path}")
-        with laspy.read(lidar_file_path) as las:
-            points = np.vstack((las.x, las.y, las.z)).transpose()
-            # Classify ground points (assuming LAS file has classification tags)
-            # Common classification for ground is 2
-            ground_points = points[las.classification == 2]
-            non_ground_points = points[las.classification != 2]
+        with profiler.stage("read") as stage:
+            las = laspy.read(lidar_file_path)
+            header = las.header
+            x, y = np.asarray(las.x), np.asarray(las.y)
+            # Raw integer Z, converted to Z units after gridding (see `las_z_grid`)
+            raw_z = np.asarray(las.Z, dtype=np.float64)
+            stage["points"] = len(x)
+        min_x, min_y = np.min(x), np.min(y)
+        max_x, max_y = np.max(x), np.max(y)
+        rows, cols = grid_shape(min_x, min_y, max_x, max_y, resolution)
+
+        with profiler.stage("classify_ground", points=len(x)):
+            if classify_ground:
+                from lidar_ground_filter import ground_point_mask
+
+                # Classify ground points from the per-cell minimum elevations
+                ground_model = classify_ground_cells(
+                    las_z_grid(grid_points(x, y, raw_z, min_x, max_y, resolution, rows, cols, reducer="min"),
+                               "min", header), resolution)
+                indices, inside = cell_indices(x, y, min_x, max_y, resolution, rows, cols)
+                is_ground = np.zeros(len(x), dtype=bool)
+                is_ground[inside] = ground_point_mask(indices, np.asarray(las.z)[inside], *ground_model)
+            else:
+                # Classify ground points (assuming LAS file has classification tags)
+                # Common classification for ground is 2
+                is_ground = np.asarray(las.classification) == 2
 
-        print(f"Total points: {len(points)}")
-        print(f"Ground points: {len(ground_points)}")
+        print(f"Total points: {len(x)}")
+        print(f"Ground points: {np.count_nonzero(is_ground)}")
 
         # 2. Create Digital Elevation Model (DEM) - includes all features (vegetation, buildings, ground)
-        # For simplicity, we'll use a basic gridding approach. For more advanced DEM creation,
-        # consider libraries like `pyntcloud` or `PDAL` for interpolation.
-        print("Creating Digital Elevation Model (DEM)...")
-        # Determine grid resolution (example: 1 meter resolution)
-        resolution = 1.0
-        min_x, min_y = np.min(points[:, 0]), np.min(points[:, 1])
-        max_x, max_y = np.max(points[:, 0]), np.max(points[:, 1])
-
-        cols = int(np.ceil((max_x - min_x) / resolution))
-        rows = int(np.ceil((max_y - min_y) / resolution))
-
-        dem = np.full((rows, cols), np.nan) # Initialize with NaN
-
-        # Simple gridding: assign average Z to each cell
-        # This is a very basic approach; for real applications, use interpolation methods.
-        for p in points:
-            col = int((p[0] - min_x) / resolution)
-            row = int((max_y - p[1]) / resolution) # Invert row for top-left origin
-            if 0 <= row < rows and 0 <= col < cols:
-                if np.isnan(dem[row, col]):
-                    dem[row, col] = p[2]
-                else:
-                    dem[row, col] = (dem[row, col] + p[2]) / 2 # Average if multiple points fall in cell
+        # Points are binned into cells in bulk and reduced per cell (see `grid_points`).
+        # For more advanced DEM creation, consider interpolation with `pyntcloud` or `PDAL`.
+        print(f"Creating Digital Elevation Model (DEM) with '{reducer}' reducer...")
+        with profiler.stage("grid_dem", points=len(x)):
+            dem = grid_points(x, y, raw_z, min_x, max_y, resolution, rows, cols,
+                              reducer=reducer, percentile=percentile)
+            dem = las_z_grid(dem, reducer, header)
 
         # 3. Create Digital Terrain Model (DTM) - ground surface only
         print("Creating Digital Terrain Model (DTM)...")
-        dtm = np.full((rows, cols), np.nan)
-        for p in ground_points:
-            col = int((p[0] - min_x) / resolution)
-            row = int((max_y - p[1]) / resolution)
-            if 0 <= row < rows and 0 <= col < cols:
-                if np.isnan(dtm[row, col]):
-                    dtm[row, col] = p[2]
-                else:
-                    dtm[row, col] = (dtm[row, col] + p[2]) / 2
-
-        # 4. Save DEM and DTM as GeoTIFF files
-        transform = from_origin(min_x, max_y, resolution, resolution)
-
-        with rasterio.open(
-            output_dem_path,
-            'w',
-            driver='GTiff',
-            height=rows,
-            width=cols,
-            count=1,
-            dtype=dem.dtype,
-            crs='+proj=latlong',
-            transform=transform,
-        ) as dst:
-            dst.write(dem, 1)
-        print(f"DEM saved to: {output_dem_path}")
+        with profiler.stage("grid_dtm", points=int(np.count_nonzero(is_ground))):
+            dtm = grid_points(x[is_ground], y[is_ground], raw_z[is_ground], min_x, max_y, resolution,
+                              rows, cols, reducer=reducer, percentile=percentile)
+            dtm = las_z_grid(dtm, reducer, header)
 
-        with rasterio.open(
-            output_dtm_path,
-            'w',
-            driver='GTiff',
-            height=rows,
-            width=cols,
-            count=1,
-            dtype=dtm.dtype,
-            crs='+proj=latlong',
-            transform=transform,
-        ) as dst:
-            dst.write(dtm, 1)
-        print(f"DTM saved to: {output_dtm_path}")
+    if fill_dtm:
+        # Under dense canopy most cells get no ground point; interpolate them from the known cells
+        print(f"Filling {np.count_nonzero(np.isnan(dtm))} empty DTM cells ({fill_dtm})...")
+        with profiler.stage("fill_dtm"):
+            dtm = fill_dtm_holes(dtm, method=fill_dtm)
 
-        # 5. Optional: Visualization (example using matplotlib)
-        print("Generating visualizations...")
-        fig, axes = plt.subplots(1, 2, figsize=(12, 6))
+    # 4. Save DEM and DTM as GeoTIFF files
+    # Cloud Optimized GeoTIFFs in the CRS of the LAS file (see `write_geotiff`)
+    from rasterio.transform import from_origin
 
-        im1 = axes[0].imshow(dem, cmap='terrain', origin='upper',
-                             extent=[min_x, max_x, min_y, max_y])
-        axes[0].set_title('Digital Elevation Model (DEM)')
-        fig.colorbar(im1, ax=axes[0], label='Elevation (m)')
+    transform = from_origin(min_x, max_y, resolution, resolution)
+    crs = las_crs(header)
+    if crs is None:
+        print("Warning: the LAS file does not declare a CRS; the rasters are written without one.")
 
-        im2 = axes[1].imshow(dtm, cmap='terrain', origin='upper',
-                             extent=[min_x, max_x, min_y, max_y])
-        axes[1].set_title('Digital Terrain Model (DTM)')
-        fig.colorbar(im2, ax=axes[1], label='Elevation (m)')
+    with profiler.stage("write_dem"):
+        write_geotiff(output_dem_path, dem, transform, crs=crs, compress=compress, float32=float32)
+    print(f"DEM saved to: {output_dem_path}")
 
-        plt.tight_layout()
-        plt.savefig("lidar_dem_dtm_visualization.png")
-        print("Visualization saved to: lidar_dem_dtm_visualization.png")
+    with profiler.stage("write_dtm"):
+        write_geotiff(output_dtm_path, dtm, transform, crs=crs, compress=compress, float32=float32)
+    print(f"DTM saved to: {output_dtm_path}")
 
-        print("LiDAR processing complete.")
+    # 5. Optional: Visualization, drawn headless from the raster overviews (see `lidar_visualization`)
+    if visualization_path:
+        from lidar_visualization import render_dem_dtm_preview
+
+        print("Generating visualizations...")
+        with profiler.stage("visualize"):
+            render_dem_dtm_preview(output_dem_path, output_dtm_path, visualization_path)
+        print(f"Visualization saved to: {visualization_path}")
 
-    except FileNotFoundError:
-        print(f"Error: LiDAR file not found at {lidar_file_path}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    print("LiDAR processing complete.")
+    print(profiler.summary())
+    if report_path:
+        profiler.write_report(report_path)
+        print(f"Run report saved to: {report_path}")
+    return profiler
 
 # --- How to use this script ---
 # 1. Replace 'path/to/your/lidar_data.las' with the actual path to your LiDAR file.
 # 2. Ensure you have the necessary Python libraries installed: laspy, numpy, matplotlib, rasterio.
 # 3. Run the script: python lidar_archaeology.py
 
-# Example usage (uncomment and modify with your file path):
+# Example usage (uncomment and modify with your file path), or `python archaeology_cli.py grid <file>`:
 # process_lidar_for_archaeology('path/to/your/lidar_data.las')
 
-print("LiDAR script created. This script provides a basic framework. For real-world archaeological applications, you might need more sophisticated interpolation methods, filtering, and analysis techniques (e.g., hillshading, slope analysis, curvature analysis on DTMs to highlight subtle features).")
-print("Remember to replace 'path/to/your/lidar_data.las' with your actual LiDAR data file path and install the required libraries.")
+if __name__ == "__main__":
+    print("LiDAR analysis script for archaeological detection")
+    print("---------------------------------------------------")
+    print("LiDAR script created. This script provides a basic framework. To highlight subtle features, run the DTM through lidar_terrain_derivatives.py (hillshade, slope, curvature, sky-view factor, openness, local relief model).")
+    print("Remember to replace 'path/to/your/lidar_data.las' with your actual LiDAR data file path and install the required libraries.")
 
 
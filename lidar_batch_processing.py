@@ -0,0 +1,359 @@
+# Python script for batch processing of LiDAR tile collections in archaeology
+
+# Survey campaigns deliver hundreds of LAS/LAZ tiles per block. This script lays all tiles
+# of a block out on one common grid, grids them in parallel on all cores and writes one
+# DEM/DTM GeoTIFF per tile plus a VRT mosaic of each, built on the gridding engine in
+# lidar_archaeology.py.
+#
+# The work runs in two parallel passes:
+# 1. every worker streams one tile and accumulates its DEM/DTM cell statistics, unless they
+#    are already in the cell statistics cache (see lidar_tile_cache.py);
+# 2. every worker merges its tile's statistics with those of its neighbours over the tile
+#    window plus an overlap buffer, so cells on tile edges see the points of every tile
+#    that touches them, and writes the DEM/DTM tile.
+#
+# Ground points are the class 2 points of the tiles, or, with `classify_ground`, those found
+# by the progressive morphological filter of lidar_ground_filter.py run on each tile.
+
+import contextlib
+import glob
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+import laspy
+import numpy as np
+from rasterio.transform import from_origin
+
+from lidar_archaeology import (GEOTIFF_COMPRESSION, CellStatistics, cell_indices, classify_ground_cells, las_crs,
+                               write_geotiff)
+from lidar_ground_filter import ground_point_mask
+from lidar_interpolation import FILL_METHODS, fill_dtm_holes
+from lidar_tile_cache import CellStatisticsCache
+
+# File extensions picked up when a directory or glob pattern is given.
+LIDAR_EXTENSIONS = (".las", ".laz")
+
+# --- Tile discovery and layout ---
+
+def find_lidar_tiles(tiles):
+    """
+    Resolves a directory, a glob pattern or an iterable of paths to a sorted list of LAS/LAZ files.
+    """
+    if isinstance(tiles, (str, os.PathLike)):
+        tiles = os.fspath(tiles)
+        if os.path.isdir(tiles):
+            paths = [os.path.join(tiles, name) for name in os.listdir(tiles)]
+        else:
+            paths = glob.glob(tiles)
+    else:
+        paths = [os.fspath(path) for path in tiles]
+    return sorted(path for path in paths if path.lower().endswith(LIDAR_EXTENSIONS))
+
+def plan_tiles(tile_paths, resolution=1.0):
+    """
+    Reads the tile headers and places every tile on a common grid covering the whole collection.
+
+    Cell edges fall on multiples of `resolution`, so the cells of a tile do not depend on which
+    other tiles are in the collection; this is what lets `CellStatisticsCache` reuse them.
+
+    Returns:
+        tuple: (grid, tiles) where `grid` holds the grid origin, shape, resolution and CRS and each
+        entry of `tiles` holds the tile path, name, (row, col, rows, cols) window on the grid and
+        the same window in absolute cell indices (`lattice`).
+    """
+    tiles = []
+    crs = None
+    for path in tile_paths:
+        with laspy.open(path) as reader:
+            header = reader.header
+            crs = crs or las_crs(header)
+            # Absolute cell indices: columns count from x = 0 eastwards, rows from y = 0 southwards
+            col, last_col = int(np.floor(header.mins[0] / resolution)), int(np.floor(header.maxs[0] / resolution))
+            row, last_row = int(np.floor(-header.maxs[1] / resolution)), int(np.floor(-header.mins[1] / resolution))
+        tiles.append({
+            "path": path,
+            "name": os.path.splitext(os.path.basename(path))[0],
+            "lattice": (row, col, last_row - row + 1, last_col - col + 1),
+        })
+
+    top = min(tile["lattice"][0] for tile in tiles)
+    left = min(tile["lattice"][1] for tile in tiles)
+    bottom = max(tile["lattice"][0] + tile["lattice"][2] for tile in tiles)
+    right = max(tile["lattice"][1] + tile["lattice"][3] for tile in tiles)
+    grid = {"min_x": left * resolution, "max_y": -top * resolution, "rows": bottom - top, "cols": right - left,
+            "resolution": resolution, "crs": crs.to_wkt() if crs else None}
+    for tile in tiles:
+        row, col, rows, cols = tile["lattice"]
+        tile["window"] = (row - top, col - left, rows, cols)
+    return grid, tiles
+
+def _expand_window(window, buffer_cells, grid):
+    row, col, rows, cols = window
+    top, left = max(row - buffer_cells, 0), max(col - buffer_cells, 0)
+    bottom = min(row + rows + buffer_cells, grid["rows"])
+    right = min(col + cols + buffer_cells, grid["cols"])
+    return top, left, bottom - top, right - left
+
+def _windows_overlap(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+# --- Workers (run in the process pool) ---
+
+def _tile_points(task):
+    """
+    Streams one tile; yields the cell indices, Z and classification of the points within its window
+    and the number of points read, chunk by chunk.
+    """
+    resolution = task["resolution"]
+    row, col, rows, cols = task["lattice"]
+    with laspy.open(task["path"]) as reader:
+        for chunk in reader.chunk_iterator(task["chunk_size"]):
+            # Index relative to the tile's own corner, so the result does not depend on the collection
+            indices, inside = cell_indices(chunk.x, chunk.y, col * resolution, -row * resolution, resolution,
+                                           rows, cols)
+            # Tiles may use different scales/offsets, so accumulate Z in real units here
+            yield indices, np.asarray(chunk.z)[inside], np.asarray(chunk.classification)[inside], len(chunk)
+
+def _accumulate_tile(task):
+    """
+    Pass 1: streams one tile and saves its DEM/DTM cell statistics over the tile window.
+    """
+    start = time.perf_counter()
+    rows, cols = task["lattice"][2:]
+    dem_stats = CellStatistics(rows, cols)
+    dtm_stats = CellStatistics(rows, cols)
+    n_points = 0
+
+    if task["classify_ground"]:
+        # The ground filter runs on the per-cell minimum of the whole tile, so the tile is read twice
+        for indices, z, _, n in _tile_points(task):
+            dem_stats.add(indices, z)
+            n_points += n
+        ground_model = classify_ground_cells(dem_stats.reduce("min"), task["resolution"])
+        for indices, z, _, _ in _tile_points(task):
+            is_ground = ground_point_mask(indices, z, *ground_model)
+            dtm_stats.add(indices[is_ground], z[is_ground])
+    else:
+        for indices, z, classification, n in _tile_points(task):
+            is_ground = classification == 2
+            dem_stats.add(indices, z)
+            dtm_stats.add(indices[is_ground], z[is_ground])
+            n_points += n
+
+    dem_stats.save(task["stats_dir"], "dem")
+    dtm_stats.save(task["stats_dir"], "dtm")
+    return {"points": n_points, "grid_seconds": time.perf_counter() - start}
+
+def _write_tile(task):
+    """
+    Pass 2: merges the statistics of every tile overlapping the buffered window and writes the DEM/DTM tile.
+    """
+    start = time.perf_counter()
+    grid = task["grid"]
+    resolution = grid["resolution"]
+    row, col, rows, cols = task["write_window"]
+    transform = from_origin(grid["min_x"] + col * resolution, grid["max_y"] - row * resolution,
+                            resolution, resolution)
+
+    for product in ("dem", "dtm"):
+        stats = CellStatistics(rows, cols)
+        for source in task["sources"]:
+            source_stats = CellStatistics.load(source["stats_dir"], product, mmap_mode="r")
+            stats.merge(source_stats, row_offset=source["window"][0] - row, col_offset=source["window"][1] - col)
+        grid_values = stats.reduce(task["reducer"])
+        if product == "dtm" and task["fill_dtm"]:
+            # Keeping the search radius within the overlap buffer makes IDW-filled tiles agree at their edges
+            grid_values = fill_dtm_holes(grid_values, method=task["fill_dtm"], search_radius=task["buffer_cells"],
+                                         max_workers=1)
+        write_geotiff(task["outputs"][product], grid_values, transform, crs=grid["crs"], compress=task["compress"],
+                      float32=task["float32"])
+    return {"write_seconds": time.perf_counter() - start}
+
+# --- Mosaic ---
+
+def build_vrt(vrt_path, grid, tiles, product, data_type="Float64"):
+    """
+    Writes a GDAL VRT mosaic of the `product` ("dem" or "dtm") GeoTIFF tiles over the full grid.
+
+    Only the given tiles are referenced, never other GeoTIFFs in the directory, and only the core
+    window of each, so the overlap buffers do not double up.
+    """
+    resolution = grid["resolution"]
+    vrt_dir = os.path.dirname(os.path.abspath(vrt_path))
+    sources = []
+    for tile in tiles:
+        row, col, rows, cols = tile["window"]
+        write_row, write_col = tile["write_window"][:2]
+        source_path = os.path.relpath(os.path.abspath(tile["outputs"][product]), vrt_dir)
+        sources.append(f"""    <SimpleSource>
+      <SourceFilename relativeToVRT="1">{escape(source_path)}</SourceFilename>
+      <SourceBand>1</SourceBand>
+      <SrcRect xOff="{col - write_col}" yOff="{row - write_row}" xSize="{cols}" ySize="{rows}" />
+      <DstRect xOff="{col}" yOff="{row}" xSize="{cols}" ySize="{rows}" />
+    </SimpleSource>""")
+
+    srs = f"  <SRS>{escape(grid['crs'])}</SRS>\n" if grid["crs"] else ""
+    geotransform = f"{grid['min_x']!r}, {resolution!r}, 0.0, {grid['max_y']!r}, 0.0, {-resolution!r}"
+    with open(vrt_path, "w") as vrt:
+        vrt.write(f"""<VRTDataset rasterXSize="{grid['cols']}" rasterYSize="{grid['rows']}">
+{srs}  <GeoTransform>{geotransform}</GeoTransform>
+  <VRTRasterBand dataType="{data_type}" band="1">
+    <NoDataValue>nan</NoDataValue>
+{chr(10).join(sources)}
+  </VRTRasterBand>
+</VRTDataset>
+""")
+    return vrt_path
+
+# --- Batch entry point ---
+
+def process_lidar_collection(tiles, output_dir="lidar_tiles", resolution=1.0, reducer="mean", buffer_cells=32,
+                             chunk_size=1_000_000, max_workers=None, fill_dtm=None, classify_ground=False,
+                             compress="deflate", float32=False, cache_dir=None, cache_max_bytes=20 * 2**30):
+    """
+    Grids a collection of LiDAR tiles into per-tile DEM/DTM GeoTIFFs in parallel and mosaics them.
+
+    With a `cache_dir`, the cell statistics of every tile are kept between runs (see
+    `lidar_tile_cache.CellStatisticsCache`): only new or changed tiles are gridded, and only
+    tiles whose inputs or output options changed are written again before re-mosaicking.
+    The outputs of tiles that were in the previous run but are no longer in the collection
+    are deleted.
+
+    Args:
+        tiles (str or list): Directory, glob pattern (e.g. "survey/*.laz") or list of LAS/LAZ paths.
+        output_dir (str): Directory for the DEM/DTM tiles and the `dem.vrt`/`dtm.vrt` mosaics.
+        resolution (float): Grid cell size in the units of the LAS coordinates.
+        reducer (str): Per-cell statistic of Z, one of CellStatistics.REDUCERS.
+        buffer_cells (int): Cells of overlap written around each tile, filled from neighbouring tiles.
+            Also the search radius of the DTM fill, so IDW-filled tiles agree at their edges.
+        chunk_size (int): Points read per chunk by each worker.
+        max_workers (int): Worker processes; defaults to the number of CPUs.
+        fill_dtm (str): If set, interpolate empty DTM cells with this method, one of FILL_METHODS.
+        classify_ground (bool): Classify the ground points of every tile with the progressive
+            morphological filter (see `lidar_ground_filter`) instead of using their class 2 labels.
+        compress (str): GeoTIFF compression of the tiles, one of GEOTIFF_COMPRESSION.
+        float32 (bool): Write float32 instead of float64 tiles.
+        cache_dir (str): Directory of the persistent cell statistics cache; None to use a temporary one.
+        cache_max_bytes (int): Size limit of the cache; least recently used tiles are evicted first.
+
+    Returns:
+        list: One report per tile with the point count, timings, cache use and output paths.
+    """
+    if reducer not in CellStatistics.REDUCERS:
+        raise ValueError(f"Reducer '{reducer}' is not supported for tile collections, "
+                         f"expected one of {CellStatistics.REDUCERS}")
+    if fill_dtm and fill_dtm not in FILL_METHODS:
+        raise ValueError(f"Unknown fill method '{fill_dtm}', expected one of {FILL_METHODS}")
+    if compress not in GEOTIFF_COMPRESSION:
+        raise ValueError(f"Unknown compression '{compress}', expected one of {GEOTIFF_COMPRESSION}")
+    tile_paths = find_lidar_tiles(tiles)
+    if not tile_paths:
+        raise FileNotFoundError(f"No LAS/LAZ tiles found in {tiles}")
+
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    grid, planned = plan_tiles(tile_paths, resolution)
+    print(f"Processing {len(planned)} LiDAR tiles on a {grid['rows']} x {grid['cols']} grid...")
+
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    with contextlib.ExitStack() as stack:
+        pool = stack.enter_context(ProcessPoolExecutor(max_workers))
+        if cache_dir:
+            cache = CellStatisticsCache(cache_dir, max_bytes=cache_max_bytes)
+            params = {"resolution": resolution}
+            if classify_ground:
+                params["ground"] = "progressive_morphological_filter"
+            keys = cache.tile_keys(tile_paths, params, map_func=pool.map)
+        else:
+            cache = CellStatisticsCache(stack.enter_context(tempfile.TemporaryDirectory(dir=output_dir)),
+                                        max_bytes=float("inf"))
+            keys = [f"tile-{index}" for index in range(len(planned))]
+
+        # Pass 1: grid the tiles that are not in the cache yet
+        pending = []
+        for tile, key in zip(planned, keys):
+            tile.update(key=key, stats_dir=cache.entry_dir(key))
+            meta = cache.get(key)
+            if meta:
+                tile.update(points=meta["points"], grid_seconds=0.0, cached=True)
+            else:
+                pending.append(tile)
+        accumulate_tasks = [{"path": tile["path"], "lattice": tile["lattice"], "resolution": resolution,
+                             "chunk_size": chunk_size, "classify_ground": classify_ground,
+                             "stats_dir": cache.staging_dir()} for tile in pending]
+        for tile, task, result in zip(pending, accumulate_tasks, pool.map(_accumulate_tile, accumulate_tasks)):
+            cache.commit(tile["key"], task["stats_dir"], {"tile": tile["path"], "points": result["points"]})
+            tile.update(result, cached=False)
+        print(f"Gridded {len(pending)} tiles, reused {len(planned) - len(pending)} from the cache")
+
+        # Pass 2: write the tiles whose statistics or output options changed
+        write_tiles, write_tasks = [], []
+        for tile in planned:
+            tile["write_window"] = _expand_window(tile["window"], buffer_cells, grid)
+            sources = [{"stats_dir": other["stats_dir"], "window": other["window"], "key": other["key"]}
+                       for other in planned if _windows_overlap(tile["write_window"], other["window"])]
+            tile["outputs"] = {product: os.path.join(output_dir, f"{tile['name']}_{product}.tif")
+                               for product in ("dem", "dtm")}
+            # Everything the written tile depends on, in its JSON form for comparison with the manifest
+            tile["signature"] = json.loads(json.dumps({
+                "sources": sorted((source["key"], source["window"]) for source in sources),
+                "grid": [grid["min_x"], grid["max_y"], resolution, grid["crs"]],
+                "write_window": tile["write_window"], "reducer": reducer, "fill_dtm": fill_dtm,
+                "buffer_cells": buffer_cells, "compress": compress, "float32": float32,
+            }))
+            # Without a cache the statistics keys are per run, so every tile is written
+            if (cache_dir and manifest.get(tile["name"]) == tile["signature"]
+                    and all(map(os.path.exists, tile["outputs"].values()))):
+                tile["write_seconds"] = 0.0
+                continue
+            write_tiles.append(tile)
+            write_tasks.append({"grid": grid, "write_window": tile["write_window"], "sources": sources,
+                                "reducer": reducer, "fill_dtm": fill_dtm, "buffer_cells": buffer_cells,
+                                "compress": compress, "float32": float32, "outputs": tile["outputs"]})
+        for tile, result in zip(write_tiles, pool.map(_write_tile, write_tasks)):
+            tile.update(result)
+        print(f"Wrote {len(write_tiles)} tiles, {len(planned) - len(write_tiles)} were up to date")
+
+        # Delete the outputs of tiles removed from the collection since the last run
+        removed = set(manifest) - {tile["name"] for tile in planned}
+        for name in removed:
+            for product in ("dem", "dtm"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(output_dir, f"{name}_{product}.tif"))
+        if removed:
+            print(f"Removed the outputs of {len(removed)} tiles no longer in the collection")
+        with open(manifest_path, "w") as f:
+            json.dump({tile["name"]: tile["signature"] for tile in planned}, f)
+
+        if cache_dir:
+            evicted = cache.evict(keep=keys)
+            if evicted:
+                print(f"Evicted {len(evicted)} tiles from the cell statistics cache")
+
+    for product in ("dem", "dtm"):
+        vrt_path = build_vrt(os.path.join(output_dir, f"{product}.vrt"), grid, planned, product,
+                             data_type="Float32" if float32 else "Float64")
+        print(f"{product.upper()} mosaic saved to: {vrt_path}")
+
+    print("Per-tile timing:")
+    for tile in planned:
+        print(f"  {tile['name']}: {tile['points']} points, gridding {tile['grid_seconds']:.2f} s"
+              f"{' (cached)' if tile['cached'] else ''}, writing {tile['write_seconds']:.2f} s")
+    print(f"Processed {len(planned)} tiles in {time.perf_counter() - start:.2f} s")
+
+    return [{"tile": tile["path"], "points": tile["points"], "grid_seconds": tile["grid_seconds"],
+             "write_seconds": tile["write_seconds"], "cached": tile["cached"], "outputs": tile["outputs"]}
+            for tile in planned]
+
+# Example usage (uncomment and modify with your survey directory):
+# if __name__ == "__main__":
+#     process_lidar_collection('path/to/survey_block/', output_dir='survey_block_grids')
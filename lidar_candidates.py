@@ -0,0 +1,318 @@
+# Python script for extracting candidate sites from LiDAR relief rasters and checking them
+# against the site records of Arches and OpenAtlas
+
+# The rasters of lidar_archaeology.py and lidar_terrain_derivatives.py show where the ground
+# has mounds or ditches; the records handled by arches_data_management.py and
+# openatlas_data_management.py say which of them are already known. This script connects both:
+#
+# - `extract_candidates` segments local relief anomalies (cells above or below a threshold in
+#   the local relief model, or in a DTM whose LRM is computed on the fly) into connected
+#   regions and polygonizes them, block by block in a process pool;
+# - `cross_reference` joins the candidate polygons against the site geometries through one
+#   in-memory STRtree, with a single vectorized query, and tags every candidate as "new" or
+#   "recorded";
+# - `write_candidates_geojson` writes the result in longitude/latitude, ready for
+#   `arches_data_management.ingest_sites`.
+#
+# Blocks are read with a halo of `max_size` cells. A region is kept by the block containing
+# the top-left corner of its bounding box, so every region is extracted exactly once; regions
+# wider than the halo are skipped, which also drops large natural terrain features.
+
+import hashlib
+import json
+
+import numpy as np
+import rasterio
+import shapely
+from rasterio import features
+from rasterio.warp import transform as transform_coordinates
+from rasterio.windows import Window, transform as window_transform
+from scipy import ndimage
+from shapely.geometry import shape
+
+from lidar_terrain_derivatives import local_relief_model
+from raster_blocks import block_windows, map_windows, read_padded_window
+
+# Anomaly polarities `extract_candidates` can segment: raised (mounds, banks), sunken (ditches, pits) or both.
+POLARITIES = ("positive", "negative", "both")
+
+# Tags `cross_reference` gives candidates.
+CANDIDATE_STATUSES = ("new", "recorded")
+
+# --- Candidate extraction ---
+
+def _candidates_block(task):
+    """
+    Segments and polygonizes the anomalies owned by one block (run in the process pool).
+
+    Returns:
+        tuple: (WKB polygons, areas, max |relief|, mean relief) of the kept regions.
+    """
+    window, halo = task["window"], task["halo"]
+    with rasterio.open(task["raster_path"]) as src:
+        values = read_padded_window(src, window, halo)
+        transform = window_transform(Window(window.col_off - halo, window.row_off - halo,
+                                            window.width + 2 * halo, window.height + 2 * halo), src.transform)
+        cell_area = abs(src.res[0] * src.res[1])
+    if task["lrm_radius"]:
+        values = local_relief_model(values, radius=task["lrm_radius"])
+    threshold, polarity = task["threshold"], task["polarity"]
+    with np.errstate(invalid="ignore"): # NaN compares as False
+        if polarity == "positive":
+            mask = values > threshold
+        elif polarity == "negative":
+            mask = values < -threshold
+        else:
+            mask = np.abs(values) > threshold
+    labels, count = ndimage.label(mask, structure=np.ones((3, 3), dtype=bool))
+    empty = ([], np.empty(0), np.empty(0), np.empty(0))
+    if not count:
+        return empty
+
+    # Keep regions whose bounding box starts in the core and does not reach the block edge
+    rows, cols = labels.shape
+    keep = np.zeros(count + 1, dtype=bool)
+    for label, (row_slice, col_slice) in enumerate(ndimage.find_objects(labels), start=1):
+        keep[label] = (halo <= row_slice.start < rows - halo and halo <= col_slice.start < cols - halo
+                       and row_slice.stop < rows and col_slice.stop < cols)
+    index = np.arange(1, count + 1)
+    areas = ndimage.sum_labels(mask, labels, index) * cell_area
+    keep[1:] &= (areas >= task["min_area"])
+    if task["max_area"]:
+        keep[1:] &= (areas <= task["max_area"])
+    kept = np.flatnonzero(keep)
+    if not len(kept):
+        return empty
+
+    kept_labels = np.where(keep[labels], labels, 0).astype(np.int32)
+    polygons = {}
+    for geometry, label in features.shapes(kept_labels, mask=kept_labels > 0, transform=transform, connectivity=8):
+        polygons.setdefault(int(label), []).append(shape(geometry))
+    geometries = [polygons[label][0] if len(polygons[label]) == 1 else shapely.MultiPolygon(polygons[label])
+                  for label in kept]
+    max_relief = ndimage.maximum(np.abs(np.nan_to_num(values)), labels, kept)
+    mean_relief = ndimage.mean(np.nan_to_num(values), labels, kept)
+    return shapely.to_wkb(geometries), areas[kept - 1], np.asarray(max_relief), np.asarray(mean_relief)
+
+def extract_candidates(raster_path, threshold=0.3, polarity="positive", min_area=4.0, max_area=None, max_size=64,
+                       lrm_radius=None, block_size=2048, max_workers=None):
+    """
+    Segments local relief anomalies of a raster into candidate polygons.
+
+    Args:
+        raster_path (str): Local relief model (e.g. `lrm.tif` of `compute_terrain_derivatives`), or a DTM
+            together with `lrm_radius`.
+        threshold (float): Relief above which (or below minus which) a cell is anomalous, in raster units.
+        polarity (str): "positive" (mounds, banks), "negative" (ditches, pits) or "both".
+        min_area (float): Smallest candidate kept, in square raster units.
+        max_area (float): Largest candidate kept; None for no limit.
+        max_size (int): Widest candidate extracted, in cells (also the block halo).
+        lrm_radius (int): If set, `raster_path` is a DTM and its LRM with this radius is segmented.
+        block_size (int): Side of the square blocks processed at once, in cells.
+        max_workers (int): Worker processes; defaults to the number of CPUs.
+
+    Returns:
+        dict: "geometry" (array of shapely polygons), "area", "max_relief" and "mean_relief" arrays,
+        one entry per candidate, and the raster "crs".
+    """
+    if polarity not in POLARITIES:
+        raise ValueError(f"Unknown polarity '{polarity}', expected one of {POLARITIES}")
+    with rasterio.open(raster_path) as src:
+        crs = src.crs
+        windows = block_windows(src.width, src.height, block_size)
+    halo = max_size + (lrm_radius or 0)
+    tasks = [{"raster_path": raster_path, "window": window, "halo": halo, "threshold": threshold,
+              "polarity": polarity, "min_area": min_area, "max_area": max_area, "lrm_radius": lrm_radius}
+             for window in windows]
+
+    print(f"Extracting {polarity} relief anomalies above {threshold} from {raster_path} ({len(windows)} blocks)...")
+    parts = list(map_windows(_candidates_block, tasks, max_workers))
+    candidates = {
+        "geometry": shapely.from_wkb(np.concatenate([np.asarray(part[0], dtype=object) for part in parts])),
+        "area": np.concatenate([part[1] for part in parts]),
+        "max_relief": np.concatenate([part[2] for part in parts]),
+        "mean_relief": np.concatenate([part[3] for part in parts]),
+        "crs": crs,
+    }
+    print(f"Extracted {len(candidates['geometry'])} candidates")
+    return candidates
+
+# --- Site records ---
+
+def _geojson_geometry(value):
+    """
+    Returns the GeoJSON geometry in a value (a geometry, a feature or a feature collection), or None.
+    """
+    if not isinstance(value, dict):
+        return None
+    if value.get("type") == "FeatureCollection":
+        geometries = [feature.get("geometry") for feature in value.get("features", []) if feature.get("geometry")]
+        if not geometries:
+            return None
+        return geometries[0] if len(geometries) == 1 else {"type": "GeometryCollection", "geometries": geometries}
+    if value.get("type") == "Feature":
+        return value.get("geometry")
+    if "coordinates" in value or value.get("type") == "GeometryCollection":
+        return value
+    return None
+
+def arches_site_records(resources, geometry_node=None):
+    """
+    Converts Arches resources (e.g. from `ArchesClient.iter_resources`) into site records.
+
+    Args:
+        resources: Iterable of resource dicts.
+        geometry_node (str): Node ID holding the geometry; defaults to the first GeoJSON value in the data.
+
+    Returns:
+        list: {"source", "id", "label", "geometry"} dicts of the resources with a geometry.
+    """
+    records = []
+    for resource in resources:
+        data = resource.get("data") or {}
+        values = [data.get(geometry_node)] if geometry_node else data.values()
+        geometry = next((g for g in map(_geojson_geometry, values) if g), None)
+        if geometry:
+            records.append({"source": "arches", "id": resource.get("resourceinstanceid"),
+                            "label": resource.get("displayname"), "geometry": geometry})
+    return records
+
+def openatlas_site_records(entities):
+    """
+    Converts OpenAtlas entities (API dicts, or rows of `OpenAtlasMirror.bbox`) into site records.
+    """
+    from openatlas_mirror import entity_geometry # Also parses WKT geometries
+
+    records = []
+    for entity in entities:
+        geometry = entity_geometry(entity)
+        if geometry:
+            records.append({"source": "openatlas", "id": entity.get("id"), "label": entity.get("label"),
+                            "geometry": geometry})
+    return records
+
+def record_geometries(records):
+    """
+    Returns the geometries of site records as an array of shapely geometries.
+
+    Points, by far the most common site geometry, are built in one vectorized call.
+    """
+    geometries = np.empty(len(records), dtype=object)
+    point_index, point_coordinates = [], []
+    for i, record in enumerate(records):
+        geometry = record["geometry"]
+        if geometry["type"] == "Point":
+            point_index.append(i)
+            point_coordinates.append(geometry["coordinates"][:2])
+        else:
+            geometries[i] = shape(geometry)
+    if point_index:
+        geometries[point_index] = shapely.points(np.asarray(point_coordinates, dtype=np.float64))
+    return geometries
+
+def _reproject(geometries, src_crs, dst_crs):
+    """
+    Reprojects an array of shapely geometries, transforming all their coordinates in one call.
+    """
+    if rasterio.crs.CRS.from_user_input(src_crs) == dst_crs:
+        return geometries
+
+    def transform_xy(xy):
+        xs, ys = transform_coordinates(src_crs, dst_crs, xy[:, 0], xy[:, 1])
+        return np.column_stack([xs, ys])
+
+    return shapely.transform(geometries, transform_xy)
+
+def candidate_id(geometry):
+    """
+    Returns a stable ID for a candidate polygon: a hash of its WKB in the raster CRS, with the
+    coordinates rounded to 1e-6, so re-running the extraction gives the same IDs whatever the
+    block size or the order of the candidates.
+    """
+    rounded = shapely.transform(geometry, lambda xy: np.round(xy, 6))
+    return f"candidate-{hashlib.sha1(shapely.to_wkb(rounded, output_dimension=2)).hexdigest()[:16]}"
+
+# --- Cross-referencing ---
+
+def cross_reference(candidates, records, records_crs="EPSG:4326", distance=0.0):
+    """
+    Tags every candidate as "new" or "recorded" by joining it against site records.
+
+    The larger of the two sets goes into one STRtree, queried once with all geometries of the other.
+
+    Args:
+        candidates (dict): Output of `extract_candidates` (at least "geometry" and "crs").
+        records (list): Site records from `arches_site_records` / `openatlas_site_records`.
+        records_crs: CRS of the record geometries (longitude/latitude for both platforms). Raises
+            ValueError if it or the candidate CRS is None, as the geometries could not be compared.
+        distance (float): A candidate within this distance of a record (in candidate CRS units) counts
+            as recorded; 0 requires the geometries to intersect.
+
+    Returns:
+        dict: "status" ("new"/"recorded" per candidate), "recorded" (bool per candidate), and the
+        matching "candidate_index"/"record_index" pairs, sorted by candidate.
+    """
+    if candidates["crs"] is None:
+        raise ValueError("The candidates have no CRS; assign one to the raster they were extracted from")
+    if records_crs is None:
+        raise ValueError("records_crs is required to compare the records with the candidates")
+    sites = _reproject(record_geometries(records), records_crs, candidates["crs"])
+    # Both predicates are symmetric, and querying with the smaller set is the faster way round
+    swap = len(candidates["geometry"]) > len(sites)
+    indexed, queries = (candidates["geometry"], sites) if swap else (sites, candidates["geometry"])
+    tree = shapely.STRtree(indexed)
+    if distance > 0:
+        pairs = tree.query(queries, predicate="dwithin", distance=distance)
+    else:
+        pairs = tree.query(queries, predicate="intersects")
+    if swap:
+        pairs = pairs[::-1]
+    order = np.lexsort((pairs[1], pairs[0]))
+    recorded = np.zeros(len(candidates["geometry"]), dtype=bool)
+    recorded[pairs[0]] = True
+    print(f"{recorded.sum()} of {len(recorded)} candidates match one of {len(records)} site records")
+    return {"status": np.where(recorded, "recorded", "new"), "recorded": recorded,
+            "candidate_index": pairs[0][order], "record_index": pairs[1][order]}
+
+def write_candidates_geojson(path, candidates, matches=None, records=None, only_new=False):
+    """
+    Writes candidates as a GeoJSON feature collection in longitude/latitude.
+
+    Each feature has a "candidate_id" (see `candidate_id`), its area and relief, and with `matches`
+    its "status" and the IDs of the matching `records` as "recorded_as" ("<source>:<id>").
+    """
+    if candidates["crs"] is None:
+        raise ValueError("The candidates have no CRS; assign one to the raster they were extracted from")
+    geometries = _reproject(candidates["geometry"], candidates["crs"], "EPSG:4326")
+    matched = {}
+    if matches is not None:
+        for candidate, record in zip(matches["candidate_index"].tolist(), matches["record_index"].tolist()):
+            matched.setdefault(candidate, []).append(f"{records[record]['source']}:{records[record]['id']}"
+                                                     if records else record)
+    features_out = []
+    for i, geometry in enumerate(geometries):
+        if only_new and matches is not None and matches["recorded"][i]:
+            continue
+        properties = {"candidate_id": candidate_id(candidates["geometry"][i]), "area": float(candidates["area"][i]),
+                      "max_relief": float(candidates["max_relief"][i]),
+                      "mean_relief": float(candidates["mean_relief"][i])}
+        if matches is not None:
+            properties.update(status=str(matches["status"][i]), recorded_as=matched.get(i, []))
+        features_out.append({"type": "Feature", "geometry": json.loads(shapely.to_geojson(geometry)),
+                             "properties": properties})
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features_out}, f)
+    print(f"{len(features_out)} candidates saved to: {path}")
+    return path
+
+# Example usage (uncomment and modify with your paths and instances):
+# if __name__ == "__main__":
+#     from arches_data_management import ArchesClient
+#     from openatlas_mirror import OpenAtlasMirror
+#     candidates = extract_candidates('terrain_derivatives/lrm.tif', threshold=0.3, polarity='both')
+#     with ArchesClient() as client:
+#         records = arches_site_records(client.iter_resources('<UUID_OF_YOUR_SITE_GRAPH>'))
+#     with OpenAtlasMirror('openatlas_mirror.sqlite') as mirror:
+#         records += openatlas_site_records(mirror.entities_in_raster('terrain_derivatives/lrm.tif'))
+#     matches = cross_reference(candidates, records, distance=10.0)
+#     write_candidates_geojson('lidar_candidates.geojson', candidates, matches, records, only_new=True)
@@ -0,0 +1,78 @@
+# Python script for classifying ground points in unclassified LiDAR data
+
+# Many legacy surveys come without class 2 (ground) labels, which leaves the DTM built by
+# lidar_archaeology.py empty. This script implements a progressive morphological filter
+# (PMF, Zhang et al. 2003) on the grid of per-cell minimum elevations, so ground can be
+# classified with vectorized NumPy/SciPy operations instead of installing PDAL:
+#
+# 1. grid the lowest point of every cell and fill empty cells from their nearest neighbour;
+# 2. apply morphological openings with growing windows (3, 5, 9, 17... cells); a cell whose
+#    elevation drops by more than a slope-dependent threshold is an object (trees, buildings);
+# 3. points within `height_threshold` of the minimum of a ground cell are ground.
+#
+# Steps 1-2 only need the minimum grid, so the filter also works on streamed tiles.
+
+import numpy as np
+from scipy import ndimage
+
+def fill_empty_cells(grid):
+    """
+    Returns a copy of `grid` with every NaN cell set to the value of its nearest non-NaN cell.
+    """
+    empty = np.isnan(grid)
+    if not empty.any() or empty.all():
+        return grid.copy()
+    nearest = ndimage.distance_transform_edt(empty, return_distances=False, return_indices=True)
+    return grid[tuple(nearest)]
+
+def progressive_morphological_filter(min_grid, cell_size=1.0, max_window=33.0, slope=0.15,
+                                     initial_distance=0.5, max_distance=3.0):
+    """
+    Classifies the cells of a minimum-elevation grid into ground and non-ground.
+
+    Args:
+        min_grid (numpy.ndarray): 2D grid of the lowest Z per cell, NaN where a cell has no points.
+        cell_size (float): Cell size in meters.
+        max_window (float): Largest opening window in meters; about the size of the largest building.
+        slope (float): Terrain slope (rise over run) tolerated between window sizes.
+        initial_distance (float): Elevation difference threshold for the first window, in meters.
+        max_distance (float): Cap on the elevation difference threshold, in meters.
+
+    Returns:
+        numpy.ndarray: Boolean grid, True for ground cells.
+    """
+    has_points = ~np.isnan(min_grid)
+    if not has_points.any():
+        return has_points
+    surface = fill_empty_cells(min_grid)
+    non_ground = np.zeros(min_grid.shape, dtype=bool)
+
+    previous_window = 1
+    window = 3
+    threshold = initial_distance
+    while window * cell_size <= max_window:
+        opened = ndimage.grey_opening(surface, size=(window, window))
+        non_ground |= (surface - opened) > threshold
+        surface = opened
+
+        previous_window, window = window, 2 * window - 1 # 3, 5, 9, 17, 33...
+        threshold = min(slope * (window - previous_window) * cell_size + initial_distance, max_distance)
+
+    return has_points & ~non_ground
+
+def ground_point_mask(indices, z, min_grid, ground_cells, height_threshold=0.3):
+    """
+    Flags the points within `height_threshold` meters of the minimum of a ground cell.
+
+    Args:
+        indices (numpy.ndarray): Flat cell index of every point (see `lidar_archaeology.cell_indices`).
+        z (numpy.ndarray): Point elevations, in the units of `min_grid`.
+        min_grid (numpy.ndarray): Grid of the lowest Z per cell.
+        ground_cells (numpy.ndarray): Ground cell mask from `progressive_morphological_filter`.
+        height_threshold (float): Tolerance above the cell minimum, in meters.
+
+    Returns:
+        numpy.ndarray: Boolean mask, True for ground points.
+    """
+    cell_min = min_grid.reshape(-1)[indices]
+    return ground_cells.reshape(-1)[indices] & (np.asarray(z) - cell_min <= height_threshold)
@@ -0,0 +1,160 @@
+# Python script for filling holes in LiDAR terrain models
+
+# Under dense canopy few ground (class 2) points reach the ground, so the DTM gridded by
+# lidar_archaeology.py is NaN in most cells. This script interpolates those holes from the
+# surrounding ground cells, either with k-nearest inverse distance weighting (IDW) backed by
+# a `scipy.spatial.cKDTree` or with a Delaunay TIN (linear interpolation on triangles).
+#
+# The grid is processed in square blocks. Each block only indexes the known cells of the
+# block plus a margin of `search_radius` cells, which bounds memory, and the blocks run in
+# parallel threads (the KD-tree and Delaunay code release the GIL).
+#
+# TIN filling works per connected hole instead: every hole is interpolated, as a whole, by
+# the block holding its top-left cell, from one triangulation of the known cells around it.
+# Triangulating the parts of a hole on either side of a block edge separately would give
+# two different surfaces that meet in a seam. A hole spanning most of the grid (e.g. under
+# continuous canopy) is therefore triangulated in one piece.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import cKDTree
+
+# Supported interpolation methods for `fill_dtm_holes`.
+FILL_METHODS = ("idw", "tin")
+
+def idw_interpolate(known_xy, known_z, query_xy, k=8, power=2.0, search_radius=np.inf):
+    """
+    k-nearest inverse distance weighted interpolation.
+
+    Args:
+        known_xy (numpy.ndarray): (n, 2) coordinates of the known values.
+        known_z (numpy.ndarray): (n,) known values.
+        query_xy (numpy.ndarray): (m, 2) coordinates to interpolate.
+        k (int): Number of nearest known values used per query.
+        power (float): Distance weighting exponent.
+        search_radius (float): Known values further away than this are ignored.
+
+    Returns:
+        numpy.ndarray: (m,) interpolated values, NaN where no known value is within reach.
+    """
+    values = np.full(len(query_xy), np.nan)
+    if len(known_xy) == 0 or len(query_xy) == 0:
+        return values
+    k = min(k, len(known_xy))
+    # Grid cells are often equidistant, so fetch extra candidates and break distance ties by
+    # position; otherwise the chosen neighbours would depend on how the KD-tree was built
+    candidates = min(2 * k, len(known_xy))
+    distances, neighbours = cKDTree(known_xy).query(query_xy, k=candidates, distance_upper_bound=search_radius)
+    distances = distances.reshape(len(query_xy), candidates)
+    neighbours = neighbours.reshape(len(query_xy), candidates)
+    padded_xy = np.vstack((known_xy, np.full((1, 2), np.inf))) # Missing neighbours have index len(known_xy)
+    order = np.lexsort((padded_xy[neighbours, 1], padded_xy[neighbours, 0], distances), axis=-1)[:, :k]
+    distances = np.take_along_axis(distances, order, axis=1)
+    neighbours = np.take_along_axis(neighbours, order, axis=1)
+
+    found = np.isfinite(distances) # Missing neighbours come back with an infinite distance
+    exact = found & (distances == 0)
+    weights = np.zeros_like(distances)
+    weights[found] = 1.0 / distances[found] ** power
+    weights[exact.any(axis=1)] = exact[exact.any(axis=1)] # A coincident known value wins outright
+
+    neighbour_z = np.zeros_like(distances)
+    neighbour_z[found] = known_z[neighbours[found]]
+    total = weights.sum(axis=1)
+    reachable = total > 0
+    values[reachable] = (weights * neighbour_z).sum(axis=1)[reachable] / total[reachable]
+    return values
+
+def tin_interpolate(known_xy, known_z, query_xy):
+    """
+    Linear interpolation on the Delaunay triangulation of the known values; NaN outside their hull.
+    """
+    if len(known_xy) < 3 or len(query_xy) == 0:
+        return np.full(len(query_xy), np.nan)
+    return LinearNDInterpolator(known_xy, known_z)(query_xy)
+
+def _fill_holes_tin(dtm, filled, labels, hole_labels, hole_slices):
+    """
+    Fills the holes `hole_labels` (labels of `labels`) from the TIN of the known cells around them.
+    """
+    # Window covering the holes plus the ring of known cells around them
+    rows, cols = dtm.shape
+    top = max(min(hole_slices[i - 1][0].start for i in hole_labels) - 1, 0)
+    left = max(min(hole_slices[i - 1][1].start for i in hole_labels) - 1, 0)
+    bottom = min(max(hole_slices[i - 1][0].stop for i in hole_labels) + 1, rows)
+    right = min(max(hole_slices[i - 1][1].stop for i in hole_labels) + 1, cols)
+    window = dtm[top:bottom, left:right]
+    known_rows, known_cols = np.nonzero(~np.isnan(window))
+    known_xy = np.column_stack((known_cols + left, known_rows + top)).astype(np.float64)
+    hole_rows, hole_cols = np.nonzero(np.isin(labels[top:bottom, left:right], hole_labels))
+    query_xy = np.column_stack((hole_cols + left, hole_rows + top)).astype(np.float64)
+    filled[hole_rows + top, hole_cols + left] = tin_interpolate(known_xy, window[known_rows, known_cols], query_xy)
+
+def _fill_block(dtm, filled, top, left, block_size, method, k, power, search_radius):
+    rows, cols = dtm.shape
+    bottom, right = min(top + block_size, rows), min(left + block_size, cols)
+    holes = np.isnan(dtm[top:bottom, left:right])
+    if not holes.any():
+        return
+
+    # Known cells of the block plus a margin, so holes near the block edge see across it
+    margin = int(np.ceil(search_radius)) if np.isfinite(search_radius) else max(rows, cols)
+    context_top, context_left = max(top - margin, 0), max(left - margin, 0)
+    context = dtm[context_top:min(bottom + margin, rows), context_left:min(right + margin, cols)]
+    known_rows, known_cols = np.nonzero(~np.isnan(context))
+    known_xy = np.column_stack((known_cols + context_left, known_rows + context_top)).astype(np.float64)
+    known_z = context[known_rows, known_cols]
+
+    hole_rows, hole_cols = np.nonzero(holes)
+    query_xy = np.column_stack((hole_cols + left, hole_rows + top)).astype(np.float64)
+    values = idw_interpolate(known_xy, known_z, query_xy, k=k, power=power, search_radius=search_radius)
+    filled[hole_rows + top, hole_cols + left] = values
+
+def fill_dtm_holes(dtm, method="idw", k=8, power=2.0, search_radius=32.0, block_size=512, max_workers=None):
+    """
+    Fills the NaN cells of a gridded DTM by interpolating from the surrounding known cells.
+
+    Args:
+        dtm (numpy.ndarray): 2D grid with NaN where no ground point landed.
+        method (str): "idw" (k-nearest inverse distance weighting) or "tin" (Delaunay linear).
+        k (int): Neighbours used per cell by IDW.
+        power (float): IDW distance weighting exponent.
+        search_radius (float): Maximum distance, in cells, to look for known cells. Holes with no
+            known cell within reach stay NaN; for IDW it also sets the margin read around each block.
+        block_size (int): Side of the square blocks processed in parallel, in cells. TIN filling
+            reads each hole whole, whatever its size (see the notes at the top).
+        max_workers (int): Worker threads; defaults to the ThreadPoolExecutor default.
+
+    Returns:
+        numpy.ndarray: A filled copy of `dtm`; known cells are left untouched.
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(f"Unknown fill method '{method}', expected one of {FILL_METHODS}")
+    dtm = np.asarray(dtm, dtype=np.float64)
+    filled = dtm.copy()
+    rows, cols = dtm.shape
+    blocks = [(top, left) for top in range(0, rows, block_size) for left in range(0, cols, block_size)]
+    if method == "tin":
+        holes = np.isnan(dtm)
+        labels, _ = ndimage.label(holes, structure=np.ones((3, 3)))
+        hole_slices = ndimage.find_objects(labels)
+        # Each hole goes to the block of its top-left bounding box cell
+        by_block = {}
+        for label, (row_slice, col_slice) in enumerate(hole_slices, start=1):
+            block = (row_slice.start // block_size * block_size, col_slice.start // block_size * block_size)
+            by_block.setdefault(block, []).append(label)
+        tasks = [(_fill_holes_tin, dtm, filled, labels, hole_labels, hole_slices) for hole_labels in by_block.values()]
+    else:
+        tasks = [(_fill_block, dtm, filled, top, left, block_size, method, k, power, search_radius)
+                 for top, left in blocks]
+    # Tasks write disjoint cells of `filled`, so they can run concurrently
+    with ThreadPoolExecutor(max_workers) as pool:
+        for future in [pool.submit(*task) for task in tasks]:
+            future.result()
+    if method == "tin" and np.isfinite(search_radius):
+        # Same reach as IDW: cells further than `search_radius` from every known cell stay empty
+        filled[holes & (ndimage.distance_transform_edt(holes) > search_radius)] = np.nan
+    return filled
@@ -0,0 +1,157 @@
+# Python script for profiling the stages of the LiDAR processing pipeline
+
+# Print statements say what the pipeline is doing, not where its time and memory go. This
+# script records, per stage (reading, gridding, writing, visualization...):
+#
+# - wall-clock and CPU time;
+# - the number of points processed and the resulting points per second;
+# - the peak resident set size (RSS) reached during the stage;
+#
+# and writes them as a JSON or CSV run report. Stages can optionally be run under cProfile,
+# with one `.prof` dump per stage for `python -m pstats` or snakeviz.
+#
+# Peak RSS is read from the kernel high-water mark (VmHWM). On Linux the mark is reset at the
+# start of every stage, so each stage reports its own peak; elsewhere the process-wide peak
+# so far is reported (from the Unix-only `resource` module, so none is reported on Windows).
+
+import cProfile
+import csv
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+
+# Columns of the CSV run report, in order.
+REPORT_FIELDS = ("stage", "wall_seconds", "cpu_seconds", "points", "points_per_second", "peak_rss_mib")
+
+def _reset_peak_rss():
+    """
+    Resets the kernel peak RSS mark of this process; returns False where that is not supported.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of this process, in bytes, or None where it cannot be
+    read (Windows, which has neither /proc nor the `resource` module).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource # Unix only
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Bytes on macOS, KiB elsewhere
+
+class PipelineProfiler:
+    """
+    Collects per-stage timings, throughput and peak memory of one pipeline run.
+
+    Usage:
+        profiler = PipelineProfiler("tile_042")
+        with profiler.stage("read") as stage:
+            las = laspy.read(path)
+            stage["points"] = len(las.points)
+        profiler.write_report("tile_042.json")
+    """
+
+    def __init__(self, run_name="lidar", profile_dir=None):
+        """
+        Args:
+            run_name (str): Name of the run, stored in the report and used to name cProfile dumps.
+            profile_dir (str): If set, every stage runs under cProfile and is dumped to
+                `<profile_dir>/<run_name>_<stage>.prof`.
+        """
+        self.run_name = run_name
+        self.profile_dir = profile_dir
+        self.stages = []
+        self._started = time.perf_counter()
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name, points=None):
+        """
+        Times the enclosed block as stage `name`.
+
+        Yields the stage record; set its "points" key inside the block when the point count is
+        only known once the stage has run. The record is kept even if the block raises.
+        """
+        record = {"stage": name, "points": points}
+        per_stage_peak = _reset_peak_rss()
+        profile = cProfile.Profile() if self.profile_dir else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+                profile.dump_stats(os.path.join(self.profile_dir, f"{self.run_name}_{name}.prof"))
+            record["wall_seconds"] = time.perf_counter() - wall
+            record["cpu_seconds"] = time.process_time() - cpu
+            record["points_per_second"] = (record["points"] / record["wall_seconds"]
+                                           if record["points"] and record["wall_seconds"] > 0 else None)
+            peak = peak_rss_bytes()
+            record["peak_rss_mib"] = peak / 2**20 if peak is not None else None
+            record["peak_rss_scope"] = "stage" if per_stage_peak else "process"
+            self.stages.append(record)
+
+    def report(self):
+        """
+        Returns the run report as a JSON-serializable dict.
+        """
+        return {
+            "run": self.run_name,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "total_seconds": time.perf_counter() - self._started,
+            "peak_rss_mib": max((stage["peak_rss_mib"] for stage in self.stages
+                                 if stage["peak_rss_mib"] is not None), default=None),
+            "stages": self.stages,
+        }
+
+    def summary(self):
+        """
+        Returns a plain-text table of the stages.
+        """
+        lines = [f"{'stage':<16}{'wall s':>10}{'cpu s':>10}{'points/sec':>16}{'peak RSS MiB':>14}"]
+        for stage in self.stages:
+            rate = f"{stage['points_per_second']:,.0f}" if stage["points_per_second"] else "-"
+            peak = f"{stage['peak_rss_mib']:.1f}" if stage["peak_rss_mib"] is not None else "-"
+            lines.append(f"{stage['stage']:<16}{stage['wall_seconds']:>10.2f}{stage['cpu_seconds']:>10.2f}"
+                         f"{rate:>16}{peak:>14}")
+        return "\n".join(lines)
+
+    def write_report(self, path):
+        """
+        Writes the run report as JSON, or as CSV (one row per stage) when `path` ends in `.csv`.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=("run",) + REPORT_FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                for stage in self.stages:
+                    writer.writerow({"run": self.run_name, **stage})
+        else:
+            with open(path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+        return path
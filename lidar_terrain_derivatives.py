@@ -0,0 +1,216 @@
+# Python script for terrain visualizations of LiDAR DTMs in archaeology
+
+# Subtle earthworks (mounds, ditches, causeways, field systems) are rarely visible on a raw
+# DTM. This script derives the standard archaeological visualizations from the DTM written
+# by lidar_archaeology.py:
+#
+# - multi-directional hillshade
+# - slope (degrees)
+# - curvature (Zevenbergen & Thorne general curvature)
+# - sky-view factor (SVF) and positive openness, from one horizon search
+# - local relief model (LRM), here the DTM minus its moving-window mean
+#
+# The raster is processed in blocks read and written through rasterio windows, so DTMs larger
+# than memory work. Each block is read with a halo wide enough for the largest neighbourhood,
+# and the blocks are computed in a process pool, since the horizon search behind SVF and
+# openness is by far the most expensive step.
+
+import os
+
+import numpy as np
+import rasterio
+from scipy import ndimage
+
+from raster_blocks import block_windows, map_windows, read_padded_window
+
+# Products `compute_terrain_derivatives` can write.
+DERIVATIVE_PRODUCTS = ("hillshade", "slope", "curvature", "svf", "openness", "lrm")
+
+# --- Terrain derivatives on in-memory arrays ---
+
+def _surface_gradient(dem, cell_size):
+    """
+    Returns the elevation gradient towards the east and towards the north.
+    """
+    d_row, d_col = np.gradient(dem, cell_size)
+    return d_col, -d_row # Row index grows southwards
+
+def slope(dem, cell_size=1.0):
+    """
+    Slope in degrees.
+    """
+    dz_east, dz_north = _surface_gradient(dem, cell_size)
+    return np.degrees(np.arctan(np.hypot(dz_east, dz_north)))
+
+def hillshade(dem, cell_size=1.0, azimuth=315.0, altitude=45.0):
+    """
+    Hillshade (0-1) for a light source at `azimuth` degrees clockwise from north and `altitude` degrees.
+    """
+    dz_east, dz_north = _surface_gradient(dem, cell_size)
+    azimuth, altitude = np.radians(azimuth), np.radians(altitude)
+    sun = (np.sin(azimuth) * np.cos(altitude), np.cos(azimuth) * np.cos(altitude), np.sin(altitude))
+    # Dot product of the unit surface normal (-dz_east, -dz_north, 1) / norm with the sun vector
+    shade = (-dz_east * sun[0] - dz_north * sun[1] + sun[2]) / np.sqrt(dz_east ** 2 + dz_north ** 2 + 1.0)
+    return np.clip(shade, 0.0, 1.0)
+
+def multidirectional_hillshade(dem, cell_size=1.0, azimuths=(225.0, 270.0, 315.0, 360.0), altitude=45.0):
+    """
+    Mean of the hillshades from several light directions, so features are not hidden by any single direction.
+    """
+    return np.mean([hillshade(dem, cell_size, azimuth, altitude) for azimuth in azimuths], axis=0)
+
+def curvature(dem, cell_size=1.0):
+    """
+    Zevenbergen & Thorne general curvature (1/100 m); positive on convex, negative on concave surfaces.
+
+    Border cells are NaN; pad the input by one cell to cover them.
+    """
+    values = np.full(dem.shape, np.nan)
+    center = dem[1:-1, 1:-1]
+    d = ((dem[1:-1, :-2] + dem[1:-1, 2:]) / 2.0 - center) / cell_size ** 2
+    e = ((dem[:-2, 1:-1] + dem[2:, 1:-1]) / 2.0 - center) / cell_size ** 2
+    values[1:-1, 1:-1] = -2.0 * (d + e) * 100.0
+    return values
+
+def _ray_offsets(n_directions, radius):
+    """
+    Integer (row, col) cell offsets along `n_directions` rays out to `radius` cells.
+    """
+    rays = []
+    for angle in np.linspace(0.0, 2.0 * np.pi, n_directions, endpoint=False):
+        offsets = []
+        for step in range(1, radius + 1):
+            offset = (int(round(-step * np.cos(angle))), int(round(step * np.sin(angle))))
+            if offset not in offsets:
+                offsets.append(offset)
+        rays.append(offsets)
+    return rays
+
+def horizon_angles(dem, cell_size=1.0, n_directions=16, radius=10):
+    """
+    Maximum elevation angle (radians) towards the horizon in each direction, for the interior cells.
+
+    `dem` must be padded by `radius` cells on every side; the result covers the unpadded area
+    and has shape (n_directions, rows, cols).
+    """
+    rows, cols = dem.shape[0] - 2 * radius, dem.shape[1] - 2 * radius
+    center = dem[radius:radius + rows, radius:radius + cols]
+    angles = np.full((n_directions, rows, cols), -np.pi / 2)
+    for direction, offsets in enumerate(_ray_offsets(n_directions, radius)):
+        for d_row, d_col in offsets:
+            other = dem[radius + d_row:radius + d_row + rows, radius + d_col:radius + d_col + cols]
+            distance = np.hypot(d_row, d_col) * cell_size
+            np.fmax(angles[direction], np.arctan((other - center) / distance), out=angles[direction])
+    angles[:, np.isnan(center)] = np.nan
+    return angles
+
+def sky_view_factor(angles):
+    """
+    Sky-view factor (0-1) from the horizon angles of `horizon_angles`.
+    """
+    return 1.0 - np.mean(np.sin(np.maximum(angles, 0.0)), axis=0)
+
+def positive_openness(angles):
+    """
+    Positive openness in degrees from the horizon angles of `horizon_angles`.
+    """
+    return np.mean(90.0 - np.degrees(angles), axis=0)
+
+def local_relief_model(dem, radius=10):
+    """
+    Simplified local relief model: the DEM minus its mean over a (2 * radius + 1) cell window. NaN
+    cells (and cells beyond the array) are left out of the mean instead of spreading; a NaN cell
+    stays NaN.
+    """
+    valid = ~np.isnan(dem)
+    size = 2 * radius + 1
+    count = ndimage.uniform_filter(valid.astype(np.float64), size=size, mode="constant")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = ndimage.uniform_filter(np.where(valid, dem, 0.0), size=size, mode="constant") / count
+    return dem - mean
+
+# --- Block-wise processing of rasters ---
+
+def _derive_block(task):
+    """
+    Computes the requested products for one block (run in the process pool).
+    """
+    window, halo, options = task["window"], task["halo"], task["options"]
+    with rasterio.open(task["dtm_path"]) as src:
+        cell_size = abs(src.res[0])
+        padded = read_padded_window(src, window, halo, pad="edge")
+    core = (slice(halo, halo + window.height), slice(halo, halo + window.width))
+
+    results = {}
+    products = task["products"]
+    if "hillshade" in products:
+        results["hillshade"] = multidirectional_hillshade(padded, cell_size)[core]
+    if "slope" in products:
+        results["slope"] = slope(padded, cell_size)[core]
+    if "curvature" in products:
+        results["curvature"] = curvature(padded, cell_size)[core]
+    if "svf" in products or "openness" in products:
+        radius = options["horizon_radius"]
+        trim = halo - radius
+        angles = horizon_angles(padded[trim:padded.shape[0] - trim, trim:padded.shape[1] - trim], cell_size,
+                                n_directions=options["n_directions"], radius=radius)
+        if "svf" in products:
+            results["svf"] = sky_view_factor(angles)
+        if "openness" in products:
+            results["openness"] = positive_openness(angles)
+    if "lrm" in products:
+        results["lrm"] = local_relief_model(padded, radius=options["lrm_radius"])[core]
+    return window, {product: values.astype(np.float32) for product, values in results.items()}
+
+def compute_terrain_derivatives(dtm_path, output_dir="terrain_derivatives", products=DERIVATIVE_PRODUCTS,
+                                block_size=1024, horizon_radius=10, n_directions=16, lrm_radius=10,
+                                max_workers=None):
+    """
+    Writes terrain visualizations of a DTM GeoTIFF, one float32 GeoTIFF per product.
+
+    Args:
+        dtm_path (str): Path to the DTM, e.g. the output of `process_lidar_for_archaeology`.
+        output_dir (str): Directory for the `<product>.tif` outputs.
+        products (tuple): Products to compute, from DERIVATIVE_PRODUCTS.
+        block_size (int): Side of the square blocks read, processed and written at once, in cells.
+        horizon_radius (int): Search radius of the SVF/openness horizon, in cells.
+        n_directions (int): Number of horizon search directions.
+        lrm_radius (int): Half-width of the local relief model smoothing window, in cells.
+        max_workers (int): Worker processes; defaults to the number of CPUs.
+
+    Returns:
+        dict: Output path of each product.
+    """
+    unknown = set(products) - set(DERIVATIVE_PRODUCTS)
+    if unknown:
+        raise ValueError(f"Unknown products {sorted(unknown)}, expected some of {DERIVATIVE_PRODUCTS}")
+    os.makedirs(output_dir, exist_ok=True)
+    options = {"horizon_radius": horizon_radius, "n_directions": n_directions, "lrm_radius": lrm_radius}
+    halo = max(1, horizon_radius, lrm_radius)
+
+    with rasterio.open(dtm_path) as src:
+        profile = src.profile.copy()
+        windows = block_windows(src.width, src.height, block_size)
+    profile.update(driver="GTiff", dtype="float32", count=1, nodata=np.nan, tiled=True,
+                   blockxsize=256, blockysize=256, compress="deflate", predictor=3)
+
+    outputs = {product: os.path.join(output_dir, f"{product}.tif") for product in products}
+    destinations = {product: rasterio.open(path, "w", **profile) for product, path in outputs.items()}
+    try:
+        print(f"Computing {', '.join(products)} over {len(windows)} blocks...")
+        tasks = [{"dtm_path": dtm_path, "window": window, "halo": halo, "products": tuple(products),
+                  "options": options} for window in windows]
+        for window, results in map_windows(_derive_block, tasks, max_workers):
+            for product, values in results.items():
+                destinations[product].write(values, 1, window=window)
+    finally:
+        for dst in destinations.values():
+            dst.close()
+
+    for product, path in outputs.items():
+        print(f"{product} saved to: {path}")
+    return outputs
+
+# Example usage (uncomment and modify with your DTM path):
+# if __name__ == "__main__":
+#     compute_terrain_derivatives('output_dtm.tif', output_dir='terrain_derivatives')
@@ -0,0 +1,145 @@
+# Python script for caching per-tile LiDAR cell statistics between runs
+
+# Gridding is the expensive part of processing a survey block, yet most re-runs change only
+# the visualization step or add a handful of tiles. This script keeps the per-tile DEM/DTM
+# cell statistics (sum, count, min and max per cell, see `lidar_archaeology.CellStatistics`)
+# on disk as .npy arrays that can be memory-mapped, keyed by a hash of the tile contents plus
+# the gridding parameters. lidar_batch_processing.py then only grids tiles that are new or
+# changed and re-mosaics from the cache. The cache is bounded in size and evicts the least
+# recently used entries first.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Bump when the layout of cache entries changes, so old entries are never misread.
+CACHE_FORMAT_VERSION = 1
+
+def file_digest(path, block_size=4 * 2**20):
+    """
+    Returns the BLAKE2b hex digest of a file's contents, read in `block_size` blocks.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class CellStatisticsCache:
+    """
+    Size-bounded, least-recently-used on-disk cache of per-tile cell statistics.
+
+    Every entry is a directory named after its key holding the arrays written by
+    `CellStatistics.save` and a `meta.json` file. Entries are built in a staging directory
+    and renamed into place, so an interrupted run never leaves a partial entry behind.
+    """
+
+    def __init__(self, cache_dir, max_bytes=20 * 2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._digests_path = os.path.join(cache_dir, "digests.json")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # --- Keys ---
+
+    def tile_keys(self, tile_paths, params, map_func=map):
+        """
+        Returns the cache key of every tile: its content digest combined with the gridding `params`.
+
+        Digests are remembered by path, size and modification time, so unchanged tiles are not
+        re-read; missing digests are computed with `map_func` (e.g. a process pool's `map`).
+        """
+        known = {}
+        if os.path.exists(self._digests_path):
+            with open(self._digests_path) as f:
+                known = json.load(f)
+
+        stamps = {}
+        for path in tile_paths:
+            stat = os.stat(path)
+            stamps[path] = [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+        missing = [path for path in tile_paths
+                   if known.get(stamps[path][0], {}).get("stamp") != stamps[path][1:]]
+        for path, digest in zip(missing, map_func(file_digest, missing)):
+            known[stamps[path][0]] = {"stamp": stamps[path][1:], "digest": digest}
+        if missing:
+            self._write_json(self._digests_path, known)
+
+        keys = []
+        for path in tile_paths:
+            description = {"digest": known[stamps[path][0]]["digest"], "params": params,
+                           "version": CACHE_FORMAT_VERSION}
+            keys.append(hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest())
+        return keys
+
+    # --- Entries ---
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Returns the metadata of a cached entry and marks it as recently used, or None on a miss.
+        """
+        meta_path = os.path.join(self.entry_dir(key), "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        os.utime(meta_path) # The modification time of meta.json orders the LRU eviction
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def staging_dir(self):
+        """
+        Creates an empty directory to build a new entry in; pass it to `commit` when complete.
+        """
+        return tempfile.mkdtemp(prefix=".staging-", dir=self.cache_dir)
+
+    def commit(self, key, staging_dir, meta):
+        """
+        Moves a completed staging directory into place as the entry for `key`.
+        """
+        self._write_json(os.path.join(staging_dir, "meta.json"), meta)
+        try:
+            os.rename(staging_dir, self.entry_dir(key))
+        except OSError:
+            # Another run committed the same entry first; its contents are identical
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def evict(self, keep=()):
+        """
+        Deletes least recently used entries until the cache fits in `max_bytes`; `keep` entries are spared.
+
+        Returns:
+            list: The evicted keys.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(path, "meta.json")
+            if not os.path.isdir(path) or not os.path.exists(meta_path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(meta_path), name, size))
+            total += size
+
+        evicted = []
+        keep = set(keep)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name in keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+            evicted.append(name)
+        return evicted
+
+    @staticmethod
+    def _write_json(path, data):
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(data, f)
+        os.replace(temporary, path)
@@ -0,0 +1,202 @@
+# Python script for fast, headless visualization of LiDAR rasters
+
+# Rendering full-resolution grids through matplotlib's imshow is slow, memory hungry and needs
+# a display. This script renders the rasters written by lidar_archaeology.py without one:
+#
+# - matplotlib is forced onto the non-interactive Agg backend;
+# - figure previews are drawn from downsampled reads, which GDAL serves from the overviews
+#   of the Cloud Optimized GeoTIFF outputs instead of the full-resolution data;
+# - full-resolution quicklooks map values straight to uint8 colormap indices and are written
+#   as PNG without going through a figure;
+# - an XYZ (slippy map) tile pyramid can be generated in parallel, so a survey block can be
+#   browsed in any web map without loading the whole grid.
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg") # Headless; must be selected before pyplot is imported
+import numpy as np
+import rasterio
+from PIL import Image
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds as transform_from_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+
+# Half the width of the Web Mercator (EPSG:3857) world, in meters.
+WEB_MERCATOR_EXTENT = 20037508.342789244
+
+# Pixel size of XYZ tiles.
+XYZ_TILE_SIZE = 256
+
+# zlib level of the PNGs written; encoding dominates the render time, and level 1 trades a
+# slightly larger file for several times the speed of the default.
+PNG_COMPRESS_LEVEL = 1
+
+# --- Colormapping ---
+
+def colormap_lut(cmap="terrain"):
+    """
+    Returns a (256, 4) uint8 RGBA lookup table for a matplotlib colormap.
+    """
+    return (matplotlib.colormaps[cmap](np.linspace(0.0, 1.0, 256)) * 255).round().astype(np.uint8)
+
+def value_range(grid, percentiles=(2.0, 98.0)):
+    """
+    Returns the (vmin, vmax) stretch of a grid from percentiles of its non-NaN values.
+    """
+    values = grid[~np.isnan(grid)]
+    if len(values) == 0:
+        return 0.0, 1.0
+    vmin, vmax = np.percentile(values, percentiles)
+    return float(vmin), (float(vmax) if vmax > vmin else float(vmin) + 1.0)
+
+def colorize(grid, vmin, vmax, lut):
+    """
+    Maps a grid to RGBA uint8 through a colormap lookup table; NaN cells become transparent.
+    """
+    nan = np.isnan(grid)
+    scaled = (np.nan_to_num(grid, nan=vmin) - vmin) * (255.0 / (vmax - vmin))
+    rgba = lut[np.clip(scaled, 0, 255).astype(np.uint8)]
+    rgba[nan, 3] = 0
+    return rgba
+
+# --- Previews and quicklooks ---
+
+def read_preview(raster_path, max_size=1024):
+    """
+    Reads a raster downsampled so its longest side is at most `max_size` pixels.
+
+    The read is served from the raster overviews when it has them, so only a fraction of
+    the file is decoded.
+
+    Returns:
+        tuple: (grid, bounds) with NaN for nodata cells.
+    """
+    with rasterio.open(raster_path) as src:
+        factor = max(1, math.ceil(max(src.width, src.height) / max_size))
+        grid = src.read(1, out_shape=(max(1, src.height // factor), max(1, src.width // factor)),
+                        resampling=Resampling.average, masked=True, out_dtype=np.float64)
+        return grid.filled(np.nan), src.bounds
+
+def render_dem_dtm_preview(dem_path, dtm_path, png_path="lidar_dem_dtm_visualization.png", max_size=1024):
+    """
+    Draws the DEM and DTM side by side with colorbars, from downsampled previews of the rasters.
+    """
+    import matplotlib.pyplot as plt # Only figures need pyplot, the slowest import of this module
+
+    fig, axes = plt.subplots(1, 2, figsize=(12, 6))
+    for ax, path, title in ((axes[0], dem_path, 'Digital Elevation Model (DEM)'),
+                            (axes[1], dtm_path, 'Digital Terrain Model (DTM)')):
+        grid, bounds = read_preview(path, max_size)
+        image = ax.imshow(grid, cmap='terrain', origin='upper',
+                          extent=[bounds.left, bounds.right, bounds.bottom, bounds.top])
+        ax.set_title(title)
+        fig.colorbar(image, ax=ax, label='Elevation (m)')
+    fig.tight_layout()
+    fig.savefig(png_path)
+    plt.close(fig)
+    return png_path
+
+def write_quicklook_png(raster_path, png_path, cmap="terrain", stretch=None):
+    """
+    Writes a full-resolution colormapped PNG of a raster without going through a matplotlib figure.
+
+    Args:
+        raster_path (str): Single-band raster.
+        png_path (str): Output PNG path.
+        cmap (str): Matplotlib colormap name.
+        stretch (tuple): (vmin, vmax) value range; defaults to the 2-98% range of a preview.
+    """
+    vmin, vmax = stretch or value_range(read_preview(raster_path)[0])
+    with rasterio.open(raster_path) as src:
+        grid = src.read(1, masked=True, out_dtype=np.float64).filled(np.nan)
+    image = Image.fromarray(colorize(grid, vmin, vmax, colormap_lut(cmap)))
+    image.save(png_path, compress_level=PNG_COMPRESS_LEVEL)
+    return png_path
+
+# --- XYZ tile pyramid ---
+
+def _lonlat_to_tile(lon, lat, zoom):
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def _tile_bounds(x, y, zoom):
+    """
+    Web Mercator (left, bottom, right, top) bounds of an XYZ tile.
+    """
+    size = 2 * WEB_MERCATOR_EXTENT / 2 ** zoom
+    left, top = -WEB_MERCATOR_EXTENT + x * size, WEB_MERCATOR_EXTENT - y * size
+    return left, top - size, left + size, top
+
+def _render_xyz_tiles(task):
+    """
+    Renders a batch of XYZ tiles (run in the process pool); returns the number written.
+    """
+    lut = colormap_lut(task["cmap"])
+    vmin, vmax = task["value_range"]
+    written = 0
+    with rasterio.open(task["raster_path"]) as src:
+        for zoom, x, y in task["tiles"]:
+            # Warping straight onto the tile grid lets GDAL pick the matching overview level
+            transform = transform_from_bounds(*_tile_bounds(x, y, zoom), XYZ_TILE_SIZE, XYZ_TILE_SIZE)
+            with WarpedVRT(src, crs="EPSG:3857", transform=transform, width=XYZ_TILE_SIZE, height=XYZ_TILE_SIZE,
+                           resampling=Resampling.bilinear, nodata=np.nan) as vrt:
+                grid = vrt.read(1, out_dtype=np.float64)
+            if np.isnan(grid).all():
+                continue
+            tile_dir = os.path.join(task["output_dir"], str(zoom), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            Image.fromarray(colorize(grid, vmin, vmax, lut)).save(os.path.join(tile_dir, f"{y}.png"),
+                                                                  compress_level=PNG_COMPRESS_LEVEL)
+            written += 1
+    return written
+
+def generate_xyz_tiles(raster_path, output_dir, min_zoom=None, max_zoom=None, cmap="terrain", max_workers=None,
+                       batch_size=64):
+    """
+    Writes an XYZ tile pyramid (`<output_dir>/<z>/<x>/<y>.png`, Web Mercator) of a raster in parallel.
+
+    Args:
+        raster_path (str): Single-band raster with a CRS, ideally a COG with overviews.
+        output_dir (str): Root directory of the pyramid.
+        min_zoom (int): Coarsest zoom level; defaults to the level where the raster fits in one tile.
+        max_zoom (int): Finest zoom level; defaults to the level matching the raster resolution.
+        cmap (str): Matplotlib colormap name.
+        max_workers (int): Worker processes; defaults to the number of CPUs.
+        batch_size (int): Tiles rendered per task.
+
+    Returns:
+        int: Number of tiles written (fully empty tiles are skipped).
+    """
+    with rasterio.open(raster_path) as src:
+        if src.crs is None:
+            raise ValueError(f"{raster_path} has no CRS, so it cannot be placed on a web map")
+        west, south, east, north = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+        mercator_left, _, mercator_right, _ = transform_bounds(src.crs, "EPSG:3857", *src.bounds)
+        pixel_size = (mercator_right - mercator_left) / src.width
+    if max_zoom is None:
+        max_zoom = max(0, math.ceil(math.log2(2 * WEB_MERCATOR_EXTENT / (XYZ_TILE_SIZE * pixel_size))))
+    if min_zoom is None:
+        min_zoom = max(0, min(max_zoom, math.floor(math.log2(360.0 / max(east - west, 1e-9)))))
+
+    tiles = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        x_min, y_min = _lonlat_to_tile(west, north, zoom)
+        x_max, y_max = _lonlat_to_tile(east, south, zoom)
+        tiles.extend((zoom, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1))
+
+    # One colour stretch for the whole pyramid, so neighbouring tiles and zoom levels match
+    stretch = value_range(read_preview(raster_path)[0])
+    tasks = [{"raster_path": raster_path, "output_dir": output_dir, "cmap": cmap, "value_range": stretch,
+              "tiles": tiles[start:start + batch_size]} for start in range(0, len(tiles), batch_size)]
+    print(f"Rendering {len(tiles)} XYZ tiles (zoom {min_zoom}-{max_zoom}) to: {output_dir}")
+    with ProcessPoolExecutor(max_workers) as pool:
+        written = sum(pool.map(_render_xyz_tiles, tasks))
+    print(f"Wrote {written} XYZ tiles")
+    return written
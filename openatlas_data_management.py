@@ -5,11 +5,15 @@
 # Interaction typically happens via its REST API. You would need to have an OpenAtlas instance running
 # and have appropriate API credentials.
 
-import requests
+import asyncio
 import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-print("OpenAtlas Data Management Script")
-print("--------------------------------")
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 # --- Configuration --- 
 
@@ -44,14 +48,12 @@ def get_entities(api_key, entity_type=None, limit=10):
     """
     headers = get_headers(api_key)
     params = {"limit": limit}
-    url = ENTITIES_ENDPOINT
-
     if entity_type:
-        url = f"{ENTITIES_ENDPOINT}?type={entity_type}"
+        params["type"] = entity_type
 
-    print(f"Retrieving entities from: {url}")
+    print(f"Retrieving entities from: {ENTITIES_ENDPOINT}")
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = requests.get(ENTITIES_ENDPOINT, headers=headers, params=params)
         response.raise_for_status() # Raise an exception for HTTP errors
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -74,9 +76,206 @@ def create_entity(api_key, entity_data):
         print(f"Error creating entity: {e}")
         return None
 
+# The functions above send one blocking request per call. For many entities, use
+# AsyncOpenAtlasClient below, which pools connections and runs requests concurrently.
+
+# --- Async client ---
+
+# Status codes answered by waiting and retrying: rate limiting and transient server errors.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Methods that can safely be repeated after a server error or a dropped connection; a POST may
+# already have created its entity, so it is only retried on 429 or if it never reached the server.
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+def _never_sent(error):
+    """
+    Whether a `requests` connection error happened before the request reached the server.
+    """
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectTimeout) or isinstance(reason, NewConnectionError)
+
+class AsyncOpenAtlasClient:
+    """
+    asyncio OpenAtlas client with a shared connection pool, bounded concurrency, retries and a type cache.
+
+    Requests go through one pooled `requests.Session` on a thread pool sized to `max_concurrency`,
+    with an asyncio semaphore capping the requests in flight, so no async HTTP library is needed.
+
+    Usage:
+        async with AsyncOpenAtlasClient(OPENATLAS_BASE_URL, API_KEY, max_concurrency=16) as client:
+            entities = await client.fetch_many(entity_ids)
+            created = await client.create_entities(new_sites)
+    """
+
+    def __init__(self, base_url=OPENATLAS_BASE_URL, api_key=API_KEY, max_concurrency=16, max_retries=5,
+                 backoff_base=0.5, backoff_max=30.0, timeout=30.0, type_cache_ttl=600.0):
+        """
+        Args:
+            base_url (str): OpenAtlas API root, ending in "/".
+            api_key (str): OpenAtlas API key.
+            max_concurrency (int): Maximum requests in flight at once (also the connection pool size).
+            max_retries (int): Retries of a request answered with 429/5xx or failing to connect
+                (see IDEMPOTENT_METHODS).
+            backoff_base (float): Delay before the first retry, in seconds; doubles with every retry.
+            backoff_max (float): Cap on the retry delay, in seconds.
+            timeout (float): Timeout of every request, in seconds.
+            type_cache_ttl (float): Seconds the types from TYPES_ENDPOINT are cached.
+        """
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.type_cache_ttl = type_cache_ttl
+
+        self.session = requests.Session()
+        self.session.headers.update(get_headers(api_key))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="openatlas")
+        self._slots = None # Created on first use, inside the running event loop
+        self._types = None
+        self._types_expire = 0.0
+        self._types_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    # --- Requests ---
+
+    def _backoff(self, attempt):
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def request(self, method, path, **kwargs):
+        """
+        Sends a request to `path` (relative to the base URL) with retries on 429/5xx and connection
+        errors, honouring Retry-After; returns the response or raises `requests.HTTPError`.
+
+        Requests with a method outside IDEMPOTENT_METHODS are only retried on 429 and on errors
+        opening the connection.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        url = path if path.startswith(("http://", "https://")) else f"{self.base_url}{path}"
+        loop = asyncio.get_running_loop()
+        send = lambda: self.session.request(method, url, timeout=self.timeout, **kwargs)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_codes = RETRY_STATUS_CODES if idempotent else (429,)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._slots:
+                    response = await loop.run_in_executor(self._executor, send)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries or not (idempotent or _never_sent(e)):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            if response.status_code not in retry_codes or attempt == self.max_retries:
+                break
+            # Wait outside the semaphore, so a throttled request does not hold up the others
+            retry_after = response.headers.get("Retry-After", "")
+            await asyncio.sleep(float(retry_after) if retry_after.isdigit() else self._backoff(attempt))
+        response.raise_for_status()
+        return response
+
+    async def map_bounded(self, func, items, return_exceptions=False):
+        """
+        Awaits `func(item)` for every item, at most `max_concurrency` at a time; returns the results in order.
+
+        `items` is consumed lazily, so it can be a large generator. With `return_exceptions`, a failed
+        item gets its exception as result instead of the first failure being raised.
+        """
+        iterator = enumerate(items)
+        results = {}
+
+        async def worker():
+            for index, item in iterator: # Shared, so every item is taken by exactly one worker
+                try:
+                    results[index] = await func(item)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[index] = e
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.max_concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+        return [results[index] for index in range(len(results))]
+
+    # --- Entities ---
+
+    async def get_entities(self, entity_type=None, limit=10):
+        """
+        Lists entities, optionally of one type (same query as `get_entities`).
+        """
+        params = {"limit": limit, **({"type": entity_type} if entity_type else {})}
+        return (await self.request("GET", "entities/", params=params)).json()
+
+    async def fetch_entity(self, entity_id):
+        return (await self.request("GET", f"entities/{entity_id}/")).json()
+
+    async def fetch_many(self, entity_ids, return_exceptions=False):
+        """
+        Fetches entities by ID concurrently; returns them in the order of `entity_ids`.
+        """
+        return await self.map_bounded(self.fetch_entity, entity_ids, return_exceptions)
+
+    async def create_entity(self, entity_data):
+        return (await self.request("POST", "entities/", json=entity_data)).json()
+
+    async def create_entities(self, entities):
+        """
+        Creates entities concurrently; a failed entity does not stop the others.
+
+        Returns:
+            list: The created entity, or the exception raised for it, per entity in input order.
+        """
+        return await self.map_bounded(self.create_entity, entities, return_exceptions=True)
+
+    # --- Types ---
+
+    async def types(self, refresh=False):
+        """
+        Returns the types from TYPES_ENDPOINT, cached for `type_cache_ttl` seconds.
+        """
+        if self._types_lock is None:
+            self._types_lock = asyncio.Lock()
+        async with self._types_lock: # Concurrent callers share one fetch
+            if refresh or self._types is None or time.monotonic() >= self._types_expire:
+                body = (await self.request("GET", "types/")).json()
+                self._types = body.get("results", body) if isinstance(body, dict) else body
+                self._types_expire = time.monotonic() + self.type_cache_ttl
+            return self._types
+
+    async def get_type(self, name_or_id):
+        """
+        Returns the cached type with the given name or ID, or None.
+        """
+        for entity_type in await self.types():
+            if name_or_id in (entity_type.get("name"), entity_type.get("id")):
+                return entity_type
+        return None
+
 # --- Example Usage --- 
 
 if __name__ == "__main__":
+    print("OpenAtlas Data Management Script")
+    print("--------------------------------")
+
     # 1. Example: Get some existing entities
     print("\n--- Fetching Entities ---")
     # To get specific types of entities (e.g., 'site', 'find'), you would specify the entity_type.
@@ -85,7 +284,7 @@ if __name__ == "__main__":
     if entities:
         print("Successfully fetched entities:")
         for ent in entities.get("results", []):
-            print(f"  Entity ID: {ent.get("id")}, Type: {ent.get("type").get("name")}, Label: {ent.get("label")}")
+            print(f"  Entity ID: {ent.get('id')}, Type: {ent.get('type').get('name')}, Label: {ent.get('label')}")
     else:
         print("Could not fetch entities.")
 
@@ -113,11 +312,16 @@ if __name__ == "__main__":
     # }
     # new_entity = create_entity(API_KEY, new_site_data)
     # if new_entity:
-    #     print(f"New entity created with ID: {new_entity.get("id")}")
+    #     print(f"New entity created with ID: {new_entity.get('id')}")
     # else:
     #     print("Failed to create new entity.")
 
-print("\nThis script is a starting point. You will need to consult your specific OpenAtlas instance\"s API documentation for exact endpoints, entity types, and data structures.")
-print("Remember to replace placeholder values for URL and API key.")
-
+    # 3. Example: Fetch many entities concurrently with the async client
+    # async def fetch_sites(entity_ids):
+    #     async with AsyncOpenAtlasClient(OPENATLAS_BASE_URL, API_KEY, max_concurrency=16) as client:
+    #         site_type = await client.get_type("Settlement")
+    #         return site_type, await client.fetch_many(entity_ids)
+    # site_type, sites = asyncio.run(fetch_sites([101, 102, 103]))
 
+    print("\nThis script is a starting point. You will need to consult your specific OpenAtlas instance's API documentation for exact endpoints, entity types, and data structures.")
+    print("Remember to replace placeholder values for URL and API key.")
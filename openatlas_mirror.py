@@ -0,0 +1,322 @@
+# Python script for a local, spatially indexed mirror of OpenAtlas entities
+
+# Every call of `openatlas_data_management.get_entities` goes to the live API, so a spatial
+# question like "which recorded sites lie within this LiDAR tile" means pulling every entity
+# and filtering client-side. This script keeps a local mirror instead:
+#
+# - entities are stored in a SQLite database, indexed by ID, class and modification time;
+# - the bounding box of every geometry goes into an SQLite R*Tree, for fast bounding box
+#   and nearest-site queries;
+# - `sync` only fetches what changed since the last sync, using the newest modification
+#   timestamp (or the highest ID) seen so far as a watermark.
+#
+# The R*Tree module is built into the sqlite3 of standard Python builds, so no SpatiaLite
+# extension is needed. Coordinates are stored as delivered by the API (longitude/latitude for
+# OpenAtlas), and distances are in those units.
+
+import json
+import math
+import sqlite3
+
+# requests and openatlas_data_management are imported on the first sync, so queries against an
+# existing mirror only load sqlite3.
+
+# Watermarks `sync` can use: the entity modification timestamp or the entity ID.
+WATERMARKS = ("modified", "id")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    label TEXT,
+    system_class TEXT,
+    type_name TEXT,
+    modified TEXT,
+    geometry TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entities_system_class ON entities (system_class);
+CREATE INDEX IF NOT EXISTS entities_modified ON entities (modified);
+CREATE VIRTUAL TABLE IF NOT EXISTS entity_bounds USING rtree (id, min_x, max_x, min_y, max_y);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# --- Geometries ---
+
+def _coordinates(coordinates):
+    """
+    Yields the (x, y) positions of nested GeoJSON coordinate arrays.
+    """
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates[0], coordinates[1]
+    else:
+        for part in coordinates or ():
+            yield from _coordinates(part)
+
+def entity_geometry(entity):
+    """
+    Returns the geometry of an entity as a GeoJSON dict (from its "geometry", GeoJSON or WKT), or None.
+    """
+    geometry = entity.get("geometry")
+    if isinstance(geometry, str):
+        from shapely import wkt # Only WKT geometries need shapely
+        from shapely.geometry import mapping
+        geometry = mapping(wkt.loads(geometry))
+    return json.loads(json.dumps(geometry)) if geometry else None # Tuples from shapely to lists
+
+def geometry_bounds(geometry):
+    """
+    Returns the (min_x, min_y, max_x, max_y) bounds of a GeoJSON geometry, or None if it has no positions.
+    """
+    if geometry.get("type") == "GeometryCollection":
+        positions = [position for part in geometry.get("geometries", ())
+                     for position in _coordinates(part.get("coordinates"))]
+    else:
+        positions = list(_coordinates(geometry.get("coordinates")))
+    if not positions:
+        return None
+    xs, ys = zip(*positions)
+    return min(xs), min(ys), max(xs), max(ys)
+
+# --- Mirror ---
+
+class OpenAtlasMirror:
+    """
+    SQLite mirror of the entities of an OpenAtlas instance, with an R*Tree over their geometries.
+
+    Usage:
+        with OpenAtlasMirror("openatlas_mirror.sqlite") as mirror:
+            mirror.sync()
+            sites = mirror.bbox(-55.2, -10.1, -55.0, -9.9, system_class="place")
+            nearest = mirror.nearest(-55.1, -10.0, k=3)
+    """
+
+    def __init__(self, db_path="openatlas_mirror.sqlite", base_url=None, api_key=None, timeout=60):
+        """
+        Args:
+            db_path (str): SQLite database file; created if missing.
+            base_url (str): OpenAtlas API root, e.g. "https://your-openatlas-instance.org/api/v1/";
+                defaults to OPENATLAS_BASE_URL of openatlas_data_management.py.
+            api_key (str): OpenAtlas API key; defaults to API_KEY of openatlas_data_management.py.
+            timeout (float): Seconds to wait for each API response.
+        """
+        self.db_path = db_path
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = None # Created on the first sync
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(_SCHEMA)
+        self._extent = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.close()
+        if self.session is not None:
+            self.session.close()
+
+    def _connect(self):
+        """
+        Creates the HTTP session on first use, filling in the defaults of openatlas_data_management.py.
+        """
+        if self.session is None:
+            import requests
+            from openatlas_data_management import API_KEY, OPENATLAS_BASE_URL, get_headers
+
+            self.base_url = (self.base_url or OPENATLAS_BASE_URL).rstrip("/") + "/"
+            self.session = requests.Session()
+            self.session.headers.update(get_headers(self.api_key or API_KEY))
+        return self.session
+
+    # --- Sync ---
+
+    def _state(self, key, default=None):
+        row = self.db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def upsert(self, entities):
+        """
+        Inserts or replaces entities (API dicts); entities with "deleted" set are removed instead.
+
+        Returns:
+            int: Number of entities written or removed.
+        """
+        count = 0
+        self._extent = None
+        with self.db:
+            for entity in entities:
+                entity_id = int(entity["id"])
+                self.db.execute("DELETE FROM entity_bounds WHERE id = ?", (entity_id,))
+                if entity.get("deleted"):
+                    self.db.execute("DELETE FROM entities WHERE id = ?", (entity_id,))
+                    count += 1
+                    continue
+                geometry = entity_geometry(entity)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entities (id, label, system_class, type_name, modified, geometry, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entity_id, entity.get("label"), entity.get("system_class"),
+                     (entity.get("type") or {}).get("name"), entity.get("modified"),
+                     json.dumps(geometry) if geometry else None, json.dumps(entity)))
+                bounds = geometry_bounds(geometry) if geometry else None
+                if bounds:
+                    min_x, min_y, max_x, max_y = bounds
+                    self.db.execute("INSERT INTO entity_bounds VALUES (?, ?, ?, ?, ?)",
+                                    (entity_id, min_x, max_x, min_y, max_y))
+                count += 1
+        return count
+
+    def sync(self, watermark="modified", page_size=1000, entity_type=None):
+        """
+        Fetches the entities added or modified since the last sync and writes them to the mirror.
+
+        Args:
+            watermark (str): "modified" asks the API for entities with `modified_since` the newest
+                timestamp mirrored so far; "id" asks for entities with `id_gt` the highest ID mirrored
+                so far, for instances without modification timestamps (new entities only).
+            page_size (int): Entities per API request.
+            entity_type (str): Only sync entities of this type.
+
+        Returns:
+            int: Number of entities written or removed.
+        """
+        if watermark not in WATERMARKS:
+            raise ValueError(f"Unknown watermark '{watermark}', expected one of {WATERMARKS}")
+        session = self._connect()
+        state_key = f"watermark_{watermark}" + (f"_{entity_type}" if entity_type else "")
+        since = self._state(state_key)
+        params = {"limit": page_size, **({"type": entity_type} if entity_type else {})}
+        if since is not None:
+            # `modified_since` is inclusive, so entities sharing the last timestamp are fetched
+            # again rather than missed; re-writing them is harmless
+            params["modified_since" if watermark == "modified" else "id_gt"] = since
+        print(f"Syncing OpenAtlas entities from {self.base_url} "
+              f"({f'{watermark} watermark {since}' if since is not None else 'full sync'})...")
+
+        written, newest, page = 0, since, 1
+        while True:
+            response = session.get(f"{self.base_url}entities/", params={**params, "page": page},
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+            results = body.get("results", [])
+            written += self.upsert(results)
+            for entity in results:
+                value = entity.get("modified") if watermark == "modified" else int(entity["id"])
+                if value is not None and (newest is None or value > type(value)(newest)):
+                    newest = value
+            if not results or not body.get("next"):
+                break
+            page += 1
+        if newest is not None:
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (state_key, str(newest)))
+        print(f"Mirrored {written} entities, {self.count()} in total")
+        return written
+
+    # --- Queries ---
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    def get(self, entity_id):
+        """
+        Returns the mirrored API dict of an entity, or None.
+        """
+        row = self.db.execute("SELECT data FROM entities WHERE id = ?", (entity_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def _bounds_query(self, min_x, min_y, max_x, max_y, system_class=None):
+        query = ("SELECT e.id, e.label, e.system_class, e.type_name, e.modified, e.geometry "
+                 "FROM entity_bounds b JOIN entities e ON e.id = b.id "
+                 "WHERE b.max_x >= ? AND b.min_x <= ? AND b.max_y >= ? AND b.min_y <= ?")
+        args = [min_x, max_x, min_y, max_y]
+        if system_class:
+            query += " AND e.system_class = ?"
+            args.append(system_class)
+        return self.db.execute(query + " ORDER BY e.id", args)
+
+    @staticmethod
+    def _row(row):
+        return {"id": row["id"], "label": row["label"], "system_class": row["system_class"],
+                "type_name": row["type_name"], "modified": row["modified"],
+                "geometry": json.loads(row["geometry"]) if row["geometry"] else None}
+
+    def bbox(self, min_x, min_y, max_x, max_y, system_class=None):
+        """
+        Returns the entities whose geometry bounding box intersects the given box, ordered by ID.
+
+        The R*Tree finds the candidates; they are then checked against the float64 bounds of their
+        geometry, like the distances of `nearest`.
+        """
+        hits = []
+        for row in self._bounds_query(min_x, min_y, max_x, max_y, system_class):
+            bounds = geometry_bounds(json.loads(row["geometry"]))
+            if bounds[2] >= min_x and bounds[0] <= max_x and bounds[3] >= min_y and bounds[1] <= max_y:
+                hits.append(self._row(row))
+        return hits
+
+    def nearest(self, x, y, k=1, max_distance=None, system_class=None, initial_radius=None):
+        """
+        Returns the `k` entities nearest to (x, y), closest first, each with its "distance".
+
+        Distances are to the bounding box of the stored geometry (so to the point itself for
+        points), in coordinate units, computed from its float64 coordinates. The search box grows
+        from `initial_radius` until it holds `k` entities within its radius, so only entities near
+        the point are read.
+
+        Args:
+            max_distance (float): Only return entities at most this far away.
+            system_class (str): Only consider entities of this class.
+            initial_radius (float): First search radius; defaults to a guess from the mirror density.
+        """
+        if self._extent is None:
+            # A full scan of the R*Tree, so kept until the mirror next changes
+            self._extent = self.db.execute("SELECT MIN(min_x), MIN(min_y), MAX(max_x), MAX(max_y), COUNT(*) "
+                                           "FROM entity_bounds").fetchone()
+        extent = self._extent
+        if not extent[4]:
+            return []
+        span = max(extent[2] - extent[0], extent[3] - extent[1], 1e-9)
+        radius = initial_radius or span * math.sqrt(max(k, 1) / extent[4])
+        limit = max_distance if max_distance is not None else math.inf
+        while True:
+            radius = min(radius, limit)
+            rows = []
+            for row in self._bounds_query(x - radius, y - radius, x + radius, y + radius, system_class):
+                # The R*Tree stores float32 bounds rounded outwards: good enough to find the
+                # candidates, but up to ~1 m off at longitude/latitude, so measure the geometry
+                min_x, min_y, max_x, max_y = geometry_bounds(json.loads(row["geometry"]))
+                dx = max(min_x - x, 0.0, x - max_x)
+                dy = max(min_y - y, 0.0, y - max_y)
+                rows.append((math.hypot(dx, dy), row["id"], row))
+            # Anything outside the search box is farther than `radius`, so only hits within it are final
+            within = sorted(hit for hit in rows if hit[0] <= radius)
+            covers_all = (x - radius <= extent[0] and x + radius >= extent[2]
+                          and y - radius <= extent[1] and y + radius >= extent[3])
+            if len(within) >= k or radius >= limit or covers_all:
+                return [{**self._row(row), "distance": distance} for distance, _, row in within[:k]]
+            radius *= 2
+
+    def entities_in_raster(self, raster_path, system_class=None):
+        """
+        Returns the entities within the bounds of a raster (e.g. a LiDAR DTM tile), in longitude/latitude.
+        """
+        import rasterio # Only needed for raster queries
+        from rasterio.warp import transform_bounds
+
+        with rasterio.open(raster_path) as src:
+            bounds = transform_bounds(src.crs, "EPSG:4326", *src.bounds) if src.crs else src.bounds
+        return self.bbox(*bounds, system_class=system_class)
+
+# Example usage (uncomment and modify with your instance and tile paths):
+# if __name__ == "__main__":
+#     with OpenAtlasMirror("openatlas_mirror.sqlite") as mirror:
+#         mirror.sync()
+#         for site in mirror.entities_in_raster("lidar_dtm.tif", system_class="place"):
+#             print(f"  Entity ID: {site['id']}, Label: {site['label']}")
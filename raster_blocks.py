@@ -0,0 +1,89 @@
+# Python script with the block-wise raster processing helpers shared by the processing scripts
+
+# lidar_terrain_derivatives.py, sentinel2_compositing.py, spectral_indices.py and
+# lidar_candidates.py all process large rasters the same way:
+#
+# - the raster is cut into square windows (`block_windows`);
+# - each window is read with a halo of neighbouring cells, so filters and neighbourhood
+#   statistics are correct up to the window edge (`read_padded_window`);
+# - windows are processed in a process pool and the results are written or collected in
+#   order (`map_windows`), with only a bounded number of tasks submitted at once so finished
+#   results never pile up in memory.
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from rasterio.windows import Window
+
+# How cells of the halo beyond the raster are filled by `read_padded_window`.
+PAD_MODES = ("nan", "edge")
+
+def block_windows(width, height, block_size):
+    """
+    Returns the row-major list of `block_size` square windows covering a width x height raster.
+    """
+    return [Window(col, row, min(block_size, width - col), min(block_size, height - row))
+            for row in range(0, height, block_size) for col in range(0, width, block_size)]
+
+def read_padded_window(src, window, halo, indexes=1, pad="nan"):
+    """
+    Reads `window` plus `halo` cells on every side of an open rasterio dataset, as float64 with
+    nodata as NaN.
+
+    Args:
+        src (rasterio.DatasetReader): Dataset to read from.
+        window (Window): Window of the raster to read.
+        halo (int): Cells added on every side.
+        indexes (int or list): Band number, giving a 2D array, or list of band numbers, giving a 3D one.
+        pad (str): "nan" to fill the halo beyond the raster with NaN, "edge" to repeat the edge cells.
+
+    Returns:
+        numpy.ndarray: Array of (height + 2 * halo, width + 2 * halo) cells, with a leading band axis
+        if `indexes` is a list.
+    """
+    if pad not in PAD_MODES:
+        raise ValueError(f"Unknown pad mode '{pad}', expected one of {PAD_MODES}")
+    top, left = window.row_off - halo, window.col_off - halo
+    bottom, right = window.row_off + window.height + halo, window.col_off + window.width + halo
+    read_top, read_left = max(top, 0), max(left, 0)
+    read_bottom, read_right = min(bottom, src.height), min(right, src.width)
+    values = src.read(indexes, window=Window(read_left, read_top, read_right - read_left, read_bottom - read_top),
+                      out_dtype=np.float64)
+    if src.nodata is not None and not np.isnan(src.nodata):
+        values[values == src.nodata] = np.nan
+    padding = [(read_top - top, bottom - read_bottom), (read_left - left, right - read_right)]
+    if values.ndim == 3:
+        padding.insert(0, (0, 0))
+    if pad == "edge":
+        return np.pad(values, padding, mode="edge")
+    return np.pad(values, padding, constant_values=np.nan)
+
+def map_windows(func, tasks, max_workers=None, max_pending=None):
+    """
+    Yields `func(task)` for every task, in order, running them in a process pool.
+
+    At most `max_pending` tasks are submitted and not yet consumed at any time, so only a bounded
+    number of finished results wait in memory while earlier ones are written.
+
+    Args:
+        func (callable): Picklable function of one task.
+        tasks (iterable): Task arguments, e.g. dicts holding a window and the options.
+        max_workers (int): Worker processes; defaults to the number of CPUs.
+        max_pending (int): Bound on the tasks in flight; defaults to twice the number of workers.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    pending = deque()
+    with ProcessPoolExecutor(max_workers) as pool:
+        try:
+            for task in tasks:
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(func, task))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
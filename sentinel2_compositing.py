@@ -0,0 +1,327 @@
+# Python script for local Sentinel-2 median compositing
+
+# gee_archaeology.py builds a cloud-filtered Sentinel-2 median composite and its NDVI inside
+# Google Earth Engine, which needs credentials, round-trips and is rate-limited. This script
+# computes the same products offline from a directory of downloaded scenes:
+#
+#   ImageCollection('COPERNICUS/S2_SR')          -> find_sentinel2_scenes(scene_dir)
+#       .filterBounds(roi)                       -> filter_scenes(..., roi=roi,
+#       .filterDate(start_date, end_date)        ->               start_date=..., end_date=...,
+#       .filter(lt('CLOUDY_PIXEL_PERCENTAGE', 10)) ->             max_cloud=10)
+#   collection.median().clip(roi)                -> composite_sentinel2(...)
+#   image.normalizedDifference(['B8', 'B4'])     -> composite_sentinel2(..., ndvi_path=...)
+#
+# Every immediate subdirectory of `scene_dir` (e.g. an unzipped .SAFE product) is one scene.
+# Band files are GeoTIFF or JPEG2000 files named after the band (`*_B04_10m.jp2`, `B4.tif`...);
+# the cloud percentage and sensing date come from the granule metadata (MTD_TL.xml, as used by
+# Earth Engine), the product metadata (MTD_MSIL2A.xml) or a STAC item JSON.
+#
+# The composite is computed window by window: every scene is read onto the output grid of the
+# window (warped only when its CRS or pixel grid differs), and the per-pixel median is taken
+# across scenes, ignoring nodata. Memory is bounded by the window size and the windows run in
+# a process pool.
+
+import glob
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from contextlib import ExitStack
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds, transform_geom
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+
+from raster_blocks import block_windows, map_windows
+
+# Bands composited by default: blue, green, red and near-infrared, as in gee_archaeology.py.
+SENTINEL2_BANDS = ("B2", "B3", "B4", "B8")
+
+# Region of interest of gee_archaeology.py, [west, south, east, north] in degrees.
+DEFAULT_ROI = (-55.0, -10.0, -50.0, -5.0)
+
+_RASTER_EXTENSIONS = (".tif", ".tiff", ".jp2")
+
+# --- Scene discovery and metadata ---
+
+def _band_file(paths, band):
+    """
+    Returns the path in `paths` holding `band` (e.g. "B4" matches `..._B04_10m.jp2` and `B4.tif`), or None.
+    """
+    pattern = re.compile(rf"(?:^|[_\-.]){band[0]}0?{band[1:]}(?:[_\-.]|$)", re.IGNORECASE)
+    matches = sorted((path for path in paths if pattern.search(os.path.splitext(os.path.basename(path))[0])),
+                     key=lambda path: ("_10m" not in path, "_20m" not in path, path)) # Finest resolution first
+    return matches[0] if matches else None
+
+def _xml_value(path, *tags):
+    """
+    Returns the text of the first element whose (namespace-free) tag is one of `tags`, or None.
+    """
+    for element in ET.parse(path).getroot().iter():
+        if element.tag.rsplit("}", 1)[-1] in tags and element.text:
+            return element.text.strip()
+    return None
+
+def scene_metadata(scene_path):
+    """
+    Reads the cloudy pixel percentage and sensing date of a scene from its metadata files.
+
+    Returns:
+        tuple: (cloudy_pixel_percentage, date as 'YYYY-MM-DD'); either is None when not found.
+    """
+    cloud, date = None, None
+    for pattern in ("MTD_TL.xml", "MTD_MSIL2A.xml", "MTD_MSIL1C.xml"):
+        for path in glob.glob(os.path.join(scene_path, "**", pattern), recursive=True):
+            if cloud is None:
+                value = _xml_value(path, "CLOUDY_PIXEL_PERCENTAGE", "Cloud_Coverage_Assessment")
+                cloud = float(value) if value is not None else None
+            date = date or _xml_value(path, "SENSING_TIME", "PRODUCT_START_TIME")
+    for path in glob.glob(os.path.join(scene_path, "*.json")):
+        with open(path) as f:
+            item = json.load(f)
+        properties = item.get("properties", item)
+        if cloud is None:
+            value = properties.get("CLOUDY_PIXEL_PERCENTAGE", properties.get("eo:cloud_cover"))
+            cloud = float(value) if value is not None else None
+        date = date or properties.get("datetime")
+    if date is None:
+        # Product names carry the sensing time, e.g. S2A_MSIL2A_20200105T133851_...
+        match = re.search(r"(\d{4})(\d{2})(\d{2})T\d{6}", os.path.basename(os.path.normpath(scene_path)))
+        date = "-".join(match.groups()) if match else None
+    return cloud, date[:10] if date else None
+
+def find_sentinel2_scenes(scene_dir, bands=SENTINEL2_BANDS):
+    """
+    Lists the scenes under `scene_dir` that have a file for every band in `bands`.
+
+    Returns:
+        list: One dict per scene with its path, name, date, cloudy_pixel_percentage and band paths.
+    """
+    scenes = []
+    for scene_path in sorted(glob.glob(os.path.join(scene_dir, "*"))):
+        if not os.path.isdir(scene_path):
+            continue
+        rasters = [path for path in glob.glob(os.path.join(scene_path, "**", "*"), recursive=True)
+                   if path.lower().endswith(_RASTER_EXTENSIONS)]
+        band_paths = {band: _band_file(rasters, band) for band in bands}
+        missing = [band for band, path in band_paths.items() if path is None]
+        if missing:
+            print(f"Skipping {scene_path}: no file for bands {missing}")
+            continue
+        cloud, date = scene_metadata(scene_path)
+        scenes.append({"path": scene_path, "name": os.path.basename(os.path.normpath(scene_path)),
+                       "date": date, "cloudy_pixel_percentage": cloud, "bands": band_paths})
+    return scenes
+
+def roi_polygon(roi, points_per_edge=64):
+    """
+    GeoJSON polygon of a [west, south, east, north] rectangle, densified so its edges stay
+    straight lines of longitude and latitude (as in Earth Engine) once reprojected.
+    """
+    west, south, east, north = roi
+    steps = np.linspace(0.0, 1.0, points_per_edge, endpoint=False)
+    ring = ([(west + (east - west) * t, south) for t in steps] + [(east, south + (north - south) * t) for t in steps]
+            + [(east - (east - west) * t, north) for t in steps] + [(west, north - (north - south) * t) for t in steps])
+    return {"type": "Polygon", "coordinates": [ring + [ring[0]]]}
+
+def _scene_footprint(scene, crs):
+    """
+    Bounds (left, bottom, right, top) of a scene in `crs`.
+    """
+    with rasterio.open(next(iter(scene["bands"].values()))) as src:
+        return transform_bounds(src.crs, crs, *src.bounds)
+
+def _bounds_intersect(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def filter_scenes(scenes, roi=None, start_date=None, end_date=None, max_cloud=None):
+    """
+    Keeps the scenes intersecting `roi`, sensed in [start_date, end_date) and with a cloudy pixel
+    percentage strictly below `max_cloud`, like Earth Engine's filterBounds, filterDate and
+    filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud)). Scenes without the metadata a
+    filter needs are dropped, as in Earth Engine.
+    """
+    kept = []
+    for scene in scenes:
+        if max_cloud is not None and (scene["cloudy_pixel_percentage"] is None
+                                      or not scene["cloudy_pixel_percentage"] < max_cloud):
+            continue
+        if (start_date or end_date) and scene["date"] is None:
+            continue
+        if start_date and scene["date"] < start_date[:10]:
+            continue
+        if end_date and scene["date"] >= end_date[:10]:
+            continue
+        if roi is not None and not _bounds_intersect(_scene_footprint(scene, "EPSG:4326"), roi):
+            continue
+        kept.append(scene)
+    return kept
+
+# --- Per-pixel reductions ---
+
+def nan_median(stack):
+    """
+    Median along the first axis ignoring NaN; NaN where every value is NaN.
+
+    Sorts once (NaN sorts last) and averages the middle valid values, which is much faster than
+    `numpy.nanmedian` on stacks with many NaN values.
+    """
+    ordered = np.sort(stack, axis=0)
+    valid = np.count_nonzero(~np.isnan(ordered), axis=0)
+    lower = np.take_along_axis(ordered, (np.maximum(valid - 1, 0) // 2)[np.newaxis], axis=0)[0]
+    upper = np.take_along_axis(ordered, (valid // 2)[np.newaxis], axis=0)[0]
+    median = (lower + upper) / 2
+    median[valid == 0] = np.nan
+    return median
+
+def normalized_difference(a, b):
+    """
+    (a - b) / (a + b), like Earth Engine's normalizedDifference; NaN where a + b is 0.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = a + b
+        return np.where(total != 0, (a - b) / total, np.nan)
+
+# --- Windowed compositing ---
+
+def _grid_offset(src, crs, transform):
+    """
+    Returns the integer (row, col) offset of `transform` in the pixel grid of `src`, or None when
+    the grids differ in CRS, pixel size or alignment.
+    """
+    if src.crs != crs or src.transform.a != transform.a or src.transform.e != transform.e \
+            or src.transform.b or src.transform.d or transform.b or transform.d:
+        return None
+    col = (transform.c - src.transform.c) / src.transform.a
+    row = (transform.f - src.transform.f) / src.transform.e
+    if abs(col - round(col)) > 1e-6 or abs(row - round(row)) > 1e-6:
+        return None
+    return int(round(row)), int(round(col))
+
+def _read_on_grid(path, crs, transform, width, height):
+    """
+    Reads band 1 of `path` onto the given grid, with NaN for nodata and outside the raster.
+
+    Rasters already on the grid (same CRS, pixel size and alignment, the usual case for scenes of
+    one tile) are read directly; others are warped with nearest neighbour resampling.
+    """
+    values = np.full((height, width), np.nan, dtype=np.float32)
+    with rasterio.open(path) as src:
+        nodata = src.nodata if src.nodata is not None else 0 # Sentinel-2 L2A nodata value
+        offset = _grid_offset(src, crs, transform)
+        if offset is None:
+            with WarpedVRT(src, crs=crs, transform=transform, width=width, height=height,
+                           resampling=Resampling.nearest, src_nodata=nodata, nodata=nodata) as vrt:
+                data = vrt.read(1)
+            values[data != nodata] = data[data != nodata]
+            return values
+        row, col = offset
+        top, left = max(row, 0), max(col, 0)
+        bottom, right = min(row + height, src.height), min(col + width, src.width)
+        if bottom <= top or right <= left:
+            return values
+        data = src.read(1, window=Window(left, top, right - left, bottom - top))
+        target = values[top - row:bottom - row, left - col:right - col]
+        valid = data != nodata
+        target[valid] = data[valid]
+    return values
+
+def _composite_window(task):
+    """
+    Computes the median composite (and NDVI) of one output window (run in the process pool).
+    """
+    window, crs = task["window"], task["crs"]
+    transform = window_transform(window, task["transform"])
+    inside = geometry_mask([task["roi_geometry"]], (window.height, window.width), transform, invert=True)
+    composite = np.full((len(task["bands"]), window.height, window.width), np.nan, dtype=np.float32)
+    if inside.any() and task["scenes"]:
+        for index, band in enumerate(task["bands"]):
+            stack = np.stack([_read_on_grid(scene[band], crs, transform, window.width, window.height)
+                              for scene in task["scenes"]])
+            composite[index] = nan_median(stack)
+        composite[:, ~inside] = np.nan # clip(roi)
+    ndvi = None
+    if task["ndvi"]:
+        ndvi = normalized_difference(composite[task["bands"].index("B8")],
+                                     composite[task["bands"].index("B4")]).astype(np.float32)
+    return window, composite, ndvi
+
+def composite_sentinel2(scene_dir, output_path, ndvi_path=None, roi=DEFAULT_ROI, start_date="2020-01-01",
+                        end_date="2023-12-31", max_cloud=10, bands=SENTINEL2_BANDS, crs=None, resolution=10.0,
+                        block_size=1024, max_workers=None):
+    """
+    Writes the cloud-filtered, per-pixel median composite of the Sentinel-2 scenes in a directory.
+
+    Args:
+        scene_dir (str): Directory with one subdirectory per scene.
+        output_path (str): Output GeoTIFF, one float32 band per entry of `bands`.
+        ndvi_path (str): If set, also write the NDVI of the composite, (B8 - B4) / (B8 + B4).
+        roi (tuple): [west, south, east, north] in degrees; the composite is clipped to it.
+        start_date (str): First sensing date included, 'YYYY-MM-DD'.
+        end_date (str): Sensing dates on or after this one are excluded.
+        max_cloud (float): Scenes need a CLOUDY_PIXEL_PERCENTAGE strictly below this; None keeps all.
+        bands (tuple): Bands to composite, Earth Engine style names ("B4", "B8A"...).
+        crs (str): Output CRS; defaults to the CRS of the first selected scene.
+        resolution (float): Output pixel size in units of `crs`.
+        block_size (int): Side of the square windows processed at once, in pixels.
+        max_workers (int): Worker processes; defaults to the number of CPUs.
+
+    Returns:
+        list: The scenes that went into the composite.
+    """
+    bands = tuple(bands)
+    if ndvi_path and not {"B4", "B8"} <= set(bands):
+        raise ValueError("NDVI needs bands B4 and B8 in `bands`")
+    scenes = filter_scenes(find_sentinel2_scenes(scene_dir, bands), roi=roi, start_date=start_date,
+                           end_date=end_date, max_cloud=max_cloud)
+    if not scenes:
+        raise ValueError(f"No scene in {scene_dir} matches the ROI, date range and cloud filter")
+    print(f"Compositing {len(scenes)} scenes: {', '.join(scene['name'] for scene in scenes)}")
+
+    if crs is None:
+        with rasterio.open(scenes[0]["bands"][bands[0]]) as src:
+            crs = src.crs
+    # Output grid covering the ROI, aligned to the resolution
+    roi_geometry = transform_geom("EPSG:4326", crs, roi_polygon(roi))
+    left, bottom, right, top = transform_bounds("EPSG:4326", crs, *roi)
+    left, top = np.floor(left / resolution) * resolution, np.ceil(top / resolution) * resolution
+    width = int(np.ceil((right - left) / resolution))
+    height = int(np.ceil((top - bottom) / resolution))
+    transform = from_origin(float(left), float(top), resolution, resolution)
+    footprints = [_scene_footprint(scene, crs) for scene in scenes]
+
+    profile = {"driver": "GTiff", "width": width, "height": height, "dtype": "float32", "crs": crs,
+               "transform": transform, "nodata": np.nan, "tiled": True, "blockxsize": 256, "blockysize": 256,
+               "compress": "deflate", "predictor": 3, "BIGTIFF": "IF_SAFER"}
+    tasks = []
+    for window in block_windows(width, height, block_size):
+        bounds = rasterio.windows.bounds(window, transform)
+        tasks.append({"window": window, "crs": crs, "transform": transform, "roi_geometry": roi_geometry,
+                      "bands": bands, "ndvi": bool(ndvi_path),
+                      "scenes": [scene["bands"] for scene, footprint in zip(scenes, footprints)
+                                 if _bounds_intersect(footprint, bounds)]})
+
+    with ExitStack() as stack:
+        dst = stack.enter_context(rasterio.open(output_path, "w", count=len(bands), **profile))
+        dst.descriptions = bands
+        ndvi_dst = stack.enter_context(rasterio.open(ndvi_path, "w", count=1, **profile)) if ndvi_path else None
+        print(f"Computing {width} x {height} pixel composite in {len(tasks)} windows...")
+        for window, composite, ndvi in map_windows(_composite_window, tasks, max_workers):
+            dst.write(composite, window=window)
+            if ndvi is not None:
+                ndvi_dst.write(ndvi, 1, window=window)
+
+    print(f"Composite saved to: {output_path}")
+    if ndvi_path:
+        print(f"NDVI saved to: {ndvi_path}")
+    return scenes
+
+# Example usage (uncomment and modify with your scene directory):
+# if __name__ == "__main__":
+#     composite_sentinel2('sentinel2_scenes', 'composite.tif', ndvi_path='ndvi.tif')
@@ -0,0 +1,159 @@
+# Python script for multi-index spectral anomaly maps of Sentinel-2 composites
+
+# Buried walls, ditches and middens change the water and nutrient supply of the vegetation
+# above them, which shows up as small, local anomalies in spectral indices. Besides the NDVI
+# of gee_archaeology.py, this script computes:
+#
+# - NDRE (red edge, B8/B5) and NDMI (moisture, B8/B11) normalized differences;
+# - EVI, less saturated than NDVI over dense canopy;
+# - tasseled cap brightness, greenness and wetness (Sentinel-2 coefficients of Shi & Xu, 2019);
+# - a local z-score of chosen indices: (value - neighbourhood mean) / neighbourhood standard
+#   deviation, so anomalies stand out regardless of the regional vegetation level.
+#
+# All indices and anomaly scores are computed together from one windowed read of the band
+# stack (e.g. the composite of sentinel2_compositing.py), instead of re-reading the bands for
+# every index, and written as one multi-band tiled GeoTIFF. Windows are read with a halo for
+# the z-score neighbourhood and run in a process pool. By default every index the bands of
+# the stack support is computed: the default composite (B2, B3, B4, B8) gives NDVI and EVI;
+# composite with bands=("B2", "B3", "B4", "B5", "B8", "B11", "B12") for NDRE, NDMI and the
+# tasseled cap as well.
+
+import numpy as np
+import rasterio
+from scipy import ndimage
+
+from raster_blocks import block_windows, map_windows, read_padded_window
+from sentinel2_compositing import normalized_difference
+
+# Tasseled cap coefficients for Sentinel-2 bands B2, B3, B4, B8, B11 and B12 (Shi & Xu, 2019).
+TASSELED_CAP_BANDS = ("B2", "B3", "B4", "B8", "B11", "B12")
+TASSELED_CAP_COEFFICIENTS = {
+    "brightness": (0.3510, 0.3813, 0.3437, 0.7196, 0.2396, 0.1949),
+    "greenness": (-0.3599, -0.3533, -0.4734, 0.6633, 0.0087, -0.2856),
+    "wetness": (0.2578, 0.2305, 0.0883, 0.1071, -0.7611, -0.5308),
+}
+
+def _tasseled_cap(component):
+    coefficients = TASSELED_CAP_COEFFICIENTS[component]
+    return lambda bands: sum(c * bands[band] for c, band in zip(coefficients, TASSELED_CAP_BANDS))
+
+def enhanced_vegetation_index(blue, red, nir):
+    """
+    EVI = 2.5 (NIR - red) / (NIR + 6 red - 7.5 blue + 1), on surface reflectance (0-1).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 2.5 * (nir - red) / (nir + 6.0 * red - 7.5 * blue + 1.0)
+
+# Index name -> (bands it needs, function of a {band: reflectance array} dict).
+SPECTRAL_INDICES = {
+    "ndvi": (("B8", "B4"), lambda bands: normalized_difference(bands["B8"], bands["B4"])),
+    "ndre": (("B8", "B5"), lambda bands: normalized_difference(bands["B8"], bands["B5"])),
+    "ndmi": (("B8", "B11"), lambda bands: normalized_difference(bands["B8"], bands["B11"])),
+    "evi": (("B2", "B4", "B8"), lambda bands: enhanced_vegetation_index(bands["B2"], bands["B4"], bands["B8"])),
+    "tc_brightness": (TASSELED_CAP_BANDS, _tasseled_cap("brightness")),
+    "tc_greenness": (TASSELED_CAP_BANDS, _tasseled_cap("greenness")),
+    "tc_wetness": (TASSELED_CAP_BANDS, _tasseled_cap("wetness")),
+}
+
+def local_zscore(values, radius=25):
+    """
+    (value - mean) / standard deviation over the (2 * radius + 1) pixel square around each pixel,
+    ignoring NaN; NaN where the neighbourhood has no spread.
+    """
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    size = 2 * radius + 1
+    count = ndimage.uniform_filter(valid.astype(np.float64), size=size, mode="constant")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = ndimage.uniform_filter(filled, size=size, mode="constant") / count
+        mean_square = ndimage.uniform_filter(filled * filled, size=size, mode="constant") / count
+        std = np.sqrt(np.maximum(mean_square - mean * mean, 0.0))
+        zscore = np.where(valid & (std > 1e-12), (values - mean) / std, np.nan)
+    return zscore
+
+# --- Windowed single-pass processing ---
+
+def _output_bands(indices, zscore_indices):
+    return list(indices) + [f"{index}_zscore" for index in zscore_indices]
+
+def _indices_block(task):
+    """
+    Computes every index and z-score of one window from one read of the bands (run in the process pool).
+    """
+    window, halo = task["window"], task["halo"]
+    band_names = list(task["band_numbers"])
+    with rasterio.open(task["raster_path"]) as src:
+        stack = read_padded_window(src, window, halo, indexes=[task["band_numbers"][band] for band in band_names])
+    bands = {band: stack[i] * task["reflectance_scale"] for i, band in enumerate(band_names)}
+    core = (slice(halo, halo + window.height), slice(halo, halo + window.width))
+
+    values = {index: SPECTRAL_INDICES[index][1](bands) for index in task["computed"]}
+    results = [values[index][core] for index in task["indices"]]
+    results += [local_zscore(values[index], task["zscore_radius"])[core] for index in task["zscore_indices"]]
+    return window, np.stack(results).astype(np.float32)
+
+def compute_spectral_indices(raster_path, output_path, indices=None, zscore_indices=("ndvi",),
+                             zscore_radius=25, band_numbers=None, reflectance_scale=1e-4, block_size=1024,
+                             max_workers=None):
+    """
+    Writes the spectral indices and local z-scores of a band stack as one multi-band float32 GeoTIFF.
+
+    Args:
+        raster_path (str): Band stack, e.g. the output of `sentinel2_compositing.composite_sentinel2`.
+        output_path (str): Output GeoTIFF; band descriptions are the index names, then `<index>_zscore`.
+        indices (tuple): Indices to compute, from SPECTRAL_INDICES; defaults to every index the bands of the
+            raster support, so e.g. the default B2, B3, B4, B8 composite gets NDVI and EVI only.
+        zscore_indices (tuple): Indices to also write as local z-scores; computed even if not in `indices`.
+        zscore_radius (int): Half-width of the z-score neighbourhood, in pixels.
+        band_numbers (dict): 1-based band number of each Sentinel-2 band ({"B4": 3, ...}); defaults to the
+            band descriptions of the raster.
+        reflectance_scale (float): Factor from the stored values to reflectance (1e-4 for Sentinel-2 L2A).
+        block_size (int): Side of the square windows read and processed at once, in pixels.
+        max_workers (int): Worker processes; defaults to the number of CPUs.
+
+    Returns:
+        list: Names of the output bands, in order.
+    """
+    unknown = (set(indices or ()) | set(zscore_indices)) - set(SPECTRAL_INDICES)
+    if unknown:
+        raise ValueError(f"Unknown indices {sorted(unknown)}, expected some of {tuple(SPECTRAL_INDICES)}")
+    halo = zscore_radius if zscore_indices else 0
+
+    with rasterio.open(raster_path) as src:
+        if band_numbers is None:
+            band_numbers = {description: number for number, description in enumerate(src.descriptions, start=1)
+                            if description}
+        if indices is None:
+            indices = [index for index, (bands, _) in SPECTRAL_INDICES.items()
+                       if all(band in band_numbers for band in bands)]
+            skipped = [index for index in SPECTRAL_INDICES if index not in indices]
+            if skipped:
+                print(f"Skipping {', '.join(skipped)}: {raster_path} lacks the bands they need")
+        computed = list(dict.fromkeys(list(indices) + list(zscore_indices)))
+        needed = sorted({band for index in computed for band in SPECTRAL_INDICES[index][0]})
+        missing = [band for band in needed if band not in band_numbers]
+        if missing:
+            raise ValueError(f"{raster_path} has no band {missing}; name the bands with `band_numbers`")
+        profile = src.profile.copy()
+        windows = block_windows(src.width, src.height, block_size)
+    output_bands = _output_bands(indices, zscore_indices)
+    profile.update(driver="GTiff", dtype="float32", count=len(output_bands), nodata=np.nan, tiled=True,
+                   blockxsize=256, blockysize=256, compress="deflate", predictor=3, interleave="pixel",
+                   BIGTIFF="IF_SAFER")
+
+    tasks = [{"raster_path": raster_path, "window": window, "halo": halo,
+              "band_numbers": {band: band_numbers[band] for band in needed}, "reflectance_scale": reflectance_scale,
+              "computed": computed, "indices": list(indices), "zscore_indices": list(zscore_indices),
+              "zscore_radius": zscore_radius}
+             for window in windows]
+    print(f"Computing {', '.join(output_bands)} over {len(windows)} windows...")
+    with rasterio.open(output_path, "w", **profile) as dst:
+        dst.descriptions = output_bands
+        for window, results in map_windows(_indices_block, tasks, max_workers):
+            dst.write(results, window=window)
+    print(f"Spectral indices saved to: {output_path}")
+    return output_bands
+
+# Example usage (uncomment and modify with your composite path; composite B2-B5, B8, B11 and B12):
+# if __name__ == "__main__":
+#     compute_spectral_indices('composite.tif', 'spectral_indices.tif', zscore_indices=('ndvi', 'ndre'))
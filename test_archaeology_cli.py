@@ -0,0 +1,42 @@
+# Tests for the command line entry point of archaeology_cli.py
+#
+# Run with: python -m pytest -q
+
+import pytest
+
+from arches_data_management import INGEST_MODES
+from archaeology_cli import build_parser, main
+from benchmarks import LocalServer
+from lidar_interpolation import FILL_METHODS
+from openatlas_mirror import WATERMARKS
+
+def _choices(command, option):
+    subcommands = next(action for action in build_parser()._actions if action.dest == "command")
+    parser = subcommands.choices[command]
+    return next(action.choices for action in parser._actions if option in action.option_strings)
+
+def test_choices_match_the_modules():
+    assert tuple(_choices("grid", "--fill-dtm")) == FILL_METHODS
+    assert tuple(_choices("arches-sync", "--mode")) == INGEST_MODES
+    assert tuple(_choices("openatlas-sync", "--watermark")) == WATERMARKS
+
+@pytest.mark.parametrize("argv", [["grid", "survey.las", "--fill-dtm", "kriging"],
+                                  ["arches-sync", "--mode", "parallel"],
+                                  ["openatlas-sync", "--watermark", "etag"]])
+def test_unknown_choices_are_usage_errors(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(argv)
+    assert exit_info.value.code == 2
+    assert "invalid choice" in capsys.readouterr().err
+
+def test_missing_input_is_reported(tmp_path, capsys):
+    assert main(["grid", str(tmp_path / "missing.las"), "--dem", str(tmp_path / "dem.tif"),
+                 "--dtm", str(tmp_path / "dtm.tif")]) == 1
+    assert capsys.readouterr().err.startswith("archaeology_cli.py grid: error: ")
+
+def test_connection_errors_are_reported(tmp_path, capsys):
+    with LocalServer(None) as server:
+        closed_url = server.url # Nothing listens here any more
+    assert main(["openatlas-sync", "--db", str(tmp_path / "mirror.sqlite"), "--url", closed_url,
+                 "--api-key", "key"]) == 1
+    assert capsys.readouterr().err.startswith("archaeology_cli.py openatlas-sync: error: ")
@@ -0,0 +1,209 @@
+# Tests for the Arches client and ingest of arches_data_management.py, against the FakeArches server of benchmarks.py
+#
+# Run with: python -m pytest -q
+
+import json
+
+import pytest
+import requests
+
+from arches_data_management import ArchesClient, ingest_sites, iter_json_array
+from benchmarks import FakeArches, LocalServer
+
+class FlakyArches(FakeArches):
+    """
+    FakeArches answering the first `failures` requests to `path` with 503.
+    """
+
+    def __init__(self, path, failures, **kwargs):
+        super().__init__(n_resources=4, **kwargs)
+        self.path = path
+        self.failures = failures
+        self.calls = 0
+
+    def handle(self, method, path, query, body, headers):
+        if path == self.path:
+            self.calls += 1
+            if self.calls <= self.failures:
+                return 503, {"detail": "Service unavailable"}, {}
+        return super().handle(method, path, query, body, headers)
+
+def _client(server, **options):
+    return ArchesClient(server.url, "user", "password", backoff_base=0.0, **options)
+
+# --- Retries ---
+
+def test_get_is_retried_on_server_errors():
+    app = FlakyArches("/resources/", failures=2)
+    with LocalServer(app) as server, _client(server) as client:
+        assert len(client.list_resources(limit=10)["results"]) == 4
+    assert app.calls == 3
+
+def test_post_is_not_retried_on_server_errors():
+    app = FlakyArches("/auth/token/", failures=1)
+    with LocalServer(app) as server, _client(server) as client:
+        with pytest.raises(requests.HTTPError):
+            client.token()
+        assert client.token()
+    assert app.calls == 2
+
+def test_post_is_retried_when_never_sent():
+    with LocalServer(FakeArches(n_resources=0)) as server:
+        closed_url = server.url # Nothing listens here any more
+    client = ArchesClient(closed_url, "user", "password", max_retries=2, backoff_base=0.0)
+    calls = []
+    send = client.session.request
+    client.session.request = lambda *args, **kwargs: calls.append(args) or send(*args, **kwargs)
+    with client, pytest.raises(requests.ConnectionError):
+        client.token()
+    assert len(calls) == 3
+
+# --- Streaming ---
+
+DOCUMENT = json.dumps({
+    "count": 3,
+    "results": [{"name": "Ring [ditch]", "note": "a \\\"quoted\\\" {brace}, comma"},
+                {"name": "Mound ]]", "values": [-0.5e-3, 12, 1.25E+2, True, None], "unicode": "Castro d\u2019Ar\u00e9"},
+                "plain string", [], {}],
+    "next": None,
+}, ensure_ascii=False).encode()
+
+def _parse(chunks, key="results"):
+    """
+    Returns the array elements and the other members parsed by `iter_json_array`.
+    """
+    elements = iter_json_array(chunks, key=key)
+    items = []
+    while True:
+        try:
+            items.append(next(elements))
+        except StopIteration as end:
+            return items, end.value
+
+def test_iter_json_array_matches_json_loads():
+    expected = json.loads(DOCUMENT)
+    items, members = _parse([DOCUMENT])
+    assert items == expected.pop("results")
+    assert members == expected
+
+@pytest.mark.parametrize("document", [DOCUMENT, b'{"results": [-0.5e-3, 1E+2, 10, "\\u00e9"]}'])
+def test_iter_json_array_handles_every_chunk_boundary(document):
+    expected = _parse([document])
+    for split in range(1, len(document)):
+        assert _parse([document[:split], document[split:]]) == expected
+    assert _parse(document[i:i + 1] for i in range(len(document))) == expected
+
+@pytest.mark.parametrize("document, expected", [
+    (b'{"results": []}', ([], {})),
+    (b' { "count" : 0 , "results" : [ ] , "next" : null } ', ([], {"count": 0, "next": None})),
+    (b'{}', ([], {})),
+    (b'{"results": [1, 2], "other": [3]}', ([1, 2], {"other": [3]})),
+    (b'{"results": "not an array"}', ([], {"results": "not an array"})),
+])
+def test_iter_json_array_edge_cases(document, expected):
+    assert _parse([document]) == expected
+
+@pytest.mark.parametrize("document", [b'[1, 2]', b'{"results": [1 2]}', b'{"results": [1, 2]', b'{"a" 1}'])
+def test_iter_json_array_rejects_malformed_documents(document):
+    with pytest.raises(ValueError):
+        _parse([document])
+
+class UnlinkedArches(FakeArches):
+    """
+    FakeArches without `next` links that returns at most `max_page` resources per page.
+    """
+
+    def __init__(self, max_page, **kwargs):
+        super().__init__(**kwargs)
+        self.max_page = max_page
+        self.pages = 0
+
+    def handle(self, method, path, query, body, headers):
+        if path == "/resources/" and method == "GET":
+            self.pages += 1
+            query = {**query, "limit": [str(min(int(query["limit"][0]), self.max_page))]}
+            status, payload, extra = super().handle(method, path, query, body, headers)
+            payload.pop("next", None)
+            payload.pop("previous", None)
+            return status, payload, extra
+        return super().handle(method, path, query, body, headers)
+
+@pytest.mark.parametrize("prefetch_pages", [0, 2])
+def test_pages_without_links_are_read_until_empty(prefetch_pages):
+    app = UnlinkedArches(max_page=3, n_resources=10)
+    with LocalServer(app) as server, _client(server) as client:
+        resources = list(client.iter_resources(page_size=5, prefetch_pages=prefetch_pages))
+    assert [resource["resourceinstanceid"] for resource in resources] == list(app.resources)
+    assert app.pages == 5 # 3 + 3 + 3 + 1 + an empty page
+
+def test_streamed_pages_survive_retries():
+    app = FlakyArches("/resources/", failures=2)
+    with LocalServer(app) as server, _client(server, max_concurrency=1) as client:
+        resources = list(client.iter_resources(page_size=3))
+    assert len(resources) == 4
+
+# --- Ingest ---
+
+NODE_MAP = {"name": "name-node", "period": "period-node", "geometry": "geometry-node"}
+
+def _sites(n_sites=30):
+    """
+    Candidate sites keyed by "site_id"; every 7th has no name (rejected by the server) and every 11th no
+    "site_id" (rejected while mapping).
+    """
+    sites = []
+    for i in range(n_sites):
+        site = {"site_id": f"S{i:03d}", "name": None if i % 7 == 3 else f"Site {i}", "period": "Iron Age",
+                "geometry": {"type": "Point", "coordinates": [-55.0 + i * 0.01, -10.0]}}
+        if i % 11 == 5:
+            del site["site_id"]
+        sites.append(site)
+    return sites
+
+def _ingest(server, ledger_path, mode, sites=None):
+    with _client(server, max_concurrency=4) as client:
+        return ingest_sites(client, _sites() if sites is None else sites, "site-graph", NODE_MAP, key_field="site_id",
+                            mode=mode, batch_size=8, ledger_path=str(ledger_path))
+
+def _ledger_keys(ledger_path):
+    with open(ledger_path) as f:
+        return sorted(json.loads(line)["key"] for line in f if line.strip())
+
+@pytest.mark.parametrize("mode", ["concurrent", "bulk"])
+def test_rerun_creates_no_resources(tmp_path, mode):
+    app = FakeArches(n_resources=0)
+    with LocalServer(app) as server:
+        first = _ingest(server, tmp_path / "ledger.jsonl", mode)
+        created = dict(app.resources)
+        second = _ingest(server, tmp_path / "ledger.jsonl", mode)
+    assert first["created"] == len(created) == 23
+    assert second["created"] == 0 and second["skipped"] == 23
+    assert app.resources == created
+
+@pytest.mark.parametrize("mode", ["concurrent", "bulk"])
+def test_invalid_sites_are_reported_as_failed(tmp_path, mode):
+    app = FakeArches(n_resources=0)
+    with LocalServer(app) as server:
+        report = _ingest(server, tmp_path / "ledger.jsonl", mode)
+    failed = sorted(report["failed"], key=lambda failure: failure["index"])
+    assert [failure["index"] for failure in failed] == [3, 5, 10, 16, 17, 24, 27]
+    unmapped = [failure for failure in failed if failure["key"] is None]
+    assert [failure["index"] for failure in unmapped] == [5, 16, 27]
+    assert all("site_id" in failure["error"] for failure in unmapped)
+    assert all(failure["key"] == f"S{failure['index']:03d}" for failure in failed if failure["key"])
+    assert len(report["resource_ids"]) == report["created"] == 23
+    assert _ledger_keys(tmp_path / "ledger.jsonl") == sorted(report["resource_ids"])
+
+def test_partially_written_ledger_resumes(tmp_path):
+    ledger_path = tmp_path / "ledger.jsonl"
+    app = FakeArches(n_resources=0)
+    with LocalServer(app) as server:
+        _ingest(server, ledger_path, "concurrent")
+        created = dict(app.resources)
+        # Keep 10 entries and half of the 11th, as if the run had been killed while writing
+        lines = ledger_path.read_text().splitlines(keepends=True)
+        ledger_path.write_text("".join(lines[:10]) + lines[10][:len(lines[10]) // 2])
+        resumed = _ingest(server, ledger_path, "concurrent")
+    assert resumed["skipped"] == 10 and resumed["created"] == 13
+    assert app.resources == created # Resource IDs derive from the keys, so re-posted sites are not duplicated
+    assert _ledger_keys(ledger_path) == sorted(json.loads(line)["key"] for line in lines)
@@ -0,0 +1,71 @@
+# Tests for the resumable export scheduler of gee_export_scheduler.py, against FakeEarthEngineBackend
+#
+# Run with: python -m pytest -q
+
+import collections
+import json
+
+import pytest
+
+from gee_export_scheduler import ExportScheduler, FakeEarthEngineBackend, split_region
+
+ROI = [0.0, 0.0, 0.5, 0.5]
+
+def _scheduler(backend, progress_path, **options):
+    tiles = split_region(ROI, scale=10.0, max_pixels_per_tile=1e6)
+    options = {"max_concurrent": 4, "max_retries": 50, "backoff_base": 0.001, "backoff_max": 0.01,
+               "poll_interval": 0.005, "seed": 0, **options}
+    return ExportScheduler(backend, None, tiles, progress_path, **options)
+
+def _tasks_per_tile(backend):
+    """
+    Returns, per task description, the (started, failed) task counts on the fake server.
+    """
+    started, failed = collections.Counter(), collections.Counter()
+    for task in backend.tasks.values():
+        started[task["description"]] += 1
+        failed[task["description"]] += task["fails"]
+    return started, failed
+
+def test_split_region_respects_the_pixel_limit():
+    tiles = split_region(ROI, scale=10.0, max_pixels_per_tile=1e6)
+    assert len(tiles) == 36
+    for tile in tiles:
+        west, south, east, north = tile["bounds"]
+        assert (east - west) * 111320.0 / 10.0 * (north - south) * 111320.0 / 10.0 <= 1e6
+
+@pytest.mark.parametrize("failure_rate, start_failure_rate", [(0.0, 0.0), (0.3, 0.2)])
+def test_resumed_run_submits_each_tile_once_plus_retries(tmp_path, failure_rate, start_failure_rate):
+    progress_path = str(tmp_path / "progress.json")
+    backend = FakeEarthEngineBackend(duration=(0.05, 0.15), failure_rate=failure_rate,
+                                     start_failure_rate=start_failure_rate, seed=3)
+
+    # Interrupted while tasks are running on the server
+    interrupted = _scheduler(backend, progress_path).run(timeout=0.1)
+    assert interrupted["running"] > 0 and interrupted["pending"] > 0
+    with open(progress_path) as f:
+        saved = json.load(f)["tiles"]
+    assert sum(tile["state"] == "running" for tile in saved.values()) == interrupted["running"]
+
+    # A new process resumes from the progress file against the same server
+    resumed = _scheduler(backend, progress_path, seed=1).run(timeout=60)
+    assert resumed == {"pending": 0, "running": 0, "completed": 36, "failed": 0}
+
+    started, failed = _tasks_per_tile(backend)
+    assert len(started) == 36
+    for description, count in started.items():
+        assert count == 1 + failed[description] # Running tasks were re-attached, not submitted again
+    rejected = backend.start_calls - len(backend.tasks)
+    assert (rejected > 0) == (start_failure_rate > 0)
+
+def test_tiles_out_of_retries_fail_and_are_retried_by_the_next_run(tmp_path):
+    progress_path = str(tmp_path / "progress.json")
+    backend = FakeEarthEngineBackend(duration=(0.0, 0.01), failure_rate=1.0)
+    counts = _scheduler(backend, progress_path, max_retries=1).run(timeout=60)
+    assert counts["failed"] == 36
+    assert len(backend.tasks) == 2 * 36
+
+    backend.failure_rate = 0.0
+    counts = _scheduler(backend, progress_path, max_retries=1).run(timeout=60)
+    assert counts["completed"] == 36
+    assert len(backend.tasks) == 3 * 36
@@ -0,0 +1,83 @@
+# Tests for the LiDAR gridding of lidar_archaeology.py
+#
+# Run with: python -m pytest -q
+
+import numpy as np
+import pytest
+import rasterio
+
+from benchmarks import write_synthetic_las
+from lidar_archaeology import CellStatistics, cell_indices, grid_points, process_lidar_for_archaeology
+
+def _loop_grid(x, y, z, min_x, max_y, resolution, rows, cols, reducer, percentile=50.0):
+    """
+    Per-point loop reference for `grid_points`: collects the Z values of every cell, then reduces them.
+    """
+    cells = {}
+    for px, py, pz in zip(x, y, z):
+        col = int((px - min_x) / resolution)
+        row = int((max_y - py) / resolution)
+        if 0 <= row < rows and 0 <= col < cols:
+            cells.setdefault((row, col), []).append(pz)
+    grid = np.zeros((rows, cols)) if reducer == "count" else np.full((rows, cols), np.nan)
+    reduce = {"mean": np.mean, "min": min, "max": max, "count": len,
+              "percentile": lambda values: np.percentile(values, percentile)}[reducer]
+    for (row, col), values in cells.items():
+        grid[row, col] = reduce(values)
+    return grid
+
+@pytest.fixture
+def edge_points():
+    """
+    Random points on an 8 row, 10 column grid of 2 m cells, plus points exactly on cell and grid edges and outside
+    the grid; the right half of the grid stays empty.
+    """
+    rng = np.random.default_rng(1)
+    x = rng.uniform(0.0, 10.0, 500)
+    y = rng.uniform(0.0, 16.0, 500)
+    edges_x = np.array([0.0, 2.0, 4.0, 9.999, 10.0, 0.0, 0.0, -0.5, 3.0])
+    edges_y = np.array([16.0, 14.0, 0.0, 0.001, 8.0, 0.0, 16.5, 8.0, 12.0])
+    x, y = np.concatenate([x, edges_x]), np.concatenate([y, edges_y])
+    z = np.round(rng.normal(100.0, 5.0, len(x)), 2)
+    return x, y, z, 0.0, 16.0, 2.0, 8, 10
+
+@pytest.fixture(scope="module")
+def synthetic_las(tmp_path_factory):
+    return write_synthetic_las(str(tmp_path_factory.mktemp("las") / "synthetic.las"), 60_000, extent=200.0)
+
+def _grid(las_path, output_dir, chunk_size, classify_ground):
+    dem_path, dtm_path = str(output_dir / "dem.tif"), str(output_dir / "dtm.tif")
+    process_lidar_for_archaeology(las_path, dem_path, dtm_path, resolution=2.0, chunk_size=chunk_size,
+                                  classify_ground=classify_ground, visualization_path=None)
+    with rasterio.open(dem_path) as dem, rasterio.open(dtm_path) as dtm:
+        return dem.read(1), dtm.read(1)
+
+@pytest.mark.parametrize("classify_ground", [False, True])
+@pytest.mark.parametrize("chunk_size", [1_000, 7_777, 60_000, 100_000])
+def test_streamed_grids_are_bit_identical(synthetic_las, tmp_path, chunk_size, classify_ground):
+    (tmp_path / "memory").mkdir()
+    (tmp_path / "streamed").mkdir()
+    in_memory = _grid(synthetic_las, tmp_path / "memory", None, classify_ground)
+    streamed = _grid(synthetic_las, tmp_path / "streamed", chunk_size, classify_ground)
+    for expected, actual in zip(in_memory, streamed):
+        assert not np.all(np.isnan(expected))
+        assert np.array_equal(expected, actual, equal_nan=True)
+
+@pytest.mark.parametrize("reducer", ["mean", "min", "max", "count", "percentile"])
+def test_grid_points_matches_loop(edge_points, reducer):
+    expected = _loop_grid(*edge_points, reducer, percentile=90.0)
+    actual = grid_points(*edge_points, reducer=reducer, percentile=90.0)
+    assert np.isnan(expected).any() or reducer == "count"
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+    assert np.array_equal(np.isnan(actual), np.isnan(expected))
+
+@pytest.mark.parametrize("reducer", CellStatistics.REDUCERS)
+def test_cell_statistics_match_loop(edge_points, reducer):
+    x, y, z, min_x, max_y, resolution, rows, cols = edge_points
+    stats = CellStatistics(rows, cols)
+    for chunk in np.array_split(np.arange(len(x)), 7):
+        indices, inside = cell_indices(x[chunk], y[chunk], min_x, max_y, resolution, rows, cols)
+        stats.add(indices, z[chunk][inside])
+    expected = _loop_grid(*edge_points, reducer)
+    np.testing.assert_allclose(stats.reduce(reducer), expected, rtol=0, atol=1e-9)
+    assert np.array_equal(np.isnan(stats.reduce(reducer)), np.isnan(expected))
@@ -0,0 +1,64 @@
+# Tests for the candidate extraction and cross-referencing of lidar_candidates.py
+#
+# Run with: python -m pytest -q
+
+import json
+
+import pytest
+from rasterio.warp import transform as transform_coordinates
+
+from benchmarks import write_synthetic_mound_dtm
+from lidar_candidates import cross_reference, extract_candidates, write_candidates_geojson
+
+@pytest.fixture(scope="module")
+def mound_dtm(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dtm") / "mounds.tif")
+    centers = write_synthetic_mound_dtm(path, size=300, n_mounds=64)
+    return path, centers
+
+def _extract(dtm_path, block_size):
+    return extract_candidates(dtm_path, threshold=0.3, lrm_radius=8, max_size=24, block_size=block_size, max_workers=1)
+
+def _candidate_ids(path, candidates, **options):
+    write_candidates_geojson(path, candidates, **options)
+    with open(path) as f:
+        return [feature["properties"]["candidate_id"] for feature in json.load(f)["features"]]
+
+def _records(centers, crs="EPSG:32721"):
+    lons, lats = transform_coordinates(crs, "EPSG:4326", centers[:, 0], centers[:, 1])
+    return [{"source": "openatlas", "id": i, "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+            for i, (lon, lat) in enumerate(zip(lons, lats))]
+
+def test_candidate_ids_are_stable_across_blocks(mound_dtm, tmp_path):
+    dtm_path, centers = mound_dtm
+    whole = _extract(dtm_path, block_size=1024)
+    blocked = _extract(dtm_path, block_size=64)
+    assert len(whole["geometry"]) == len(centers)
+    ids = _candidate_ids(str(tmp_path / "whole.geojson"), whole)
+    assert len(set(ids)) == len(ids)
+    assert sorted(_candidate_ids(str(tmp_path / "blocked.geojson"), blocked)) == sorted(ids)
+
+def test_cross_reference_tags_recorded_candidates(mound_dtm, tmp_path):
+    dtm_path, centers = mound_dtm
+    candidates = _extract(dtm_path, block_size=128)
+    records = _records(centers[::2])
+    matches = cross_reference(candidates, records)
+    assert matches["recorded"].sum() == len(records)
+    assert sorted(matches["record_index"].tolist()) == list(range(len(records)))
+
+    all_ids = _candidate_ids(str(tmp_path / "all.geojson"), candidates)
+    new_ids = _candidate_ids(str(tmp_path / "new.geojson"), candidates, matches=matches, records=records, only_new=True)
+    assert len(new_ids) == len(centers) - len(records)
+    assert set(new_ids) < set(all_ids) # The IDs do not depend on which candidates are written
+
+def test_missing_crs_is_rejected(mound_dtm, tmp_path):
+    dtm_path, centers = mound_dtm
+    candidates = _extract(dtm_path, block_size=1024)
+    records = _records(centers)
+    with pytest.raises(ValueError):
+        cross_reference(candidates, records, records_crs=None)
+    no_crs = {**candidates, "crs": None}
+    with pytest.raises(ValueError):
+        cross_reference(no_crs, records)
+    with pytest.raises(ValueError):
+        write_candidates_geojson(str(tmp_path / "candidates.geojson"), no_crs)
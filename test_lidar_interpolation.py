@@ -0,0 +1,33 @@
+# Tests for the DTM hole filling of lidar_interpolation.py
+#
+# Run with: python -m pytest -q
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic_dtm
+from lidar_interpolation import fill_dtm_holes
+
+@pytest.fixture
+def lake_dtm():
+    """
+    Undulating terrain with one irregular hole crossing several 16-cell block edges.
+    """
+    dtm = synthetic_dtm(80, 80, hole_fraction=0.0)
+    row, col = np.mgrid[0:80, 0:80]
+    dtm[(row - 37.0) ** 2 / 200.0 + (col - 41.0) ** 2 / 500.0 < 1.0] = np.nan
+    return dtm
+
+@pytest.mark.parametrize("block_size", [16, 23, 80])
+def test_tin_fill_does_not_depend_on_blocks(lake_dtm, block_size):
+    whole = fill_dtm_holes(lake_dtm, "tin", block_size=1000, max_workers=1)
+    blocked = fill_dtm_holes(lake_dtm, "tin", block_size=block_size, max_workers=2)
+    assert not np.isnan(whole).any()
+    assert np.array_equal(blocked, whole)
+
+def test_search_radius_leaves_far_cells_empty(lake_dtm):
+    for method in ("idw", "tin"):
+        filled = fill_dtm_holes(lake_dtm, method, search_radius=3.0, block_size=16)
+        holes = np.isnan(lake_dtm)
+        assert np.isnan(filled[37, 41]) and not np.isnan(filled[holes]).all()
+        assert np.array_equal(filled[~holes], lake_dtm[~holes])
@@ -0,0 +1,24 @@
+# Tests for the terrain derivatives of lidar_terrain_derivatives.py
+#
+# Run with: python -m pytest -q
+
+import numpy as np
+
+from benchmarks import synthetic_dtm
+from lidar_terrain_derivatives import local_relief_model
+
+def test_local_relief_model_ignores_nan():
+    dtm = synthetic_dtm(40, 40, hole_fraction=0.1)
+    dtm[20, 20] = 101.0
+    lrm = local_relief_model(dtm, radius=3)
+    assert np.array_equal(np.isnan(lrm), np.isnan(dtm))
+    # Mean over the valid cells of the 7 x 7 window, by hand
+    window = dtm[17:24, 17:24]
+    assert np.isnan(window).any()
+    np.testing.assert_allclose(lrm[20, 20], dtm[20, 20] - np.nanmean(window))
+
+def test_local_relief_model_of_a_plane_is_flat():
+    row, col = np.mgrid[0:30, 0:30]
+    plane = 2.0 * row + 0.5 * col
+    lrm = local_relief_model(plane, radius=4)
+    np.testing.assert_allclose(lrm[4:-4, 4:-4], 0.0, atol=1e-9)
@@ -0,0 +1,114 @@
+# Tests for the cell statistics cache of lidar_tile_cache.py and its use by lidar_batch_processing.py
+#
+# Run with: python -m pytest -q
+
+import os
+
+import laspy
+import numpy as np
+import pytest
+import rasterio
+
+from benchmarks import write_synthetic_las
+from lidar_batch_processing import process_lidar_collection
+from lidar_tile_cache import CellStatisticsCache
+
+def _write_tile(path, index, seed, extent=100.0):
+    """
+    Writes a synthetic tile shifted to position `index` in a row of tiles.
+    """
+    write_synthetic_las(path, 20_000, extent=extent, seed=seed)
+    las = laspy.read(path)
+    las.header.offsets = las.header.offsets + [index * extent, 0.0, 0.0]
+    las.x = np.asarray(las.x) + index * extent
+    las.write(path)
+
+def _add_entry(cache, key, size, mtime):
+    staging = cache.staging_dir()
+    with open(os.path.join(staging, "sum.npy"), "wb") as f:
+        f.write(b"\0" * size)
+    cache.commit(key, staging, {"points": size})
+    os.utime(os.path.join(cache.entry_dir(key), "meta.json"), (mtime, mtime))
+
+# --- Keys ---
+
+def test_keys_change_with_contents_and_params(tmp_path):
+    tile = tmp_path / "tile.las"
+    tile.write_bytes(b"first")
+    cache = CellStatisticsCache(str(tmp_path / "cache"))
+    digested = []
+
+    def recording_map(func, paths):
+        digested.extend(paths)
+        return map(func, paths)
+
+    key = cache.tile_keys([str(tile)], {"resolution": 1.0}, map_func=recording_map)
+    assert cache.tile_keys([str(tile)], {"resolution": 1.0}, map_func=recording_map) == key
+    assert digested == [str(tile)] # The second call reused the remembered digest
+    assert cache.tile_keys([str(tile)], {"resolution": 2.0}) != key
+
+    tile.write_bytes(b"second")
+    os.utime(tile, ns=(0, os.stat(tile).st_mtime_ns + 10**9))
+    assert cache.tile_keys([str(tile)], {"resolution": 1.0}, map_func=recording_map) != key
+    assert len(digested) == 2
+
+# --- Entries ---
+
+def test_staged_entries_are_invisible_until_committed(tmp_path):
+    cache = CellStatisticsCache(str(tmp_path), max_bytes=0)
+    staging = cache.staging_dir()
+    with open(os.path.join(staging, "sum.npy"), "wb") as f:
+        f.write(b"\0" * 100)
+    assert cache.get("key") is None
+    assert cache.evict() == [] # Partial entries are neither counted nor deleted
+    assert os.path.isdir(staging)
+
+    cache.commit("key", staging, {"points": 7})
+    assert not os.path.exists(staging)
+    assert cache.get("key") == {"points": 7}
+
+def test_commit_keeps_the_first_entry(tmp_path):
+    cache = CellStatisticsCache(str(tmp_path))
+    for points in (1, 2):
+        cache.commit("key", cache.staging_dir(), {"points": points})
+    assert cache.get("key") == {"points": 1}
+    assert sorted(os.listdir(tmp_path)) == ["key"]
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = CellStatisticsCache(str(tmp_path), max_bytes=2500)
+    for mtime, key in enumerate(["a", "b", "c", "d"]):
+        _add_entry(cache, key, 1000, 1_000_000 + mtime)
+    cache.get("a") # Now the most recently used
+    assert cache.evict(keep=["b"]) == ["c", "d"]
+    assert cache.get("c") is None and cache.get("d") is None
+    assert cache.get("a") and cache.get("b")
+
+# --- Batch processing ---
+
+@pytest.fixture
+def tile_dir(tmp_path):
+    directory = tmp_path / "tiles"
+    directory.mkdir()
+    for index in range(3):
+        _write_tile(str(directory / f"tile_{index}.las"), index, seed=index)
+    return directory
+
+def _mosaic(output_dir):
+    with rasterio.open(os.path.join(output_dir, "dem.vrt")) as src:
+        return src.read(1)
+
+def test_rerun_grids_only_changed_tiles(tile_dir, tmp_path):
+    options = {"output_dir": str(tmp_path / "out"), "cache_dir": str(tmp_path / "cache"), "max_workers": 1}
+    first = process_lidar_collection(str(tile_dir), **options)
+    assert not any(tile["cached"] for tile in first)
+    mosaic = _mosaic(options["output_dir"])
+
+    again = process_lidar_collection(str(tile_dir), **options)
+    assert all(tile["cached"] for tile in again)
+    assert all(tile["write_seconds"] == 0.0 for tile in again)
+    assert np.array_equal(_mosaic(options["output_dir"]), mosaic, equal_nan=True)
+
+    _write_tile(str(tile_dir / "tile_1.las"), 1, seed=10)
+    changed = process_lidar_collection(str(tile_dir), **options)
+    assert [tile["cached"] for tile in changed] == [True, False, True]
+    assert not np.array_equal(_mosaic(options["output_dir"]), mosaic, equal_nan=True)
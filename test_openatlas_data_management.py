@@ -0,0 +1,52 @@
+# Tests for the async OpenAtlas client of openatlas_data_management.py, against the FakeOpenAtlas server of benchmarks.py
+#
+# Run with: python -m pytest -q
+
+import asyncio
+
+import pytest
+import requests
+
+from benchmarks import FakeOpenAtlas, LocalServer
+from openatlas_data_management import AsyncOpenAtlasClient
+
+class FlakyOpenAtlas(FakeOpenAtlas):
+    """
+    FakeOpenAtlas answering the first `failures` requests of every method with `status`.
+    """
+
+    def __init__(self, failures, status=503, **kwargs):
+        super().__init__(n_entities=10, **kwargs)
+        self.failures = failures
+        self.status = status
+        self.calls = {"GET": 0, "POST": 0}
+
+    def handle(self, method, path, query, body, headers):
+        self.calls[method] += 1
+        if self.calls[method] <= self.failures:
+            return self.status, {"detail": "Try again later."}, {"Retry-After": "0"}
+        return super().handle(method, path, query, body, headers)
+
+def _run(app, method, *args):
+    async def call():
+        async with AsyncOpenAtlasClient(server.url, app.api_key, max_concurrency=2, backoff_base=0.0) as client:
+            return await getattr(client, method)(*args)
+
+    with LocalServer(app) as server:
+        return asyncio.run(call())
+
+def test_get_is_retried_on_server_errors():
+    app = FlakyOpenAtlas(failures=2)
+    assert _run(app, "fetch_entity", 3)["label"] == "Site 3"
+    assert app.calls["GET"] == 3
+
+def test_post_is_not_retried_on_server_errors():
+    app = FlakyOpenAtlas(failures=1)
+    with pytest.raises(requests.HTTPError):
+        _run(app, "create_entity", {"label": "New site"})
+    assert app.calls["POST"] == 1 and len(app.entities) == 10
+
+def test_post_is_retried_when_throttled():
+    app = FlakyOpenAtlas(failures=2, status=429)
+    assert _run(app, "create_entity", {"label": "New site"})["label"] == "New site"
+    assert app.calls["POST"] == 3 and len(app.entities) == 11
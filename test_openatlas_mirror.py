@@ -0,0 +1,109 @@
+# Tests for the local OpenAtlas mirror of openatlas_mirror.py, against the FakeOpenAtlas server of benchmarks.py
+#
+# Run with: python -m pytest -q
+
+import math
+
+import pytest
+
+from benchmarks import FakeOpenAtlas, LocalServer
+from openatlas_mirror import OpenAtlasMirror, geometry_bounds
+
+@pytest.fixture
+def server():
+    app = FakeOpenAtlas(n_entities=500, seed=2)
+    with LocalServer(app) as local_server:
+        local_server.app = app
+        yield local_server
+
+@pytest.fixture
+def mirror(server, tmp_path):
+    with OpenAtlasMirror(str(tmp_path / "mirror.sqlite"), server.url, server.app.api_key) as local_mirror:
+        yield local_mirror
+
+def _add_entity(app, label, geometry):
+    status, entity, _ = app.handle("POST", "/entities/", {}, {"label": label, "system_class": "place",
+                                                             "geometry": geometry},
+                                   {"Authorization": f"Token {app.api_key}"})
+    assert status == 201
+    return entity["id"]
+
+def _box_hits(app, box, system_class=None):
+    """
+    Brute-force answer of `bbox` from the float64 bounds of every live entity.
+    """
+    min_x, min_y, max_x, max_y = box
+    hits = []
+    for entity in app.entities.values():
+        bounds = geometry_bounds(entity["geometry"])
+        if (not entity.get("deleted") and (system_class is None or entity["system_class"] == system_class)
+                and bounds[2] >= min_x and bounds[0] <= max_x and bounds[3] >= min_y and bounds[1] <= max_y):
+            hits.append(entity["id"])
+    return sorted(hits)
+
+# --- Sync ---
+
+def test_modified_watermark_fetches_changes_and_deletions(server, mirror):
+    app = server.app
+    assert mirror.sync(page_size=64) == 500
+    assert mirror.sync(page_size=64) == 1 # Only the entity at the (inclusive) watermark again
+
+    app.touch([3, 40, 41])
+    app.touch([7, 8], deleted=True)
+    assert mirror.sync(page_size=2) == 1 + 3 + 2
+    assert mirror.count() == 498
+    assert mirror.get(40)["label"] == "Site 40 (revised 1)"
+    assert mirror.get(7) is None and mirror.get(8) is None
+    assert all(entity["id"] not in (7, 8) for entity in mirror.bbox(-180.0, -90.0, 180.0, 90.0))
+
+def test_id_watermark_fetches_new_entities_only(server, mirror):
+    app = server.app
+    assert mirror.sync(watermark="id", page_size=100) == 500
+    app.touch([5])
+    new_id = _add_entity(app, "New enclosure", {"type": "Point", "coordinates": [-55.5, -10.5]})
+    assert mirror.sync(watermark="id", page_size=100) == 1
+    assert mirror.get(new_id)["label"] == "New enclosure"
+    assert mirror.get(5)["label"] == "Site 5"
+    assert [hit["id"] for hit in mirror.nearest(-55.5, -10.5)] == [new_id]
+
+def test_unknown_watermark_is_rejected(mirror):
+    with pytest.raises(ValueError):
+        mirror.sync(watermark="etag")
+
+# --- Queries ---
+
+@pytest.mark.parametrize("system_class", [None, "feature"])
+def test_bbox_matches_brute_force(server, mirror, system_class):
+    mirror.sync()
+    for box in [(-55.5, -10.5, -55.0, -10.0), (-56.0, -11.0, -54.0, -9.0), (-54.1, -9.3, -53.0, -8.0),
+                (-60.0, -20.0, -59.0, -19.0)]:
+        hits = [hit["id"] for hit in mirror.bbox(*box, system_class=system_class)]
+        assert hits == _box_hits(server.app, box, system_class)
+
+def test_bbox_uses_float64_geometry(server, mirror):
+    # 1e-7 degrees (~1 cm) outside the box: inside the float32 R*Tree bounds, but not a hit
+    outside = _add_entity(server.app, "Just outside", {"type": "Point", "coordinates": [-57.0000001, -12.5]})
+    inside = _add_entity(server.app, "On the edge", {"type": "Point", "coordinates": [-57.0, -12.5]})
+    mirror.sync()
+    hits = [hit["id"] for hit in mirror.bbox(-57.0, -13.0, -56.5, -12.0)]
+    assert inside in hits and outside not in hits
+
+@pytest.mark.parametrize("k", [1, 5, 40])
+def test_nearest_matches_brute_force(server, mirror, k):
+    mirror.sync()
+    for x, y in [(-55.0, -10.0), (-56.3, -9.2), (-50.0, -10.0)]:
+        expected = []
+        for entity in server.app.entities.values():
+            min_x, min_y, max_x, max_y = geometry_bounds(entity["geometry"])
+            distance = math.hypot(max(min_x - x, 0.0, x - max_x), max(min_y - y, 0.0, y - max_y))
+            expected.append((distance, entity["id"]))
+        expected.sort()
+        hits = mirror.nearest(x, y, k=k)
+        assert [hit["id"] for hit in hits] == [entity_id for _, entity_id in expected[:k]]
+        assert [hit["distance"] for hit in hits] == [distance for distance, _ in expected[:k]]
+
+def test_nearest_respects_max_distance(mirror):
+    mirror.sync()
+    hits = mirror.nearest(-55.0, -10.0, k=1000, max_distance=0.1)
+    assert hits and all(hit["distance"] <= 0.1 for hit in hits)
+    assert mirror.nearest(-40.0, -10.0, max_distance=1.0) == []